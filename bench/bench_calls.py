@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Measure the cost of the setproctitle functions calls.
+
+The benchmark uses pyperf (``pip install pyperf``). In order to evaluate a
+change, run it against two versions of the module and compare the results::
+
+    python bench/bench_calls.py -o before.json
+    # ...install the new version...
+    python bench/bench_calls.py -o after.json
+    python -m pyperf compare_to before.json after.json --table
+
+Setting the same title repeatedly measures the call overhead only, as the
+title is not written if unchanged. Alternating two titles measures the cost
+of actually writing them. Alternating a long and a short title also measures
+the cost of clearing the title area, which depends on the size of the
+command line and of the environment: ``bench_suite.py`` runs this benchmark
+in different environments.
+"""
+
+import pyperf
+
+SETUP = """\
+import setproctitle
+from setproctitle import setproctitle as spt, setthreadtitle as stt
+t1 = "worker: idle"
+t2 = "worker: busy"
+b1 = t1.encode()
+b2 = t2.encode()
+ba1 = bytearray(b1)
+ba2 = bytearray(b2)
+tl = "worker: " + "x" * 4000
+spt(t1)
+if hasattr(setproctitle, "Counter"):
+    counter = setproctitle.Counter("worker: processed {}", width=10)
+    counter.apply()
+if hasattr(setproctitle, "Title"):
+    title1 = setproctitle.Title(t1)
+    title2 = setproctitle.Title(t2)
+if hasattr(setproctitle, "compile_template"):
+    tmpl = setproctitle.compile_template(
+        "worker: {state} rps={rps} queue={queue}"
+    )
+    tmpl.set(state="idle", rps=10, queue=0)
+if hasattr(setproctitle, "title_scope"):
+    scope1 = setproctitle.title_scope(" rpc: get_user")
+    scope2 = setproctitle.title_scope(" db: query")
+
+
+def save_restore():
+    old1 = setproctitle.getproctitle()
+    spt(old1 + " rpc: get_user")
+    try:
+        old2 = setproctitle.getproctitle()
+        spt(old2 + " db: query")
+        spt(old2)
+    finally:
+        spt(old1)
+"""
+
+BENCHMARKS = [
+    ("setproctitle-same-str", "spt(t1)"),
+    ("setproctitle-same-kwarg", "spt(title=t1)"),
+    ("setproctitle-alternate-str", "spt(t1); spt(t2)"),
+    ("setproctitle-alternate-bytes", "spt(b1); spt(b2)"),
+    ("setproctitle-alternate-bytearray", "spt(ba1); spt(ba2)"),
+    ("setproctitle-alternate-long", "spt(tl); spt(t1)"),
+    ("title-apply-same", "title1.apply()"),
+    ("title-apply-alternate", "title1.apply(); title2.apply()"),
+    ("template-set-same", "tmpl.set(rps=10)"),
+    ("template-set-alternate", "tmpl.set(rps=10); tmpl.set(rps=11)"),
+    ("setthreadtitle-alternate-str", "stt(t1); stt(t2)"),
+    ("getproctitle", "setproctitle.getproctitle()"),
+    ("getthreadtitle", "setproctitle.getthreadtitle()"),
+    ("list_thread_titles", "setproctitle.list_thread_titles()"),
+    ("counter-increment", "counter.increment()"),
+    ("save-restore-nested", "save_restore()"),
+    ("title-scope-nested", "with scope1:\n    with scope2: pass"),
+]
+
+
+def supported(stmt: str) -> bool:
+    """Check if the module version tested supports a benchmark."""
+    ns: "dict[str, object]" = {}
+    try:
+        exec(SETUP, ns)
+        exec(stmt, ns)
+    except (AttributeError, NameError, TypeError):
+        return False
+    else:
+        return True
+
+
+def main() -> None:
+    runner = pyperf.Runner()
+    runner.metadata["description"] = "setproctitle functions calls"
+    for name, stmt in BENCHMARKS:
+        if not supported(stmt):
+            continue
+        runner.timeit(name, stmt=stmt, setup=SETUP)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Measure the cost of the module setup with large environments.
+
+The first call to a setproctitle function finds the argv memory area,
+copies the arguments and the environment out of the way and sets the
+initial title up. Every benchmark runs fresh interpreters, with a number of
+extra environment variables and command line arguments, and reports the
+time taken by the first getproctitle() call only, measured in the child::
+
+    python bench/bench_setup.py -o setup.json
+
+The environment of a process is limited by the system (about 2MB on
+Linux), so the largest cases may fail on some systems.
+"""
+
+import os
+import subprocess as sp
+import sys
+
+import pyperf
+
+# (name, environment variables, arguments)
+CASES = [
+    ("env-0", 0, 0),
+    ("env-1000", 1000, 0),
+    ("env-10000", 10000, 0),
+    ("env-30000", 30000, 0),
+    ("env-10000-args-1000", 10000, 1000),
+]
+
+CODE = """\
+import sys
+import time
+import setproctitle
+
+t0 = time.perf_counter()
+setproctitle.getproctitle()
+sys.stdout.write(repr(time.perf_counter() - t0))
+"""
+
+
+def bench_setup(loops: int, env: "dict[str, str]", args: "list[str]") -> float:
+    total = 0.0
+    for i in range(loops):
+        out = sp.check_output([sys.executable, "-c", CODE, *args], env=env)
+        total += float(out)
+    return total
+
+
+def main() -> None:
+    runner = pyperf.Runner()
+    # Every loop starts a process: don't let pyperf calibrate thousands
+    runner.argparser.set_defaults(loops=10)
+    runner.parse_args()
+
+    runner.metadata["description"] = "setproctitle setup in large envs"
+    for name, nvars, nargs in CASES:
+        env = dict(os.environ)
+        for i in range(nvars):
+            env[f"SPT_BENCH_VAR_{i}"] = f"value of the variable number {i}"
+        args = [f"argument-{i}" for i in range(nargs)]
+        runner.bench_time_func(name, bench_setup, env, args)
+
+
+if __name__ == "__main__":
+    main()
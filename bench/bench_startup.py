@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Measure the cost of importing setproctitle and of its first call.
+
+The first call to a setproctitle function finds the argv memory area and
+sets the initial title up. The benchmark runs fresh interpreters:
+
+- ``python-startup``: an empty interpreter, as reference;
+- ``import``: importing setproctitle;
+- ``import-getproctitle``: importing setproctitle and calling a function.
+
+The difference between the last two is the setup cost. With the option
+``--pyrun PATH``, the same commands are also run in the ``tests/pyrun.c``
+executable, embedding Python (built by the test suite, for instance as
+``tests/pyrun3.12``): the program is piped into it by a shell, so compare
+these results with the ``pyrun-startup`` entry only. Run with pyperf
+(``pip install pyperf``) and compare versions with::
+
+    python bench/bench_startup.py -o before.json
+    # ...install the new version...
+    python bench/bench_startup.py -o after.json
+    python -m pyperf compare_to before.json after.json --table
+
+If setproctitle is not installed but reachable via PYTHONPATH, use the
+``--inherit-environ PYTHONPATH`` pyperf option.
+"""
+
+import argparse
+import os
+import shlex
+import sys
+
+import pyperf
+
+COMMANDS = [
+    ("python-startup", "pass"),
+    ("import", "import setproctitle"),
+    (
+        "import-getproctitle",
+        "import setproctitle; setproctitle.getproctitle()",
+    ),
+]
+
+
+def add_cmdline_args(cmd: "list[str]", args: argparse.Namespace) -> None:
+    """Pass the script options to the pyperf worker processes."""
+    if args.pyrun:
+        cmd.extend(["--pyrun", args.pyrun])
+
+
+def main() -> None:
+    runner = pyperf.Runner(add_cmdline_args=add_cmdline_args)
+    runner.argparser.add_argument(
+        "--pyrun", help="run the commands in the pyrun executable too"
+    )
+    args = runner.parse_args()
+
+    runner.metadata["description"] = "setproctitle import and setup"
+    for name, code in COMMANDS:
+        runner.bench_command(name, [sys.executable, "-c", code])
+
+    if args.pyrun:
+        pyrun = shlex.quote(os.path.abspath(args.pyrun))
+        for name, code in COMMANDS:
+            runner.bench_command(
+                f"pyrun-{name.replace('python-', '')}",
+                ["sh", "-c", f"echo {shlex.quote(code)} | {pyrun}"],
+            )
+
+
+if __name__ == "__main__":
+    main()
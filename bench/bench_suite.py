@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Run all the benchmarks in different environments.
+
+The benchmarks in ``bench_calls.py`` and ``bench_startup.py`` are run in
+the following environments:
+
+- ``default``: the environment of the current process;
+- ``noenv``: with ``SPT_NOENV`` set, so only the command line is used as
+  title area;
+- ``large-env``: with 10000 extra environment variables, making the title
+  area, the module setup and the clearing of the title area larger.
+
+The results are saved as pyperf JSON files into the output directory, named
+``ENV-calls.json`` and ``ENV-startup.json``, so that they can be compared
+with the results of another version of the module::
+
+    python bench/bench_suite.py -o before
+    # ...install the new version...
+    python bench/bench_suite.py -o after
+    python -m pyperf compare_to before/default-calls.json \\
+        after/default-calls.json --table
+
+Use ``--pyrun PATH`` to benchmark the startup in the ``tests/pyrun.c``
+embedded executable too. Other options, such as ``--fast``, are passed to
+pyperf.
+"""
+
+import argparse
+import os
+import subprocess as sp
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+LARGE_ENV_SIZE = 10000
+
+
+def get_environments() -> "dict[str, dict[str, str]]":
+    """Return the environments to run the benchmarks into, by name."""
+    base = {k: v for k, v in os.environ.items() if k != "SPT_NOENV"}
+    large = dict(base)
+    for i in range(LARGE_ENV_SIZE):
+        large[f"SPT_BENCH_VAR_{i}"] = f"value of the variable number {i}"
+
+    return {
+        "default": base,
+        "noenv": dict(base, SPT_NOENV="1"),
+        "large-env": large,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-o", "--output", required=True, help="directory for the results"
+    )
+    parser.add_argument(
+        "--env",
+        action="append",
+        help="run only in these environments (can be repeated)",
+    )
+    parser.add_argument(
+        "--pyrun", help="run the startup commands in the pyrun executable"
+    )
+    args, pyperf_args = parser.parse_known_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for env_name, env in get_environments().items():
+        if args.env and env_name not in args.env:
+            continue
+        for bench in ("calls", "startup"):
+            cmdline = [sys.executable, os.path.join(HERE, f"bench_{bench}.py")]
+            if bench == "startup" and args.pyrun:
+                cmdline.extend(["--pyrun", args.pyrun])
+            cmdline.extend(["--copy-env", *pyperf_args])
+            out = os.path.join(args.output, f"{env_name}-{bench}.json")
+            cmdline.extend(["-o", out])
+            print(f"running {bench} benchmarks in {env_name} env", flush=True)
+            sp.check_call(cmdline, env=env)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Measure the cost of setting the process title from many threads at once.
+
+Every benchmark starts a number of threads, each one alternating two titles
+and reading the title back, and reports the time per title set. The results
+are meaningful on a free-threaded Python build, where the threads run
+concurrently: a thread finding the title being written by another thread
+leaves its title to it and doesn't wait, so the time per title should
+decrease with more threads, instead of increasing::
+
+    python3.13t bench/bench_threads.py -o threads.json
+
+Alternate titles longer than 64KB, written with the GIL released, with the
+``--large`` option (the environment of the process must be large enough to
+make room for them).
+"""
+
+import argparse
+import threading
+import time
+
+import pyperf
+
+import setproctitle
+
+THREADS = [1, 2, 4, 8, 16]
+
+# Calls per thread and loop
+CALLS = 100
+
+
+def work(titles: "tuple[str, str]", loops: int) -> None:
+    t1, t2 = titles
+    for i in range(loops * CALLS // 2):
+        setproctitle.setproctitle(t1)
+        setproctitle.getproctitle()
+        setproctitle.setproctitle(t2)
+        setproctitle.getproctitle()
+
+
+def bench_threads(loops: int, nthreads: int, size: int) -> float:
+    titles = [
+        (f"worker {i}: idle".ljust(size), f"worker {i}: busy".ljust(size))
+        for i in range(nthreads)
+    ]
+    threads = [threading.Thread(target=work, args=(t, loops)) for t in titles]
+
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0
+
+
+def add_cmdline_args(cmd: "list[str]", args: argparse.Namespace) -> None:
+    """Pass the script options to the pyperf worker processes."""
+    if args.large:
+        cmd.append("--large")
+
+
+def main() -> None:
+    runner = pyperf.Runner(add_cmdline_args=add_cmdline_args)
+    runner.argparser.add_argument(
+        "--large", action="store_true", help="set titles longer than 64KB"
+    )
+    args = runner.parse_args()
+    size = 70000 if args.large else 0
+
+    runner.metadata["description"] = "setproctitle from many threads"
+    for nthreads in THREADS:
+        # Report the time per title set
+        runner.bench_time_func(
+            f"threads-{nthreads}",
+            bench_threads,
+            nthreads,
+            size,
+            inner_loops=nthreads * CALLS,
+        )
+
+
+if __name__ == "__main__":
+    main()
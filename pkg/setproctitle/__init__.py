@@ -2,53 +2,475 @@
 
 import os
 import sys
-import logging
 
-logger = logging.getLogger("setproctitle")
+# Don't slow down the import by loading typing.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from logging import Logger
+    from typing import Any, Callable, TypeVar
+
+    _F = TypeVar("_F", bound=Callable[..., Any])
+
+    logger: Logger
 
 __version__ = "1.3.7"
 
 __all__ = [
     "setproctitle",
     "getproctitle",
+    "set_title_prefix",
+    "set_activity",
+    "get_activity",
+    "push_title",
+    "pop_title",
+    "title_scope",
+    "enable_coalescing",
+    "disable_coalescing",
+    "flush",
+    "stats",
+    "reset_stats",
+    "setup_info",
+    "set_backend",
+    "get_backend",
     "setthreadtitle",
+    "setthreadtitles",
     "getthreadtitle",
+    "list_thread_titles",
+    "Counter",
+    "Title",
+    "Template",
+    "compile_template",
+    "enable_board",
+    "disable_board",
+    "StatusBoard",
+    "read_titles",
+    "enable_worker_titles",
+    "disable_worker_titles",
 ]
 
 
-def setproctitle(title: str) -> None:
-    logger.debug("setproctitle C module not available")
+if not TYPE_CHECKING:
+    # Hidden to type checkers, which would resolve the submodules through it.
+
+    def __getattr__(name: str) -> "Logger":
+        # Create the logger on access: importing logging would slow down the
+        # import, and it is only used if the C module is not available.
+        if name == "logger":
+            import logging
+
+            return logging.getLogger("setproctitle")
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _debug(msg: str, *args: object) -> None:
+    import logging
+
+    logging.getLogger("setproctitle").debug(msg, *args)
+
+
+def setproctitle(title: "str | bytes") -> None:
+    _debug("setproctitle C module not available")
     return None
 
 
 def getproctitle() -> str:
-    logger.debug("setproctitle C module not available")
+    _debug("setproctitle C module not available")
     return " ".join(sys.argv)
 
 
-def setthreadtitle(title: str) -> None:
-    logger.debug("setproctitle C module not available")
+def set_title_prefix(prefix: "str | bytes") -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+def set_activity(activity: "str | bytes") -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+def get_activity() -> str:
+    _debug("setproctitle C module not available")
+    return getproctitle()
+
+
+def push_title(suffix: "str | bytes") -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+def pop_title() -> None:
+    _debug("setproctitle C module not available")
     return None
 
 
+class title_scope:
+    """
+    Append a suffix to the process title for the duration of a block.
+
+    Can be used as a context manager or as a function decorator. The title
+    is restored by `pop_title()` on exit, without saving it in Python.
+    """
+
+    def __init__(self, suffix: "str | bytes"):
+        self.suffix = suffix
+
+    def __enter__(self) -> None:
+        push_title(self.suffix)
+
+    def __exit__(self, *args: object) -> None:
+        pop_title()
+
+    def __call__(self, func: "_F") -> "_F":
+        import functools
+
+        @functools.wraps(func)
+        def scoped(*args: "Any", **kwargs: "Any") -> "Any":
+            push_title(self.suffix)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                pop_title()
+
+        return scoped  # type: ignore[return-value]
+
+
+def enable_coalescing(max_rate: float = 10.0) -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+def disable_coalescing() -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+def flush() -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+def stats() -> "dict[str, int]":
+    _debug("setproctitle C module not available")
+    return {}
+
+
+def reset_stats() -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+def setup_info() -> "dict[str, int]":
+    _debug("setproctitle C module not available")
+    return {}
+
+
+def set_backend(backend: str) -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+def get_backend() -> str:
+    _debug("setproctitle C module not available")
+    return "memory"
+
+
+def setthreadtitle(
+    title: "str | bytes", native_id: "int | None" = None
+) -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+def setthreadtitles(titles: "dict[int, str | bytes]") -> int:
+    _debug("setproctitle C module not available")
+    return 0
+
+
 def getthreadtitle() -> str:
-    logger.debug("setproctitle C module not available")
+    _debug("setproctitle C module not available")
     return ""
 
 
-try:
-    from . import _setproctitle  # type: ignore
-except ImportError as e:
+def list_thread_titles() -> "dict[int, str]":
+    _debug("setproctitle C module not available")
+    return {}
+
+
+class Counter:
+    """A number shown in the process title, updated in place."""
+
+    def __init__(
+        self, template: "str | bytes", value: int = 0, width: int = 0
+    ):
+        _debug("setproctitle C module not available")
+        self._value = value
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    @property
+    def shown(self) -> bool:
+        return False
+
+    def apply(self) -> None:
+        pass
+
+    def increment(self, n: int = 1) -> None:
+        self._value += n
+
+    def set_value(self, value: int) -> None:
+        self._value = value
+
+
+class Title:
+    """A process title prepared to be set many times."""
+
+    def __init__(self, text: "str | bytes"):
+        _debug("setproctitle C module not available")
+        if not isinstance(text, str):
+            text = bytes(text).decode("utf-8", "replace")
+        self._text = text
+
+    @property
+    def truncated(self) -> bool:
+        return False
+
+    @property
+    def capacity(self) -> int:
+        return 0
+
+    def apply(self) -> None:
+        pass
+
+    def __str__(self) -> str:
+        return self._text
+
+
+class Template:
+    """A title with named fields, parsed once."""
+
+    def __init__(self, template: "str | bytes"):
+        _debug("setproctitle C module not available")
+        from string import Formatter
+
+        if not isinstance(template, str):
+            template = bytes(template).decode("utf-8", "replace")
+        self._template = template
+        self._values: "dict[str, object]" = {}
+        for _, name, _, _ in Formatter().parse(template):
+            if name is not None:
+                self._values.setdefault(name, "")
+
+    @property
+    def fields(self) -> "tuple[str, ...]":
+        return tuple(self._values)
+
+    def set(self, **fields: object) -> None:
+        self._values.update(fields)
+
+    def __str__(self) -> str:
+        return self._template.format_map(self._values)
+
+
+def compile_template(template: "str | bytes") -> Template:
+    return Template(template)
+
+
+def enable_board(
+    path: "str | os.PathLike[str]", nslots: int = 256, title_size: int = 128
+) -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+def disable_board() -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+def read_titles(
+    pids: "list[int] | None" = None,
+) -> "list[tuple[int, str | None, str | None]]":
+    _debug("setproctitle C module not available")
+    return []
+
+
+def enable_worker_titles(
+    template: "str | bytes" = "{parent_title} worker {n}", start: int = 1
+) -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+def disable_worker_titles() -> None:
+    _debug("setproctitle C module not available")
+    return None
+
+
+class StatusBoard:
+    """Read the titles published in a status board."""
+
+    def __init__(self, path: "str | os.PathLike[str]"):
+        _debug("setproctitle C module not available")
+
+    @property
+    def nslots(self) -> int:
+        return 0
+
+    def snapshot(self) -> "list[tuple[int, str, float, int]]":
+        return []
+
+    def wait(self, timeout: "float | None" = None) -> bool:
+        # Don't let a monitoring loop spin.
+        if timeout is not None:
+            import time
+
+            time.sleep(timeout)
+        return False
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "StatusBoard":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+
+# On PyPy the C extension is called through cpyext, which is slow: prefer
+# the ffi backend, unless SPT_FFI says otherwise.
+_ffi_env = os.environ.get("SPT_FFI", "")
+if _ffi_env:
+    _prefer_ffi = _ffi_env != "0"
+else:
+    _prefer_ffi = "__pypy__" in sys.builtin_module_names
+
+_errors = []
+_use_c = _use_ffi = False
+
+if _prefer_ffi:
+    try:
+        from . import _ffi
+    except ImportError as e:
+        _errors.append(f"failed to import setproctitle ffi backend: {e}")
+    else:
+        _use_ffi = True
+
+if not _use_ffi:
+    try:
+        from . import _setproctitle  # type: ignore
+    except ImportError as e:
+        _errors.append(f"failed to import setproctitle: {e}")
+        if not (_prefer_ffi or _ffi_env == "0"):
+            try:
+                from . import _ffi  # noqa: F811
+            except ImportError as e:
+                _errors.append(
+                    f"failed to import setproctitle ffi backend: {e}"
+                )
+            else:
+                _use_ffi = True
+    else:
+        _use_c = True
+
+# The ffi backend only implements the title functions: take the others from
+# the C extension, if available.
+_ffi_fallback = None
+if _use_ffi and _prefer_ffi:
+    try:
+        from . import _setproctitle as _ffi_fallback  # type: ignore
+    except ImportError as e:
+        _errors.append(f"failed to import setproctitle: {e}")
+
+if not _use_c:
     # Emulate SPT_DEBUG showing process info in the C module.
     if os.environ.get("SPT_DEBUG", ""):
+        import logging
+
         logging.basicConfig()
-        logger.setLevel(logging.DEBUG)
-    logger.debug("failed to import setproctitle: %s", e)
-else:
+        logging.getLogger("setproctitle").setLevel(logging.DEBUG)
+    for _msg in _errors:
+        _debug("%s", _msg)
+
+if _use_c:
     setproctitle = _setproctitle.setproctitle  # noqa: F811
     getproctitle = _setproctitle.getproctitle  # noqa: F811
+    set_title_prefix = _setproctitle.set_title_prefix  # noqa: F811
+    set_activity = _setproctitle.set_activity  # noqa: F811
+    get_activity = _setproctitle.get_activity  # noqa: F811
+    push_title = _setproctitle.push_title  # noqa: F811
+    pop_title = _setproctitle.pop_title  # noqa: F811
+    enable_coalescing = _setproctitle.enable_coalescing  # noqa: F811
+    disable_coalescing = _setproctitle.disable_coalescing  # noqa: F811
+    flush = _setproctitle.flush  # noqa: F811
+    stats = _setproctitle.stats  # noqa: F811
+    reset_stats = _setproctitle.reset_stats  # noqa: F811
+    setup_info = _setproctitle.setup_info  # noqa: F811
+    set_backend = _setproctitle.set_backend  # noqa: F811
+    get_backend = _setproctitle.get_backend  # noqa: F811
     setthreadtitle = _setproctitle.setthreadtitle  # noqa: F811
+    setthreadtitles = _setproctitle.setthreadtitles  # noqa: F811
     getthreadtitle = _setproctitle.getthreadtitle  # noqa: F811
+    list_thread_titles = _setproctitle.list_thread_titles  # noqa: F811
+    Counter = _setproctitle.Counter  # type: ignore # noqa: F811
+    Title = _setproctitle.Title  # type: ignore # noqa: F811
+    Template = _setproctitle.Template  # type: ignore # noqa: F811
+    compile_template = _setproctitle.compile_template  # noqa: F811
+    enable_board = _setproctitle.enable_board  # noqa: F811
+    disable_board = _setproctitle.disable_board  # noqa: F811
+    StatusBoard = _setproctitle.StatusBoard  # type: ignore # noqa: F811
+    read_titles = _setproctitle.read_titles  # noqa: F811
+    enable_worker_titles = _setproctitle.enable_worker_titles  # noqa: F811
+    disable_worker_titles = _setproctitle.disable_worker_titles  # noqa: F811
+elif _use_ffi:
+    setproctitle = _ffi.setproctitle  # noqa: F811
+    getproctitle = _ffi.getproctitle  # noqa: F811
+    set_title_prefix = _ffi.set_title_prefix  # noqa: F811
+    set_activity = _ffi.set_activity  # noqa: F811
+    get_activity = _ffi.get_activity  # noqa: F811
+    push_title = _ffi.push_title  # noqa: F811
+    pop_title = _ffi.pop_title  # noqa: F811
+    setup_info = _ffi.setup_info  # noqa: F811
+    set_backend = _ffi.set_backend  # noqa: F811
+    get_backend = _ffi.get_backend  # noqa: F811
+    setthreadtitle = _ffi.setthreadtitle  # noqa: F811
+    setthreadtitles = _ffi.setthreadtitles  # noqa: F811
+    getthreadtitle = _ffi.getthreadtitle  # noqa: F811
+    list_thread_titles = _ffi.list_thread_titles  # noqa: F811
+    Title = _ffi.Title  # type: ignore # noqa: F811
+    Template = _ffi.Template  # type: ignore # noqa: F811
+    compile_template = _ffi.compile_template  # type: ignore # noqa: F811
+
+    def _ffi_missing(name: str) -> "Callable[..., Any]":
+        def missing(*args: object, **kwargs: object) -> "Any":
+            raise NotImplementedError(
+                f"setproctitle.{name} is not available with the ffi backend"
+                " and without the C extension"
+            )
+
+        missing.__name__ = missing.__qualname__ = name
+        return missing
+
+    for _name in (
+        "enable_coalescing",
+        "disable_coalescing",
+        "flush",
+        "stats",
+        "reset_stats",
+        "Counter",
+        "enable_board",
+        "disable_board",
+        "StatusBoard",
+        "read_titles",
+        "enable_worker_titles",
+        "disable_worker_titles",
+    ):
+        if _ffi_fallback is not None:
+            globals()[_name] = getattr(_ffi_fallback, _name)
+        else:
+            globals()[_name] = _ffi_missing(_name)
 
 
 # Call getproctitle to initialize structures and avoid problems caused
@@ -0,0 +1,476 @@
+"""Set the process title calling the C library through cffi or ctypes.
+
+On PyPy the C extension is called through the cpyext emulation layer, which
+makes every call much slower than on CPython, whereas the JIT can call C
+functions through cffi cheaply. This module implements the title functions
+in Python, using cffi if available, otherwise ctypes. It is also used if
+the C extension is not available.
+
+Only Linux is supported: the address of the command line is found in
+``/proc/self/stat`` and the title is written there, padded with null bytes.
+The environment is never moved, as if ``SPT_NOENV`` was set, so the title
+is limited to the length of the command line. The process name, shown by
+``top``, is set by ``prctl(PR_SET_NAME)``. Either can be skipped choosing a
+backend, by ``set_backend()`` or ``SPT_BACKEND``.
+"""
+
+import errno
+import os
+import sys
+import threading
+
+# Don't slow down the import by loading typing.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Mapping
+
+if not sys.platform.startswith("linux"):
+    raise ImportError("the ffi backend is only available on Linux")
+
+PR_SET_NAME = 15
+PR_GET_NAME = 16
+
+# The size of a thread name, with the terminator
+NAME_SIZE = 16
+
+# Where the title is shown, by backend name
+CMDLINE = 1
+COMM = 2
+BACKENDS = {"memory": 0, "cmdline": CMDLINE, "comm": COMM, "both": 3}
+
+try:
+    import cffi  # type: ignore
+except ImportError:
+    import ctypes
+
+    _libc = ctypes.CDLL(None, use_errno=True)
+
+    def _write(addr: int, data: bytes) -> None:
+        ctypes.memmove(addr, data, len(data))
+
+    def _read(addr: int, size: int) -> bytes:
+        return ctypes.string_at(addr, size)
+
+    def _set_name(name: bytes) -> None:
+        _libc.prctl(PR_SET_NAME, name)
+
+    def _get_name() -> bytes:
+        buf = ctypes.create_string_buffer(NAME_SIZE)
+        _libc.prctl(PR_GET_NAME, buf)
+        return buf.value
+
+else:
+    _ffi = cffi.FFI()
+    _ffi.cdef("int prctl(int option, ...);")
+    _libc = _ffi.dlopen(None)
+
+    def _write(addr: int, data: bytes) -> None:
+        _ffi.memmove(_ffi.cast("char *", addr), data, len(data))
+
+    def _read(addr: int, size: int) -> bytes:
+        return _ffi.buffer(_ffi.cast("char *", addr), size)[:]  # type: ignore
+
+    def _set_name(name: bytes) -> None:
+        _libc.prctl(PR_SET_NAME, _ffi.new("char[]", name))
+
+    def _get_name() -> bytes:
+        buf = _ffi.new("char[]", NAME_SIZE)
+        _libc.prctl(PR_GET_NAME, buf)
+        return _ffi.string(buf)  # type: ignore
+
+
+def _find_args() -> "tuple[int, int]":
+    """Return the address and the size of the command line."""
+    try:
+        with open("/proc/self/stat", "rb") as f:
+            stat = f.read()
+    except OSError as e:
+        raise ImportError(f"can't read the process status: {e}") from e
+
+    # The process name may contain spaces and parens: skip it. arg_start and
+    # arg_end are the 48th and 49th fields, available from Linux 3.5.
+    pos = stat.rfind(b")") + 2
+    fields = stat[pos:].split()
+    if pos < 2 or len(fields) < 47:
+        raise ImportError("command line address not available")
+    if not (fields[45].isdigit() and fields[46].isdigit()):
+        raise ImportError("command line address not available")
+    start, end = int(fields[45]), int(fields[46])
+    if not start or end <= start:
+        raise ImportError("command line address not available")
+    return start, end - start
+
+
+_area, _size = _find_args()
+_args = _read(_area, _size)
+if not _args.endswith(b"\0"):
+    raise ImportError("the command line was already changed")
+
+_argc = _args.count(b"\0")
+
+# The title shown, before any change the arguments joined.
+_title = _args.rstrip(b"\0").replace(b"\0", b" ")
+_prefix_len = 0
+
+# The bytes to clear at the next write, to leave no trace of a longer title.
+_dirty = _size
+
+_backend = BACKENDS.get(os.environ.get("SPT_BACKEND", ""), CMDLINE | COMM)
+
+# The titles saved by push_title(), valid only if the title didn't change
+# in other ways, as in the C extension: the title lengths and the threads
+# which pushed them, as only the same thread can pop them.
+_generation = 0
+_scopes: "list[tuple[int, int]]" = []
+_scope_valid_from = 0
+_scope_generation = 0
+
+_lock = threading.Lock()
+
+
+def _to_bytes(obj: object, argname: str) -> bytes:
+    if isinstance(obj, str):
+        data = obj.encode("utf-8")
+    elif isinstance(obj, bytes):
+        data = obj
+    else:
+        try:
+            data = bytes(memoryview(obj))  # type: ignore[arg-type]
+        except TypeError:
+            raise TypeError(
+                f"{argname} must be str or a bytes-like object, "
+                f"not {type(obj).__name__}"
+            ) from None
+
+    if b"\0" in data:
+        raise ValueError(f"{argname} cannot contain null characters")
+    return data
+
+
+def _set_process_name(name: bytes) -> None:
+    if threading.current_thread() is threading.main_thread():
+        _set_name(name)
+        return
+
+    # prctl() would rename the calling thread: rename the main one
+    try:
+        with open("/proc/self/comm", "wb") as f:
+            f.write(name)
+    except OSError:
+        _set_name(name)
+
+
+def _write_cmdline(title: bytes) -> None:
+    global _dirty
+
+    end = max(_dirty, len(title) + 1)
+    _write(_area, title + bytes(end - len(title)))
+    _dirty = len(title) + 1
+
+
+def _write_title(title: bytes, set_name: bool) -> None:
+    """Write title in the command line area. Call it holding _lock."""
+    global _title, _generation
+
+    title = title[: _size - 1]
+    if title == _title:
+        return
+
+    if _backend & CMDLINE:
+        _write_cmdline(title)
+    _title = title
+    _generation += 1
+
+    if set_name and _backend & COMM:
+        _set_process_name(title[: NAME_SIZE - 1])
+
+
+def _check_scope() -> None:
+    global _scope_valid_from
+
+    if _generation != _scope_generation:
+        _scope_valid_from = len(_scopes)
+
+
+def setproctitle(title: "str | bytes") -> None:
+    """Change the process title."""
+    global _prefix_len
+
+    data = _to_bytes(title, "title")
+    with _lock:
+        _prefix_len = 0
+        _write_title(data, True)
+
+
+def getproctitle() -> str:
+    """Get the current process title."""
+    return _title.decode("utf-8", "replace")
+
+
+def set_title_prefix(prefix: "str | bytes") -> None:
+    """Set a constant prefix for the process title."""
+    global _prefix_len
+
+    data = _to_bytes(prefix, "prefix")[: _size - 1]
+    with _lock:
+        _prefix_len = len(data)
+        _write_title(data, True)
+
+
+def set_activity(activity: "str | bytes") -> None:
+    """Change the process title after the prefix."""
+    data = _to_bytes(activity, "activity")
+    with _lock:
+        _write_title(_title[:_prefix_len] + data, True)
+
+
+def get_activity() -> str:
+    """Get the process title after the prefix."""
+    with _lock:
+        activity = _title[_prefix_len:]
+    return activity.decode("utf-8", "replace")
+
+
+def push_title(suffix: "str | bytes") -> None:
+    """Append suffix to the process title, saving the previous one."""
+    global _scope_generation
+
+    data = _to_bytes(suffix, "suffix")
+    with _lock:
+        _check_scope()
+        end = len(_title)
+        _scopes.append((end, threading.get_ident()))
+        # The process name only has the first 15 chars of the title
+        _write_title(_title + data, end < NAME_SIZE - 1)
+        _scope_generation = _generation
+
+
+def pop_title() -> None:
+    """Restore the title saved by the last push_title()."""
+    global _scope_valid_from, _scope_generation
+
+    owner = threading.get_ident()
+    with _lock:
+        # Other threads may have pushed a suffix after the last of ours
+        for i in range(len(_scopes) - 1, -1, -1):
+            if _scopes[i][1] == owner:
+                break
+        else:
+            raise RuntimeError("no title pushed")
+
+        _check_scope()
+        end = _scopes.pop(i)[0]
+        if i < _scope_valid_from:
+            _scope_valid_from -= 1
+            return
+
+        # Cut our suffix, moving back the ones following it
+        cut = (_scopes[i][0] if i < len(_scopes) else len(_title)) - end
+        for j in range(i, len(_scopes)):
+            _scopes[j] = (_scopes[j][0] - cut, _scopes[j][1])
+        rest = end + cut
+        _write_title(_title[:end] + _title[rest:], end < NAME_SIZE - 1)
+        _scope_generation = _generation
+
+
+class Title:
+    """A process title prepared to be set many times."""
+
+    __slots__ = ("_title", "_capacity", "_truncated")
+
+    def __init__(self, text: "str | bytes"):
+        data = _to_bytes(text, "text")
+        self._capacity = _size - 1
+        self._truncated = len(data) > self._capacity
+        self._title = data[: self._capacity]
+
+    @property
+    def truncated(self) -> bool:
+        return self._truncated
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def apply(self) -> None:
+        global _prefix_len
+
+        with _lock:
+            _prefix_len = 0
+            _write_title(self._title, True)
+
+    def __str__(self) -> str:
+        return self._title.decode("utf-8", "replace")
+
+
+class Template:
+    """A title with named fields, parsed once."""
+
+    __slots__ = ("_parts", "_values")
+
+    def __init__(self, template: "str | bytes"):
+        data = _to_bytes(template, "template")
+
+        # The literal parts of the template as bytes, the fields as str.
+        self._parts: "list[bytes | str]" = []
+        self._values: "dict[str, bytes]" = {}
+        literal = bytearray()
+        i = 0
+        while i < len(data):
+            c = data[i]
+            if c in b"{}" and i + 1 < len(data) and data[i + 1] == c:
+                # Escaped brace
+                i += 1
+            elif c == ord("{"):
+                start = i + 1
+                i = data.find(b"}", start)
+                if i < 0:
+                    raise ValueError("single '{' encountered in template")
+                name = data[start:i].decode()
+                if not name or any(ch in name for ch in ":!{"):
+                    raise ValueError(
+                        f"invalid field in template: '{{{name}}}'"
+                    )
+                if literal:
+                    self._parts.append(bytes(literal))
+                    literal.clear()
+                self._parts.append(name)
+                self._values.setdefault(name, b"")
+                i += 1
+                continue
+            elif c == ord("}"):
+                raise ValueError("single '}' encountered in template")
+
+            literal.append(c)
+            i += 1
+
+        if literal:
+            self._parts.append(bytes(literal))
+
+    @property
+    def fields(self) -> "tuple[str, ...]":
+        return tuple(self._values)
+
+    def set(self, **fields: object) -> None:
+        for name, value in fields.items():
+            if name not in self._values:
+                raise TypeError(f"set() got an unexpected field '{name}'")
+            if not isinstance(value, (str, bytes, bytearray, memoryview)):
+                value = str(value)
+            self._values[name] = _to_bytes(value, name)
+
+        title = self._render()
+        with _lock:
+            _write_title(_title[:_prefix_len] + title, True)
+
+    def _render(self) -> bytes:
+        values = self._values
+        return b"".join(
+            p if isinstance(p, bytes) else values[p] for p in self._parts
+        )
+
+    def __str__(self) -> str:
+        return self._render().decode("utf-8", "replace")
+
+
+def compile_template(template: "str | bytes") -> Template:
+    """Parse a title template with named fields."""
+    return Template(template)
+
+
+def set_backend(backend: str) -> None:
+    """Choose where the process title is shown."""
+    global _backend
+
+    if backend not in BACKENDS:
+        raise ValueError(
+            "backend must be 'both', 'cmdline', 'comm' or 'memory',"
+            f" not '{backend}'"
+        )
+    with _lock:
+        added = BACKENDS[backend] & ~_backend
+        _backend = BACKENDS[backend]
+        # Show the current title in the views added
+        if added & CMDLINE:
+            _write_cmdline(_title)
+        if added & COMM:
+            _set_process_name(_title[: NAME_SIZE - 1])
+
+
+def get_backend() -> str:
+    """Return where the process title is shown."""
+    for name, value in BACKENDS.items():
+        if value == _backend:
+            return name
+    raise AssertionError("unknown backend")
+
+
+def setup_info() -> "dict[str, int]":
+    """Return a dict of information about the title area."""
+    return {
+        "buffer_size": _size,
+        "argc": _argc,
+        "arena_size": 0,
+        "environ_moved": 0,
+    }
+
+
+def _set_thread_name(tid: int, name: bytes) -> None:
+    try:
+        f = open(f"/proc/self/task/{tid:d}/comm", "wb")
+    except FileNotFoundError:
+        # Not a thread of the process, or gone
+        raise ProcessLookupError(
+            errno.ESRCH, os.strerror(errno.ESRCH)
+        ) from None
+    with f:
+        f.write(name)
+
+
+def setthreadtitle(
+    title: "str | bytes", native_id: "int | None" = None
+) -> None:
+    """Change the title of the current thread, or of the native_id one."""
+    if native_id is not None and native_id < 0:
+        raise ValueError("native_id must be a non-negative integer")
+    data = _to_bytes(title, "title")[: NAME_SIZE - 1]
+    if native_id is None:
+        _set_name(data)
+    else:
+        _set_thread_name(native_id, data)
+
+
+def setthreadtitles(titles: "Mapping[int, str | bytes]") -> int:
+    """Change the titles of many threads at once."""
+    names = [
+        (tid, _to_bytes(title, "title")[: NAME_SIZE - 1])
+        for tid, title in titles.items()
+    ]
+    if any(tid < 0 for tid, _ in names):
+        raise ValueError("native ids must be non-negative integers")
+    nset = 0
+    for tid, name in names:
+        try:
+            _set_thread_name(tid, name)
+        except ProcessLookupError:
+            continue
+        nset += 1
+    return nset
+
+
+def getthreadtitle() -> str:
+    """Return the title of the current thread."""
+    return _get_name().decode("utf-8", "replace")
+
+
+def list_thread_titles() -> "dict[int, str]":
+    """Return the titles of all the process threads."""
+    rv = {}
+    for tid in os.listdir("/proc/self/task"):
+        try:
+            with open(f"/proc/self/task/{tid}/comm", "rb") as f:
+                name = f.read()
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+        rv[int(tid)] = name.rstrip(b"\n").decode("utf-8", "replace")
+    return rv
@@ -0,0 +1,136 @@
+"""Show the state of an asyncio event loop in the process title.
+
+The title is rendered from a template, where the following fields can be
+used:
+
+- ``{tasks}``: the number of tasks running;
+- ``{oldest}``: the name of the task running for the longest time, or an
+  empty string if no task is running.
+
+The title is updated at most once per loop iteration, and only if it
+changed, no matter how many tasks are started or completed::
+
+    import asyncio
+    from setproctitle import aio
+
+    async def main():
+        aio.install(template="{tasks} requests, oldest: {oldest}")
+        ...
+
+    asyncio.run(main())
+
+The title is set as the process activity, after the prefix set by
+``set_title_prefix()``, if any.
+"""
+
+import asyncio
+from typing import Any, Coroutine, Dict, Optional
+
+from . import set_activity
+
+__all__ = ["install", "LoopTitle"]
+
+DEFAULT_TEMPLATE = "{tasks} tasks"
+
+
+class LoopTitle:
+    """
+    Keep the process title in sync with the tasks of an event loop.
+
+    Use `install()` to create one.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, template: str):
+        self.loop = loop
+        self.template = template
+        self._tasks: "Dict[asyncio.Future[Any], None]" = {}
+        self._scheduled = False
+        self._title: Optional[str] = None
+        self._installed = False
+        self._prev_factory = loop.get_task_factory()
+
+    @property
+    def tasks(self) -> int:
+        """The number of tasks running."""
+        return len(self._tasks)
+
+    @property
+    def oldest(self) -> str:
+        """The name of the task running for the longest time."""
+        # Tasks are removed on completion, so the first is the oldest.
+        for task in self._tasks:
+            get_name = getattr(task, "get_name", None)
+            return get_name() if get_name else repr(task)
+        return ""
+
+    def _install(self) -> None:
+        self.loop.set_task_factory(self._task_factory)  # type: ignore
+        self._installed = True
+        self._schedule()
+
+    def uninstall(self) -> None:
+        """
+        Stop updating the title.
+
+        Restore the task factory in place before `install()` was called.
+        """
+        if self._installed:
+            self.loop.set_task_factory(self._prev_factory)
+            self._installed = False
+
+    def _task_factory(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        coro: "Coroutine[Any, Any, Any]",
+        **kwargs: Any,
+    ) -> "asyncio.Future[Any]":
+        task: "asyncio.Future[Any]"
+        if self._prev_factory is not None:
+            task = self._prev_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+
+        if self._installed:
+            self._tasks[task] = None
+            task.add_done_callback(self._task_done)
+            self._schedule()
+        return task
+
+    def _task_done(self, task: "asyncio.Future[Any]") -> None:
+        self._tasks.pop(task, None)
+        if self._installed:
+            self._schedule()
+
+    def _schedule(self) -> None:
+        # Update the title in the next loop iteration, once, no matter how
+        # many changes happen in this one.
+        if not self._scheduled:
+            self._scheduled = True
+            self.loop.call_soon(self._update)
+
+    def _update(self) -> None:
+        self._scheduled = False
+        if not self._installed:
+            return
+        title = self.template.format(tasks=self.tasks, oldest=self.oldest)
+        if title != self._title:
+            self._title = title
+            set_activity(title)
+
+
+def install(
+    loop: Optional[asyncio.AbstractEventLoop] = None,
+    template: str = DEFAULT_TEMPLATE,
+) -> LoopTitle:
+    """
+    Start showing the state of *loop* in the process title.
+
+    If *loop* is not specified, use the running event loop. Only the tasks
+    created after the call are accounted for. Return a `LoopTitle` object:
+    call its `~LoopTitle.uninstall()` method to stop updating the title.
+    """
+    if loop is None:
+        loop = asyncio.get_running_loop()
+    rv = LoopTitle(loop, template)
+    rv._install()
+    return rv
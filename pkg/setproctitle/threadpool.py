@@ -0,0 +1,72 @@
+"""Show the task run by each thread of a thread pool.
+
+The functions in this module plug into a ``ThreadPoolExecutor`` to set the
+title of the worker threads, so that tools such as ``htop`` can show what
+each thread is doing::
+
+    from concurrent.futures import ThreadPoolExecutor
+    from setproctitle import threadpool
+
+    executor = ThreadPoolExecutor(
+        thread_name_prefix="db", initializer=threadpool.initializer()
+    )
+    executor.submit(threadpool.task(fetch_user), user_id)
+
+Setting the title of a thread to its current title doesn't perform any
+system call, so a pool running the same kind of task over and over doesn't
+pay for the title update.
+"""
+
+import functools
+import threading
+from typing import Any, Callable, Optional, Tuple, TypeVar
+
+from . import setthreadtitle
+
+__all__ = ["initializer", "task"]
+
+T = TypeVar("T")
+
+
+def initializer(
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: Tuple[Any, ...] = (),
+) -> Callable[[], None]:
+    """
+    Return an initializer setting the thread title to the thread name.
+
+    The ``ThreadPoolExecutor`` thread names are obtained from its
+    *thread_name_prefix* parameter: use a short one, as thread titles are
+    usually truncated to 15 bytes.
+
+    If *initializer* is specified, it is called afterwards with *initargs*
+    as arguments.
+    """
+
+    def init() -> None:
+        setthreadtitle(threading.current_thread().name)
+        if initializer is not None:
+            initializer(*initargs)
+
+    return init
+
+
+def task(
+    fn: Callable[..., T], title: Optional[str] = None
+) -> Callable[..., T]:
+    """
+    Wrap *fn* to set the thread title to *title* before calling it.
+
+    If *title* is not specified, use the name of the function.
+
+    The title is not restored after the task is completed: a thread keeps
+    showing the last task it has run.
+    """
+    name = title if title is not None else getattr(fn, "__name__", repr(fn))
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        setthreadtitle(name)
+        return fn(*args, **kwargs)
+
+    return wrapper
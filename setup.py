@@ -46,10 +46,18 @@ mod_spt = Extension(
     define_macros=list(define_macros.items()),
     sources=[
         "src/setproctitle.c",
+        "src/spt_args.c",
+        "src/spt_board.c",
+        "src/spt_counter.c",
         "src/spt_debug.c",
+        "src/spt_proc.c",
         "src/spt_setup.c",
         "src/spt_status.c",
         "src/spt_strlcpy.c",
+        "src/spt_template.c",
+        "src/spt_title.c",
+        "src/spt_workers.c",
+        "src/spt_writer.c",
     ]
     + platform_sources,
 )
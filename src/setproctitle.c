@@ -12,8 +12,19 @@
  */
 
 #include "spt.h"
+#include "spt_args.h"
+#include "spt_board.h"
+#include "spt_counter.h"
+#include "spt_proc.h"
 #include "spt_setup.h"
 #include "spt_status.h"
+#include "spt_template.h"
+#include "spt_title.h"
+#include "spt_workers.h"
+#include "spt_writer.h"
+
+#include <errno.h>
+#include <string.h>
 
 #ifndef SPT_VERSION
 #define SPT_VERSION unknown
@@ -23,20 +34,42 @@
 #define xstr(s) str(s)
 #define str(s) #s
 
+/* State of the module, specific for each interpreter */
+typedef struct spt_module_state {
+    PyObject *title;                    /* the last getproctitle() result */
+    unsigned long long title_generation;    /* the display it refers to */
+    PyObject *counter_type;             /* the Counter class */
+    PyObject *title_type;               /* the Title class */
+    PyObject *template_type;            /* the Template class */
+    PyObject *board_type;               /* the StatusBoard class */
+} spt_module_state;
+
+static spt_module_state *
+get_module_state(PyObject *m)
+{
+    return (spt_module_state *)PyModule_GetState(m);
+}
+
 /* ----------------------------------------------------- */
 
 static char spt_setproctitle__doc__[] =
-"setproctitle(title) -- Change the process title."
+"setproctitle(title) -- Change the process title.\n\n"
+"The title can be a str or a bytes-like object."
 ;
 
 static PyObject *
-spt_setproctitle(PyObject *self, PyObject *args, PyObject *kwargs)
+spt_setproctitle(PyObject *self,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)
 {
-    const char *title = NULL;
-    static char *kwlist[] = {"title", NULL};
+    static const char *const names[] = {"title", NULL};
+    PyObject *argv[1];
+    spt_title_arg title;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s", kwlist, &title)) {
-        spt_debug("failed to parse tuple and keywords");
+    if (0 > spt_parse_args(
+            "setproctitle", names, 1, args, nargs, kwnames, argv)) {
+        return NULL;
+    }
+    if (0 > spt_title_from_object(argv[0], "title", &title)) {
         return NULL;
     }
 
@@ -44,9 +77,20 @@ spt_setproctitle(PyObject *self, PyObject *args, PyObject *kwargs)
         spt_debug("failed to initialize setproctitle");
     }
 
-    /* Initialize the process title */
-    set_ps_display(title, true);
+    /* Leave the title to the writer thread, if running */
+    spt_writer_reserve((size_t)title.len, false);
+    if (!spt_writer_submit(title.data, (size_t)title.len)) {
+        if (get_ps_write_size((size_t)title.len) > NOGIL_WRITE_SIZE) {
+            Py_BEGIN_ALLOW_THREADS
+            spt_writer_set_title(title.data, (size_t)title.len);
+            Py_END_ALLOW_THREADS
+        }
+        else {
+            spt_writer_set_title(title.data, (size_t)title.len);
+        }
+    }
 
+    spt_title_release(&title);
     Py_RETURN_NONE;
 }
 
@@ -58,40 +102,740 @@ static char spt_getproctitle__doc__[] =
 static PyObject *
 spt_getproctitle(PyObject *self, PyObject *args)
 {
-    size_t tlen;
-    const char *title;
+    spt_module_state *state = get_module_state(self);
+    unsigned long long generation;
+    size_t size, tlen;
+    char *title;
+    PyObject *rv;
+
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    /* Return the title waiting to be written, if any, without writing it */
+    if ((title = spt_writer_pending_title(&tlen))) {
+        rv = PyUnicode_DecodeUTF8(title, (Py_ssize_t)tlen, NULL);
+        free(title);
+        return rv;
+    }
+
+    /* Return the same object until the title changes */
+    Py_BEGIN_CRITICAL_SECTION(self);
+    generation = get_ps_display_generation();
+    if (!state->title || state->title_generation != generation) {
+        /* Copy the title, as other threads may change it, or extend the
+         * title area */
+        size = get_ps_buffer_size();
+        if ((title = PyMem_Malloc(size + 1))) {
+            tlen = read_ps_title(title, size, NULL, &generation);
+            Py_XSETREF(state->title,
+                PyUnicode_DecodeUTF8(title, (Py_ssize_t)tlen, NULL));
+            state->title_generation = generation;
+            PyMem_Free(title);
+        }
+        else {
+            PyErr_NoMemory();
+            Py_CLEAR(state->title);
+        }
+    }
+    Py_XINCREF(state->title);
+    rv = state->title;
+    Py_END_CRITICAL_SECTION();
+
+    return rv;
+}
+
+
+static char spt_set_title_prefix__doc__[] =
+"set_title_prefix(prefix) -- Set a constant prefix for the process title.\n\n"
+"The activity part of the title is reset to empty: use set_activity() to\n"
+"change it. Calling setproctitle() drops the prefix."
+;
+
+static PyObject *
+spt_set_title_prefix(PyObject *self,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)
+{
+    static const char *const names[] = {"prefix", NULL};
+    PyObject *argv[1];
+    spt_title_arg prefix;
+
+    if (0 > spt_parse_args(
+            "set_title_prefix", names, 1, args, nargs, kwnames, argv)) {
+        return NULL;
+    }
+    if (0 > spt_title_from_object(argv[0], "prefix", &prefix)) {
+        return NULL;
+    }
+
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    spt_writer_lock();
+    set_ps_display_prefix(prefix.data, (size_t)prefix.len);
+    spt_writer_unlock();
+
+    spt_title_release(&prefix);
+    Py_RETURN_NONE;
+}
+
+
+static char spt_set_activity__doc__[] =
+"set_activity(activity) -- Change the process title after the prefix."
+;
+
+static PyObject *
+spt_set_activity(PyObject *self,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)
+{
+    static const char *const names[] = {"activity", NULL};
+    PyObject *argv[1];
+    spt_title_arg activity;
+
+    if (0 > spt_parse_args(
+            "set_activity", names, 1, args, nargs, kwnames, argv)) {
+        return NULL;
+    }
+    if (0 > spt_title_from_object(argv[0], "activity", &activity)) {
+        return NULL;
+    }
+
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    spt_writer_reserve((size_t)activity.len, true);
+    if (get_ps_write_size((size_t)activity.len) > NOGIL_WRITE_SIZE) {
+        Py_BEGIN_ALLOW_THREADS
+        spt_writer_lock();
+        set_ps_display_len(activity.data, (size_t)activity.len, true);
+        spt_writer_unlock();
+        Py_END_ALLOW_THREADS
+    }
+    else {
+        spt_writer_lock();
+        set_ps_display_len(activity.data, (size_t)activity.len, true);
+        spt_writer_unlock();
+    }
+
+    spt_title_release(&activity);
+    Py_RETURN_NONE;
+}
+
+
+static char spt_get_activity__doc__[] =
+"get_activity() -- Get the process title after the prefix."
+;
+
+static PyObject *
+spt_get_activity(PyObject *self, PyObject *args)
+{
+    size_t size, tlen, prefixlen;
+    char *title;
+    PyObject *rv;
+
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    /* The title waiting to be written, if any, replaces the prefix too */
+    if ((title = spt_writer_pending_title(&tlen))) {
+        rv = Py_BuildValue("s#", title, (Py_ssize_t)tlen);
+        free(title);
+        return rv;
+    }
+
+    /* Copy the title, as other threads may change it */
+    size = get_ps_buffer_size();
+    if (!(title = PyMem_Malloc(size + 1))) {
+        return PyErr_NoMemory();
+    }
+    tlen = read_ps_title(title, size, &prefixlen, NULL);
+    rv = Py_BuildValue("s#", title + prefixlen, (Py_ssize_t)(tlen - prefixlen));
+    PyMem_Free(title);
+
+    return rv;
+}
+
+
+static char spt_push_title__doc__[] =
+"push_title(suffix) -- Append suffix to the process title.\n\n"
+"The previous title is saved: call pop_title() to restore it."
+;
+
+static PyObject *
+spt_push_title(PyObject *self,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)
+{
+    static const char *const names[] = {"suffix", NULL};
+    PyObject *argv[1];
+    spt_title_arg suffix;
+    int rv;
+
+    if (0 > spt_parse_args(
+            "push_title", names, 1, args, nargs, kwnames, argv)) {
+        return NULL;
+    }
+    if (0 > spt_title_from_object(argv[0], "suffix", &suffix)) {
+        return NULL;
+    }
+
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    spt_writer_lock();
+    /* The scopes of every thread are popped separately */
+    rv = push_ps_display(
+        suffix.data, (size_t)suffix.len, PyThreadState_Get());
+    spt_writer_unlock();
+
+    spt_title_release(&suffix);
+    if (rv < 0) {
+        return PyErr_NoMemory();
+    }
+
+    Py_RETURN_NONE;
+}
+
+
+static char spt_pop_title__doc__[] =
+"pop_title() -- Restore the title saved by the last push_title().\n\n"
+"If the title was changed in other ways after push_title(), it is left\n"
+"unchanged."
+;
+
+static PyObject *
+spt_pop_title(PyObject *self, PyObject *args)
+{
+    bool popped;
+
+    spt_writer_lock();
+    popped = pop_ps_display(PyThreadState_Get());
+    spt_writer_unlock();
+
+    if (!popped) {
+        PyErr_SetString(PyExc_RuntimeError, "no title pushed");
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
+
+static char spt_enable_coalescing__doc__[] =
+"enable_coalescing(max_rate=10.0) -- Write the title in background.\n\n"
+"setproctitle() will only store the title: a background thread will write\n"
+"the latest title stored no more than max_rate times per second."
+;
+
+static PyObject *
+spt_enable_coalescing(PyObject *self,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)
+{
+    static const char *const names[] = {"max_rate", NULL};
+    PyObject *argv[1];
+    double max_rate = 10.0;
+
+    if (0 > spt_parse_args(
+            "enable_coalescing", names, 0, args, nargs, kwnames, argv)) {
+        return NULL;
+    }
+    if (argv[0]) {
+        if (-1.0 == (max_rate = PyFloat_AsDouble(argv[0]))
+                && PyErr_Occurred()) {
+            return NULL;
+        }
+    }
+
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    if (spt_writer_start(max_rate) < 0) {
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
+
+static char spt_disable_coalescing__doc__[] =
+"disable_coalescing() -- Stop writing the title in background.\n\n"
+"The pending title, if any, is written immediately."
+;
+
+static PyObject *
+spt_disable_coalescing(PyObject *self, PyObject *args)
+{
+    Py_BEGIN_ALLOW_THREADS
+    spt_writer_stop();
+    Py_END_ALLOW_THREADS
+
+    Py_RETURN_NONE;
+}
+
+
+static char spt_flush__doc__[] =
+"flush() -- Write immediately the title pending in background, if any."
+;
+
+static PyObject *
+spt_flush(PyObject *self, PyObject *args)
+{
+    spt_writer_flush();
+
+    Py_RETURN_NONE;
+}
+
+
+static char spt_stats__doc__[] =
+"stats() -- Return a dict of counters about the process title updates.\n\n"
+"'calls' is the number of title changes requested, 'updates' the number of\n"
+"titles written, 'skipped' the number of titles not written because equal\n"
+"to the current one, 'truncations' the number of titles not fitting in the\n"
+"space available. 'bytes_written' and 'memset_bytes' count the bytes\n"
+"copied into the title area and cleared after a shorter title,\n"
+"'prctl_calls' the changes of the process name, 'ns' the nanoseconds spent\n"
+"writing the titles."
+;
+
+static PyObject *
+spt_stats(PyObject *self, PyObject *args)
+{
+    ps_display_stats stats;
+
+    get_ps_display_stats(&stats);
+
+    return Py_BuildValue("{sKsKsKsKsKsKsKsK}",
+        "calls", stats.calls,
+        "updates", stats.updates,
+        "skipped", stats.skipped,
+        "truncations", stats.truncations,
+        "bytes_written", stats.bytes_written,
+        "memset_bytes", stats.memset_bytes,
+        "prctl_calls", stats.prctl_calls,
+        "ns", stats.ns);
+}
+
+
+static char spt_reset_stats__doc__[] =
+"reset_stats() -- Reset to zero the counters returned by stats()."
+;
+
+static PyObject *
+spt_reset_stats(PyObject *self, PyObject *args)
+{
+    spt_writer_lock();
+    reset_ps_display_stats();
+    spt_writer_unlock();
+
+    Py_RETURN_NONE;
+}
+
+
+static char spt_setup_info__doc__[] =
+"setup_info() -- Return a dict of information about the title area.\n\n"
+"'buffer_size' is the space available for the title, 'argc' the number of\n"
+"arguments found, 'arena_size' the bytes allocated to copy the arguments\n"
+"and the environment, 'environ_moved' the number of environment variables\n"
+"moved to make room for the title."
+;
+
+static PyObject *
+spt_setup_info(PyObject *self, PyObject *args)
+{
+    ps_args_info info;
+
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    get_ps_args_info(&info);
+
+    return Py_BuildValue("{snsisnsn}",
+        "buffer_size", (Py_ssize_t)get_ps_buffer_size(),
+        "argc", info.argc,
+        "arena_size", (Py_ssize_t)info.arena_size,
+        "environ_moved", (Py_ssize_t)info.environ_moved);
+}
+
+
+static char spt_set_backend__doc__[] =
+"set_backend(backend) -- Choose where the process title is shown.\n\n"
+"'cmdline' shows it in the command line, as read by ps, 'comm' in the\n"
+"process name, as read by top, 'both' in both of them (the default),\n"
+"'memory' nowhere: getproctitle() returns it but the process is unchanged."
+;
+
+static PyObject *
+spt_set_backend(PyObject *self,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)
+{
+    static const char *const names[] = {"backend", NULL};
+    PyObject *argv[1];
+    const char *name;
+    Py_ssize_t len;
+    int backend;
+    bool ok;
+
+    if (0 > spt_parse_args(
+            "set_backend", names, 1, args, nargs, kwnames, argv)) {
+        return NULL;
+    }
+    if (!PyUnicode_Check(argv[0])) {
+        PyErr_Format(PyExc_TypeError,
+            "backend must be str, not %.200s", Py_TYPE(argv[0])->tp_name);
+        return NULL;
+    }
+    if (!(name = PyUnicode_AsUTF8AndSize(argv[0], &len))) {
+        return NULL;
+    }
+    if ((size_t)len != strlen(name)
+            || (backend = get_ps_backend_by_name(name)) < 0) {
+        PyErr_Format(PyExc_ValueError,
+            "backend must be 'both', 'cmdline', 'comm' or 'memory', "
+            "not %R", argv[0]);
+        return NULL;
+    }
+
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    spt_writer_lock();
+    ok = set_ps_backend((unsigned int)backend);
+    spt_writer_unlock();
+
+    if (!ok) {
+        return PyErr_NoMemory();
+    }
+    Py_RETURN_NONE;
+}
+
+
+static char spt_get_backend__doc__[] =
+"get_backend() -- Return where the process title is shown.\n\n"
+"See set_backend() for the values returned."
+;
+
+static PyObject *
+spt_get_backend(PyObject *self, PyObject *args)
+{
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    return PyUnicode_FromString(get_ps_backend_name());
+}
+
+
+static char spt_enable_board__doc__[] =
+"enable_board(path, nslots=256, title_size=128) -- Publish the titles.\n\n"
+"Copy every title written, from now on, into a slot of the status board\n"
+"in the file at path, creating it with nslots slots if needed. Processes\n"
+"forked later publish their titles into their own slot."
+;
+
+static PyObject *
+spt_enable_board(PyObject *self,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)
+{
+    static const char *const names[] = {"path", "nslots", "title_size", NULL};
+    PyObject *argv[3];
+    PyObject *path = NULL;
+    long nslots = 256, title_size = 128;
+    int rv;
+
+    if (0 > spt_parse_args(
+            "enable_board", names, 1, args, nargs, kwnames, argv)) {
+        return NULL;
+    }
+    if (argv[1]) {
+        if (-1 == (nslots = PyLong_AsLong(argv[1])) && PyErr_Occurred()) {
+            return NULL;
+        }
+    }
+    if (argv[2]) {
+        if (-1 == (title_size = PyLong_AsLong(argv[2])) && PyErr_Occurred()) {
+            return NULL;
+        }
+    }
+    if (!PyUnicode_FSConverter(argv[0], &path)) {
+        return NULL;
+    }
 
     if (spt_setup() < 0) {
         spt_debug("failed to initialize setproctitle");
     }
 
-    title = get_ps_display(&tlen);
+    spt_writer_lock();
+    rv = spt_board_enable(PyBytes_AS_STRING(path), nslots, title_size);
+    spt_writer_unlock();
+
+    Py_DECREF(path);
+    if (rv < 0) {
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
+
+static char spt_disable_board__doc__[] =
+"disable_board() -- Stop publishing the titles in the status board."
+;
+
+static PyObject *
+spt_disable_board(PyObject *self, PyObject *args)
+{
+    spt_writer_lock();
+    spt_board_disable();
+    spt_writer_unlock();
+
+    Py_RETURN_NONE;
+}
+
+
+static char spt_enable_worker_titles__doc__[] =
+"enable_worker_titles(template='{parent_title} worker {n}', start=1) --\n"
+"Set the title of the processes forked.\n\n"
+"Every process forked by os.fork() from now on sets its title rendering\n"
+"template, where {parent_title} is the title of the process forking and\n"
+"{n} a worker number, different for every child, starting from start."
+;
+
+static PyObject *
+spt_enable_worker_titles(PyObject *self,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)
+{
+    static const char *const names[] = {"template", "start", NULL};
+    PyObject *argv[2];
+    PyObject *obj;
+    spt_title_arg template;
+    long start = 1;
+    int rv;
+
+    if (0 > spt_parse_args(
+            "enable_worker_titles", names, 0, args, nargs, kwnames, argv)) {
+        return NULL;
+    }
+    obj = argv[0];
+    if (argv[1]) {
+        if (-1 == (start = PyLong_AsLong(argv[1])) && PyErr_Occurred()) {
+            return NULL;
+        }
+        if (start < INT_MIN || start > INT_MAX) {
+            PyErr_SetString(PyExc_OverflowError,
+                "start is out of the range of a C int");
+            return NULL;
+        }
+    }
+
+    if (0 > spt_workers_register()) {
+        return NULL;
+    }
+
+    if (!obj) {
+        template.data = "{parent_title} worker {n}";
+        template.len = (Py_ssize_t)strlen(template.data);
+        template.has_view = 0;
+    }
+    else if (0 > spt_title_from_object(obj, "template", &template)) {
+        return NULL;
+    }
+
+    rv = spt_workers_enable(
+        template.data, (size_t)template.len, (int)start);
+
+    spt_title_release(&template);
+    if (rv < 0) {
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
+
+static char spt_disable_worker_titles__doc__[] =
+"disable_worker_titles() -- Stop setting the title of the processes forked."
+;
 
-    return Py_BuildValue("s#", title, (int)tlen);
+static PyObject *
+spt_disable_worker_titles(PyObject *self, PyObject *args)
+{
+    spt_workers_disable();
+
+    Py_RETURN_NONE;
 }
 
 
 static char spt_setthreadtitle__doc__[] =
-"setthreadtitle(title) -- Change the thread title."
+"setthreadtitle(title, native_id=None) -- Change the thread title.\n\n"
+"Change the title of the current thread or, if native_id is specified, of\n"
+"the thread of the process with that native id."
 ;
 
 static PyObject *
-spt_setthreadtitle(PyObject *self, PyObject *args, PyObject *kwargs)
+spt_setthreadtitle(PyObject *self,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)
 {
-    const char *title = NULL;
-    static char *kwlist[] = {"title", NULL};
+    static const char *const names[] = {"title", "native_id", NULL};
+    PyObject *argv[2];
+    spt_title_arg title;
+    char buf[16];
+    size_t len;
+    long tid = 0;
+    int current, dfd, rv;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s", kwlist, &title)) {
-        spt_debug("failed to parse tuple and keywords");
+    if (0 > spt_parse_args(
+            "setthreadtitle", names, 1, args, nargs, kwnames, argv)) {
         return NULL;
     }
+    current = !argv[1] || argv[1] == Py_None;
+    if (!current) {
+        if (-1 == (tid = PyLong_AsLong(argv[1])) && PyErr_Occurred()) {
+            return NULL;
+        }
+        if (tid < 0) {
+            PyErr_SetString(PyExc_ValueError,
+                "native_id must be a non-negative integer");
+            return NULL;
+        }
+    }
+    if (0 > spt_title_from_object(argv[0], "title", &title)) {
+        return NULL;
+    }
+
+    /* The kernel would truncate the title to 15 chars anyway */
+    len = (size_t)title.len < sizeof(buf) ? (size_t)title.len : sizeof(buf) - 1;
+    memcpy(buf, title.data, len);
+    buf[len] = '\0';
+    spt_title_release(&title);
 
-    set_thread_title(title);
+    if (current) {
+        set_thread_title(buf);
+        Py_RETURN_NONE;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    if (0 <= (rv = dfd = spt_proc_open_threads())) {
+        rv = spt_proc_set_thread_name(dfd, tid, buf, len);
+        spt_proc_close(dfd);
+        thread_titles_changed();
+    }
+    Py_END_ALLOW_THREADS
+
+    if (rv < 0) {
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
 
     Py_RETURN_NONE;
 }
 
 
+/* A title to set to a thread with setthreadtitles() */
+typedef struct spt_thread_title {
+    long tid;
+    size_t len;
+    char title[16];
+} spt_thread_title;
+
+static char spt_setthreadtitles__doc__[] =
+"setthreadtitles(titles) -- Change the titles of many threads at once.\n\n"
+"titles is a mapping from thread native ids to titles. Threads not found\n"
+"are ignored. Return the number of threads whose title was changed."
+;
+
+static PyObject *
+spt_setthreadtitles(PyObject *self,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)
+{
+    static const char *const names[] = {"titles", NULL};
+    PyObject *argv[1];
+    PyObject *items = NULL, *rv = NULL;
+    spt_thread_title *titles = NULL;
+    spt_title_arg title;
+    Py_ssize_t ntitles, i, nset = 0;
+    int dfd, err = 0;
+
+    if (0 > spt_parse_args(
+            "setthreadtitles", names, 1, args, nargs, kwnames, argv)) {
+        return NULL;
+    }
+    if (!(items = PyMapping_Items(argv[0]))) {
+        goto exit;
+    }
+
+    /* Convert the titles, so that they can be written without the GIL */
+    ntitles = PyList_GET_SIZE(items);
+    if (!(titles = PyMem_New(spt_thread_title, ntitles ? ntitles : 1))) {
+        PyErr_NoMemory();
+        goto exit;
+    }
+    for (i = 0; i < ntitles; i++) {
+        PyObject *item = PyList_GET_ITEM(items, i);
+        spt_thread_title *t = &titles[i];
+
+        if (!PyTuple_Check(item) || PyTuple_GET_SIZE(item) != 2) {
+            PyErr_SetString(PyExc_TypeError, "mapping items must be pairs");
+            goto exit;
+        }
+        t->tid = PyLong_AsLong(PyTuple_GET_ITEM(item, 0));
+        if (t->tid == -1 && PyErr_Occurred()) {
+            goto exit;
+        }
+        if (t->tid < 0) {
+            PyErr_SetString(PyExc_ValueError,
+                "native ids must be non-negative integers");
+            goto exit;
+        }
+        if (0 > spt_title_from_object(
+                PyTuple_GET_ITEM(item, 1), "title", &title)) {
+            goto exit;
+        }
+        t->len = (size_t)title.len < sizeof(t->title)
+            ? (size_t)title.len : sizeof(t->title) - 1;
+        memcpy(t->title, title.data, t->len);
+        spt_title_release(&title);
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    if (0 <= (dfd = spt_proc_open_threads())) {
+        for (i = 0; i < ntitles; i++) {
+            if (0 == spt_proc_set_thread_name(
+                    dfd, titles[i].tid, titles[i].title, titles[i].len)) {
+                nset++;
+            }
+            else if (errno != ESRCH) {
+                err = errno;
+                break;
+            }
+        }
+        spt_proc_close(dfd);
+        thread_titles_changed();
+    }
+    else {
+        err = errno;
+    }
+    Py_END_ALLOW_THREADS
+
+    if (err) {
+        errno = err;
+        PyErr_SetFromErrno(PyExc_OSError);
+        goto exit;
+    }
+
+    rv = PyLong_FromSsize_t(nset);
+
+exit:
+    PyMem_Free(titles);
+    Py_XDECREF(items);
+    return rv;
+}
+
+
 static char spt_getthreadtitle__doc__[] =
 "getthreadtitle() -- Return the thread title."
 ;
@@ -106,15 +850,261 @@ spt_getthreadtitle(PyObject *self, PyObject *args)
     return Py_BuildValue("s", title);
 }
 
+
+static int
+add_thread_title(long tid, const char *name, size_t len, void *arg)
+{
+    PyObject *key = NULL, *value = NULL;
+    int rv = -1;
+
+    if (!(key = PyLong_FromLong(tid))) {
+        goto exit;
+    }
+    /* The kernel may have truncated the name in the middle of a char */
+    if (!(value = PyUnicode_DecodeUTF8(name, (Py_ssize_t)len, "replace"))) {
+        goto exit;
+    }
+    rv = PyDict_SetItem((PyObject *)arg, key, value);
+
+exit:
+    Py_XDECREF(key);
+    Py_XDECREF(value);
+    return rv;
+}
+
+
+static char spt_list_thread_titles__doc__[] =
+"list_thread_titles() -- Return the titles of all the process threads.\n\n"
+"Return a dict mapping the native id of every thread to its title."
+;
+
+static PyObject *
+spt_list_thread_titles(PyObject *self, PyObject *args)
+{
+    PyObject *rv;
+
+    if (!(rv = PyDict_New())) {
+        return NULL;
+    }
+
+    if (0 > spt_proc_iter_threads(add_thread_title, rv)) {
+        if (!PyErr_Occurred()) {
+            PyErr_SetFromErrnoWithFilename(
+                PyExc_OSError, "/proc/self/task");
+        }
+        Py_DECREF(rv);
+        return NULL;
+    }
+
+    return rv;
+}
+
+static int
+append_pid(long pid, void *arg)
+{
+    PyObject *obj;
+    int rv;
+
+    if (!(obj = PyLong_FromLong(pid))) {
+        return -1;
+    }
+    rv = PyList_Append((PyObject *)arg, obj);
+    Py_DECREF(obj);
+    return rv;
+}
+
+
+static char spt_compile_template__doc__[] =
+"compile_template(template) -- Parse a title template with named fields.\n\n"
+"Return a Template object: call its set() method to change some fields and\n"
+"show the title."
+;
+
+static PyObject *
+spt_compile_template(PyObject *self, PyObject *template)
+{
+    spt_module_state *state = get_module_state(self);
+
+    return PyObject_CallFunctionObjArgs(state->template_type, template, NULL);
+}
+
+
+static char spt_read_titles__doc__[] =
+"read_titles(pids=None) -- Return the titles of other processes.\n\n"
+"Return a list of (pid, title, comm) tuples for the processes in pids, by\n"
+"default the children of the current process. Processes not found are\n"
+"skipped; title and comm are None for processes which can't be read."
+;
+
+static PyObject *
+spt_read_titles(PyObject *self,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)
+{
+    static const char *const names[] = {"pids", NULL};
+    PyObject *argv[1];
+    PyObject *pids;
+    PyObject *seq = NULL, *rv = NULL, *item;
+    spt_proc_buffer title = {NULL, 0, 0}, comm = {NULL, 0, 0};
+    Py_ssize_t i;
+    int procfd = -1;
+    long pid;
+
+    if (0 > spt_parse_args(
+            "read_titles", names, 0, args, nargs, kwnames, argv)) {
+        return NULL;
+    }
+    pids = argv[0] ? argv[0] : Py_None;
+
+    if (pids == Py_None) {
+        if (!(seq = PyList_New(0))) {
+            goto exit;
+        }
+        if (0 > spt_proc_iter_children(append_pid, seq)) {
+            if (!PyErr_Occurred()) {
+                PyErr_SetFromErrno(PyExc_OSError);
+            }
+            goto exit;
+        }
+    }
+    else {
+        if (!(seq = PySequence_Fast(pids, "pids must be iterable"))) {
+            goto exit;
+        }
+    }
+
+    if (0 > (procfd = spt_proc_open())) {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, "/proc");
+        goto exit;
+    }
+    if (!(rv = PyList_New(0))) {
+        goto exit;
+    }
+
+    for (i = 0; i < PySequence_Fast_GET_SIZE(seq); i++) {
+        pid = PyLong_AsLong(PySequence_Fast_GET_ITEM(seq, i));
+        if (pid == -1 && PyErr_Occurred()) {
+            Py_CLEAR(rv);
+            goto exit;
+        }
+
+        if (0 > spt_proc_read_title(procfd, pid, &title, &comm)) {
+            if (errno == ESRCH) {
+                continue;
+            }
+            if (errno == ENOMEM) {
+                PyErr_NoMemory();
+                Py_CLEAR(rv);
+                goto exit;
+            }
+            /* The process exists but we can't read it (e.g. EACCES, or
+             * /proc mounted with hidepid): report it without a title. */
+            item = Py_BuildValue("(lOO)", pid, Py_None, Py_None);
+        }
+        else {
+            item = Py_BuildValue("(lNN)", pid,
+                PyUnicode_DecodeUTF8(
+                    title.data, (Py_ssize_t)title.len, "replace"),
+                PyUnicode_DecodeUTF8(
+                    comm.data, (Py_ssize_t)comm.len, "replace"));
+        }
+        if (!item || 0 > PyList_Append(rv, item)) {
+            Py_XDECREF(item);
+            Py_CLEAR(rv);
+            goto exit;
+        }
+        Py_DECREF(item);
+    }
+
+exit:
+    if (procfd >= 0) {
+        spt_proc_close(procfd);
+    }
+    spt_proc_buffer_free(&title);
+    spt_proc_buffer_free(&comm);
+    Py_XDECREF(seq);
+    return rv;
+}
+
 /* Module initialization function */
 
 static int
 spt_exec(PyObject *m)
 {
+    spt_module_state *state = get_module_state(m);
+
     spt_debug("module init");
+
+    if (!(state->counter_type = spt_counter_type_new())) {
+        return -1;
+    }
+    Py_INCREF(state->counter_type);
+    if (0 > PyModule_AddObject(m, "Counter", state->counter_type)) {
+        Py_DECREF(state->counter_type);
+        return -1;
+    }
+
+    if (!(state->title_type = spt_title_type_new())) {
+        return -1;
+    }
+    Py_INCREF(state->title_type);
+    if (0 > PyModule_AddObject(m, "Title", state->title_type)) {
+        Py_DECREF(state->title_type);
+        return -1;
+    }
+
+    if (!(state->template_type = spt_template_type_new())) {
+        return -1;
+    }
+    Py_INCREF(state->template_type);
+    if (0 > PyModule_AddObject(m, "Template", state->template_type)) {
+        Py_DECREF(state->template_type);
+        return -1;
+    }
+
+    if (!(state->board_type = spt_board_type_new())) {
+        return -1;
+    }
+    Py_INCREF(state->board_type);
+    if (0 > PyModule_AddObject(m, "StatusBoard", state->board_type)) {
+        Py_DECREF(state->board_type);
+        return -1;
+    }
+
+    return 0;
+}
+
+static int
+spt_traverse(PyObject *m, visitproc visit, void *arg)
+{
+    spt_module_state *state = get_module_state(m);
+
+    Py_VISIT(state->title);
+    Py_VISIT(state->counter_type);
+    Py_VISIT(state->title_type);
+    Py_VISIT(state->template_type);
+    Py_VISIT(state->board_type);
+    return 0;
+}
+
+static int
+spt_clear(PyObject *m)
+{
+    spt_module_state *state = get_module_state(m);
+
+    Py_CLEAR(state->title);
+    Py_CLEAR(state->counter_type);
+    Py_CLEAR(state->title_type);
+    Py_CLEAR(state->template_type);
+    Py_CLEAR(state->board_type);
     return 0;
 }
 
+static void
+spt_free(void *m)
+{
+    spt_clear((PyObject *)m);
+}
+
 /* List of slots defined in the module */
 
 static PyModuleDef_Slot spt_slots[] = {
@@ -132,8 +1122,8 @@ static PyModuleDef_Slot spt_slots[] = {
 
 static struct PyMethodDef spt_methods[] = {
     {"setproctitle",
-        (PyCFunction)spt_setproctitle,
-        METH_VARARGS|METH_KEYWORDS,
+        (PyCFunction)(void(*)(void))spt_setproctitle,
+        METH_FASTCALL|METH_KEYWORDS,
         spt_setproctitle__doc__},
 
     {"getproctitle",
@@ -141,16 +1131,121 @@ static struct PyMethodDef spt_methods[] = {
         METH_NOARGS,
         spt_getproctitle__doc__},
 
+    {"set_title_prefix",
+        (PyCFunction)(void(*)(void))spt_set_title_prefix,
+        METH_FASTCALL|METH_KEYWORDS,
+        spt_set_title_prefix__doc__},
+
+    {"set_activity",
+        (PyCFunction)(void(*)(void))spt_set_activity,
+        METH_FASTCALL|METH_KEYWORDS,
+        spt_set_activity__doc__},
+
+    {"get_activity",
+        (PyCFunction)spt_get_activity,
+        METH_NOARGS,
+        spt_get_activity__doc__},
+
+    {"push_title",
+        (PyCFunction)(void(*)(void))spt_push_title,
+        METH_FASTCALL|METH_KEYWORDS,
+        spt_push_title__doc__},
+
+    {"pop_title",
+        (PyCFunction)spt_pop_title,
+        METH_NOARGS,
+        spt_pop_title__doc__},
+
+    {"enable_coalescing",
+        (PyCFunction)(void(*)(void))spt_enable_coalescing,
+        METH_FASTCALL|METH_KEYWORDS,
+        spt_enable_coalescing__doc__},
+
+    {"disable_coalescing",
+        (PyCFunction)spt_disable_coalescing,
+        METH_NOARGS,
+        spt_disable_coalescing__doc__},
+
+    {"flush",
+        (PyCFunction)spt_flush,
+        METH_NOARGS,
+        spt_flush__doc__},
+
+    {"stats",
+        (PyCFunction)spt_stats,
+        METH_NOARGS,
+        spt_stats__doc__},
+
+    {"reset_stats",
+        (PyCFunction)spt_reset_stats,
+        METH_NOARGS,
+        spt_reset_stats__doc__},
+
+    {"setup_info",
+        (PyCFunction)spt_setup_info,
+        METH_NOARGS,
+        spt_setup_info__doc__},
+
+    {"set_backend",
+        (PyCFunction)(void(*)(void))spt_set_backend,
+        METH_FASTCALL|METH_KEYWORDS,
+        spt_set_backend__doc__},
+
+    {"get_backend",
+        (PyCFunction)spt_get_backend,
+        METH_NOARGS,
+        spt_get_backend__doc__},
+
+    {"enable_board",
+        (PyCFunction)(void(*)(void))spt_enable_board,
+        METH_FASTCALL|METH_KEYWORDS,
+        spt_enable_board__doc__},
+
+    {"disable_board",
+        (PyCFunction)spt_disable_board,
+        METH_NOARGS,
+        spt_disable_board__doc__},
+
+    {"enable_worker_titles",
+        (PyCFunction)(void(*)(void))spt_enable_worker_titles,
+        METH_FASTCALL|METH_KEYWORDS,
+        spt_enable_worker_titles__doc__},
+
+    {"disable_worker_titles",
+        (PyCFunction)spt_disable_worker_titles,
+        METH_NOARGS,
+        spt_disable_worker_titles__doc__},
+
     {"setthreadtitle",
-        (PyCFunction)spt_setthreadtitle,
-        METH_VARARGS|METH_KEYWORDS,
+        (PyCFunction)(void(*)(void))spt_setthreadtitle,
+        METH_FASTCALL|METH_KEYWORDS,
         spt_setthreadtitle__doc__},
 
+    {"setthreadtitles",
+        (PyCFunction)(void(*)(void))spt_setthreadtitles,
+        METH_FASTCALL|METH_KEYWORDS,
+        spt_setthreadtitles__doc__},
+
     {"getthreadtitle",
         (PyCFunction)spt_getthreadtitle,
         METH_NOARGS,
         spt_getthreadtitle__doc__},
 
+    {"list_thread_titles",
+        (PyCFunction)spt_list_thread_titles,
+        METH_NOARGS,
+        spt_list_thread_titles__doc__},
+
+    {"read_titles",
+        (PyCFunction)(void(*)(void))spt_read_titles,
+        METH_FASTCALL|METH_KEYWORDS,
+        spt_read_titles__doc__},
+
+    {"compile_template",
+        (PyCFunction)spt_compile_template,
+        METH_O,
+        spt_compile_template__doc__},
+
     {NULL, (PyCFunction)NULL, 0, NULL}        /* sentinel */
 };
 
@@ -165,12 +1260,12 @@ static struct PyModuleDef moduledef = {
     PyModuleDef_HEAD_INIT,
     "_setproctitle",
     setproctitle_module_documentation,
-    0,
+    sizeof(spt_module_state),
     spt_methods,
     spt_slots,
-    NULL,
-    NULL,
-    NULL
+    spt_traverse,
+    spt_clear,
+    spt_free
 };
 
 PyMODINIT_FUNC
@@ -0,0 +1,146 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_args.c
+ *    Arguments parsing for the module functions.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ * The module functions use the METH_FASTCALL calling convention, which
+ * doesn't need to pack the arguments into a tuple. The titles can be passed
+ * as str, encoded in utf-8, or as bytes-like objects, used as they are.
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#include "spt_args.h"
+
+#include <string.h>
+
+
+/* Parse the arguments of a METH_FASTCALL|METH_KEYWORDS function.
+ *
+ * 'names' is a NULL-terminated array with the names of the parameters,
+ * which can be passed both by position and by keyword. The first
+ * 'nrequired' parameters are required.
+ *
+ * Store borrowed references to the arguments into the 'out' array, which
+ * must have an item per name; store NULL for the missing arguments.
+ *
+ * Return 0 in case of success, else -1 and set a Python exception.
+ */
+int
+spt_parse_args(
+    const char *fname, const char *const *names, Py_ssize_t nrequired,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames,
+    PyObject **out)
+{
+    Py_ssize_t nparams, i, j, nkw;
+
+    for (nparams = 0; names[nparams]; nparams++) {
+        out[nparams] = NULL;
+    }
+
+    if (nargs > nparams) {
+        PyErr_Format(PyExc_TypeError,
+            "%s() takes at most %zd argument%s (%zd given)",
+            fname, nparams, nparams == 1 ? "" : "s", nargs);
+        return -1;
+    }
+    for (i = 0; i < nargs; i++) {
+        out[i] = args[i];
+    }
+
+    nkw = kwnames ? PyTuple_GET_SIZE(kwnames) : 0;
+    for (i = 0; i < nkw; i++) {
+        PyObject *kwname = PyTuple_GET_ITEM(kwnames, i);
+
+        for (j = 0; j < nparams; j++) {
+            if (0 == PyUnicode_CompareWithASCIIString(kwname, names[j])) {
+                break;
+            }
+        }
+        if (j == nparams) {
+            PyErr_Format(PyExc_TypeError,
+                "%s() got an unexpected keyword argument '%U'",
+                fname, kwname);
+            return -1;
+        }
+        if (out[j]) {
+            PyErr_Format(PyExc_TypeError,
+                "%s() got multiple values for argument '%s'",
+                fname, names[j]);
+            return -1;
+        }
+        out[j] = args[nargs + i];
+    }
+
+    for (i = 0; i < nrequired; i++) {
+        if (!out[i]) {
+            PyErr_Format(PyExc_TypeError,
+                "%s() missing required argument '%s'", fname, names[i]);
+            return -1;
+        }
+    }
+
+    return 0;
+}
+
+
+/* Get the bytes of a title from a Python object.
+ *
+ * str objects are encoded in utf-8 (Python caches the encoded string in the
+ * object). bytes and other objects exposing a contiguous buffer, such as
+ * bytearray or memoryview, are used without any copy. The title cannot
+ * contain NUL bytes.
+ *
+ * Return 0 in case of success, else -1 and set a Python exception. In case
+ * of success, call spt_title_release() when the title is no more needed.
+ */
+int
+spt_title_from_object(PyObject *obj, const char *argname, spt_title_arg *title)
+{
+    title->has_view = 0;
+
+    if (PyUnicode_Check(obj)) {
+        if (!(title->data = PyUnicode_AsUTF8AndSize(obj, &title->len))) {
+            return -1;
+        }
+    }
+    else if (PyBytes_Check(obj)) {
+        title->data = PyBytes_AS_STRING(obj);
+        title->len = PyBytes_GET_SIZE(obj);
+    }
+    else if (PyObject_CheckBuffer(obj)) {
+        if (0 > PyObject_GetBuffer(obj, &title->view, PyBUF_SIMPLE)) {
+            return -1;
+        }
+        title->has_view = 1;
+        title->data = title->view.buf;
+        title->len = title->view.len;
+    }
+    else {
+        PyErr_Format(PyExc_TypeError,
+            "%s must be str or a bytes-like object, not %.200s",
+            argname, Py_TYPE(obj)->tp_name);
+        return -1;
+    }
+
+    if (memchr(title->data, '\0', title->len)) {
+        PyErr_Format(PyExc_ValueError,
+            "%s cannot contain null characters", argname);
+        spt_title_release(title);
+        return -1;
+    }
+
+    return 0;
+}
+
+
+void
+spt_title_release(spt_title_arg *title)
+{
+    if (title->has_view) {
+        PyBuffer_Release(&title->view);
+        title->has_view = 0;
+    }
+}
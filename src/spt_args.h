@@ -0,0 +1,34 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_args.h
+ *    Arguments parsing for the module functions.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#ifndef SPT_ARGS_H
+#define SPT_ARGS_H
+
+#include "spt.h"
+
+/* A title received as str or bytes-like object */
+typedef struct spt_title_arg {
+    const char *data;       /* the title bytes, not necessarily terminated */
+    Py_ssize_t len;
+    Py_buffer view;         /* only used for buffer objects */
+    int has_view;
+} spt_title_arg;
+
+HIDDEN int spt_parse_args(
+    const char *fname, const char *const *names, Py_ssize_t nrequired,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames,
+    PyObject **out);
+
+HIDDEN int spt_title_from_object(
+    PyObject *obj, const char *argname, spt_title_arg *title);
+
+HIDDEN void spt_title_release(spt_title_arg *title);
+
+#endif   /* SPT_ARGS_H */
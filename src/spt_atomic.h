@@ -0,0 +1,48 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_atomic.h
+ *    Atomic operations on unsigned ints, used to implement seqlocks, and
+ *    thread-local storage.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#ifndef SPT_ATOMIC_H
+#define SPT_ATOMIC_H
+
+#if defined(_MSC_VER) && !defined(__clang__)
+
+#include <windows.h>
+
+/* The Interlocked functions are full barriers, more than we need */
+#define spt_atomic_load_acquire(p) \
+    ((unsigned int)InterlockedCompareExchange((volatile LONG *)(p), 0, 0))
+#define spt_atomic_load_relaxed(p) spt_atomic_load_acquire(p)
+#define spt_atomic_store_release(p, v) \
+    ((void)InterlockedExchange((volatile LONG *)(p), (LONG)(v)))
+#define spt_atomic_store_relaxed(p, v) spt_atomic_store_release(p, v)
+#define spt_atomic_add_relaxed(p, v) \
+    ((void)InterlockedExchangeAdd((volatile LONG *)(p), (LONG)(v)))
+#define spt_fence_acquire() MemoryBarrier()
+#define spt_fence_release() MemoryBarrier()
+#define spt_thread_local __declspec(thread)
+
+#else
+
+#define spt_atomic_load_acquire(p) __atomic_load_n((p), __ATOMIC_ACQUIRE)
+#define spt_atomic_load_relaxed(p) __atomic_load_n((p), __ATOMIC_RELAXED)
+#define spt_atomic_store_release(p, v) \
+    __atomic_store_n((p), (v), __ATOMIC_RELEASE)
+#define spt_atomic_store_relaxed(p, v) \
+    __atomic_store_n((p), (v), __ATOMIC_RELAXED)
+#define spt_atomic_add_relaxed(p, v) \
+    ((void)__atomic_add_fetch((p), (v), __ATOMIC_RELAXED))
+#define spt_fence_acquire() __atomic_thread_fence(__ATOMIC_ACQUIRE)
+#define spt_fence_release() __atomic_thread_fence(__ATOMIC_RELEASE)
+#define spt_thread_local __thread
+
+#endif
+
+#endif   /* SPT_ATOMIC_H */
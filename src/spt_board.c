@@ -0,0 +1,813 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_board.c
+ *    Process titles published in a shared memory status board.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ * The board is a file mapped in memory by many processes, containing a slot
+ * per process. When the board is enabled, every title written in the ps
+ * display is also copied into the process slot, together with the pid and
+ * a timestamp. A supervisor can read all the slots at once, without
+ * scanning /proc, and can wait for the next change.
+ *
+ * Every slot is protected by a seqlock: the writer makes the sequence odd
+ * while writing, and the readers retry until they read an even sequence,
+ * unchanged after copying the slot. Readers never block the writers.
+ *
+ * A process forked after enabling the board doesn't write into the parent
+ * slot: it claims a free slot on its first title update.
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#include "spt.h"
+#include "spt_board.h"
+#include "spt_status.h"
+
+#ifndef WIN32
+
+#include <errno.h>
+#include <fcntl.h>
+#include <pthread.h>
+#include <sched.h>
+#include <signal.h>
+#include <stdint.h>
+#include <string.h>
+#include <sys/file.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <time.h>
+#include <unistd.h>
+
+#ifdef __linux__
+#include <linux/futex.h>
+#include <sys/syscall.h>
+#endif
+
+#define BOARD_MAGIC "SPTBRD01"
+
+/* Keep the slots in separate cache lines */
+#define BOARD_ALIGN 64
+
+/* Largest wait between checks for signals, in ms */
+#define WAIT_STEP_MS 100
+
+/* Attempts to read a slot being written: the first ones only yield the
+ * CPU, the following ones sleep for 1ms. After the last one the slot is
+ * reported as torn: its writer might have been killed while writing. */
+#define READ_YIELDS 100
+#define READ_ATTEMPTS 200
+
+/* Results of board_read_slot() */
+#define SLOT_FREE 0
+#define SLOT_READ 1
+#define SLOT_TORN 2
+
+typedef struct board_header {
+    char magic[8];
+    uint32_t nslots;
+    uint32_t title_size;        /* max length of the titles */
+    uint32_t changes;           /* incremented at every title published */
+    uint32_t waiters;           /* readers waiting for changes */
+} board_header;
+
+typedef struct board_slot {
+    uint32_t seq;               /* odd while the slot is written */
+    int32_t pid;                /* 0 if the slot is free */
+    uint32_t len;
+    uint32_t unused;
+    int64_t timestamp;          /* of the last update, ns since the epoch */
+    char title[];               /* title_size chars */
+} board_slot;
+
+/* A board mapped in memory */
+typedef struct board_map {
+    board_header *header;
+    size_t size;
+    size_t slot_size;
+} board_map;
+
+#define BOARD_HEADER_SIZE \
+    ((sizeof(board_header) + BOARD_ALIGN - 1) / BOARD_ALIGN * BOARD_ALIGN)
+
+#define BOARD_SLOT(map, i) \
+    ((board_slot *)((char *)(map)->header + BOARD_HEADER_SIZE \
+        + (size_t)(i) * (map)->slot_size))
+
+/* The board of the current process, if enabled */
+static board_map board;
+static board_slot *board_own_slot = NULL;   /* NULL if not claimed yet */
+
+
+static size_t
+board_slot_size(uint32_t title_size)
+{
+    return (sizeof(board_slot) + title_size + BOARD_ALIGN - 1)
+        / BOARD_ALIGN * BOARD_ALIGN;
+}
+
+
+/* Map the board in the file at path.
+ *
+ * If create is true, create the board with the size parameters specified
+ * if the file doesn't exist or is empty. If the file contains a board, its
+ * size parameters are used.
+ *
+ * Return 0 in case of success, else -1 and set a Python exception.
+ */
+static int
+board_open(board_map *map, const char *path, bool create,
+           uint32_t nslots, uint32_t title_size)
+{
+    board_header *header;
+    struct stat st;
+    size_t size;
+    int fd, rv = -1;
+
+    fd = open(path, O_RDWR | O_CLOEXEC | (create ? O_CREAT : 0), 0666);
+    if (fd < 0) {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+        return -1;
+    }
+
+    /* Make sure only one process initializes a new file */
+    if (0 > flock(fd, LOCK_EX) || 0 > fstat(fd, &st)) {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+        goto exit;
+    }
+
+    if (st.st_size == 0 && create) {
+        size = BOARD_HEADER_SIZE + nslots * board_slot_size(title_size);
+        if (0 > ftruncate(fd, (off_t)size)) {
+            PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+            goto exit;
+        }
+    }
+    else if ((size_t)st.st_size < BOARD_HEADER_SIZE) {
+        PyErr_Format(PyExc_ValueError, "not a status board: '%s'", path);
+        goto exit;
+    }
+    else {
+        size = (size_t)st.st_size;
+    }
+
+    header = mmap(NULL, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    if (header == MAP_FAILED) {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+        goto exit;
+    }
+
+    if (st.st_size == 0) {
+        header->nslots = nslots;
+        header->title_size = title_size;
+        memcpy(header->magic, BOARD_MAGIC, sizeof(header->magic));
+    }
+    else if (0 != memcmp(header->magic, BOARD_MAGIC, sizeof(header->magic))
+            || size < BOARD_HEADER_SIZE
+                + header->nslots * board_slot_size(header->title_size)) {
+        munmap(header, size);
+        PyErr_Format(PyExc_ValueError, "not a status board: '%s'", path);
+        goto exit;
+    }
+
+    map->header = header;
+    map->size = size;
+    map->slot_size = board_slot_size(header->title_size);
+    rv = 0;
+
+exit:
+    /* The mapping keeps the file open: closing it doesn't release the lock */
+    flock(fd, LOCK_UN);
+    close(fd);
+    return rv;
+}
+
+
+static void
+board_close(board_map *map)
+{
+    if (map->header) {
+        munmap(map->header, map->size);
+        map->header = NULL;
+    }
+}
+
+
+static bool
+pid_alive(pid_t pid)
+{
+    return !(kill(pid, 0) < 0 && errno == ESRCH);
+}
+
+
+/* Find a free slot for the current process.
+ *
+ * Slots of processes no more running are reused. Return NULL if all the
+ * slots are taken.
+ */
+static board_slot *
+board_claim_slot(board_map *map)
+{
+    int32_t pid = (int32_t)getpid();
+    int32_t other;
+    board_slot *slot;
+    uint32_t i, seq;
+
+    for (i = 0; i < map->header->nslots; i++) {
+        slot = BOARD_SLOT(map, i);
+        other = __atomic_load_n(&slot->pid, __ATOMIC_RELAXED);
+        if (other == pid) {
+            return slot;
+        }
+        if (other != 0 && pid_alive(other)) {
+            continue;
+        }
+        if (__atomic_compare_exchange_n(&slot->pid, &other, pid,
+                false, __ATOMIC_ACQ_REL, __ATOMIC_RELAXED)) {
+            /* The previous owner might have died in the middle of a write */
+            seq = __atomic_load_n(&slot->seq, __ATOMIC_RELAXED);
+            if (seq & 1) {
+                __atomic_store_n(&slot->seq, seq + 1, __ATOMIC_RELEASE);
+            }
+            return slot;
+        }
+    }
+
+    return NULL;
+}
+
+
+static void
+board_release_slot(void)
+{
+    if (board_own_slot) {
+        __atomic_store_n(&board_own_slot->pid, 0, __ATOMIC_RELEASE);
+        board_own_slot = NULL;
+    }
+}
+
+
+/* Leave the parent slot to the parent, the child will claim its own. */
+static void
+board_atfork_child(void)
+{
+    board_own_slot = NULL;
+}
+
+
+/* Release the process slot at exit. */
+static void
+board_atexit(void)
+{
+    board_release_slot();
+}
+
+
+static void
+board_wake_waiters(board_header *header)
+{
+    __atomic_add_fetch(&header->changes, 1, __ATOMIC_RELEASE);
+    if (__atomic_load_n(&header->waiters, __ATOMIC_ACQUIRE)) {
+#ifdef __linux__
+        syscall(SYS_futex, &header->changes, FUTEX_WAKE, INT32_MAX,
+            NULL, NULL, 0);
+#endif
+    }
+}
+
+
+/* Copy a title into the process slot, if the board is enabled. */
+void
+spt_board_publish(const char *title, size_t len)
+{
+    board_slot *slot;
+    struct timespec ts;
+    uint32_t seq;
+
+    if (!board.header) {
+        return;
+    }
+    if (!board_own_slot) {
+        if (!(board_own_slot = board_claim_slot(&board))) {
+            return;     /* board full */
+        }
+    }
+    slot = board_own_slot;
+
+    if (len > board.header->title_size) {
+        len = board.header->title_size;
+    }
+    clock_gettime(CLOCK_REALTIME, &ts);
+
+    seq = __atomic_load_n(&slot->seq, __ATOMIC_RELAXED);
+    __atomic_store_n(&slot->seq, seq + 1, __ATOMIC_RELAXED);
+    __atomic_thread_fence(__ATOMIC_RELEASE);
+
+    memcpy(slot->title, title, len);
+    slot->len = (uint32_t)len;
+    slot->timestamp = (int64_t)ts.tv_sec * 1000000000LL + ts.tv_nsec;
+
+    __atomic_store_n(&slot->seq, seq + 2, __ATOMIC_RELEASE);
+
+    board_wake_waiters(board.header);
+}
+
+
+/* Start publishing the titles of the process into the board at path.
+ *
+ * Return 0 in case of success, else -1 and set a Python exception.
+ */
+int
+spt_board_enable(const char *path, long nslots, long title_size)
+{
+    static bool handlers_registered = false;
+    board_map map = {NULL, 0, 0};
+    const char *title;
+    size_t len;
+    int err;
+
+    if (nslots <= 0 || nslots > 1000000) {
+        PyErr_SetString(PyExc_ValueError,
+            "nslots must be between 1 and 1000000");
+        return -1;
+    }
+    if (title_size <= 0 || title_size > 65536) {
+        PyErr_SetString(PyExc_ValueError,
+            "title_size must be between 1 and 65536");
+        return -1;
+    }
+
+    if (!handlers_registered) {
+        if (0 != (err = pthread_atfork(NULL, NULL, board_atfork_child))) {
+            errno = err;
+            PyErr_SetFromErrno(PyExc_OSError);
+            return -1;
+        }
+        if (0 != atexit(board_atexit)) {
+            PyErr_SetString(PyExc_RuntimeError,
+                "failed to register the board cleanup at exit");
+            return -1;
+        }
+        handlers_registered = true;
+    }
+
+    if (0 > board_open(&map, path, true,
+            (uint32_t)nslots, (uint32_t)title_size)) {
+        return -1;
+    }
+
+    spt_board_disable();
+    board = map;
+    if (!(board_own_slot = board_claim_slot(&board))) {
+        board_close(&board);
+        PyErr_Format(PyExc_RuntimeError, "status board full: '%s'", path);
+        return -1;
+    }
+
+    /* Publish the current title */
+    title = get_ps_title(&len);
+    spt_board_publish(title, len);
+    spt_debug("status board enabled: %s", path);
+
+    return 0;
+}
+
+
+/* Stop publishing the titles and free the process slot. */
+void
+spt_board_disable(void)
+{
+    if (!board.header) {
+        return;
+    }
+    board_release_slot();
+    board_wake_waiters(board.header);
+    board_close(&board);
+}
+
+
+/* The StatusBoard type, reading a board */
+
+typedef struct {
+    PyObject_HEAD
+    board_map map;
+    uint32_t changes;           /* seen at the last snapshot */
+} spt_StatusBoard;
+
+
+/* Read a slot without tearing it.
+ *
+ * Return SLOT_FREE if the slot is free, SLOT_TORN if it was being written
+ * for too long, and only its pid is valid, else SLOT_READ. Call it holding
+ * the GIL: it is released while waiting for the writer.
+ */
+static int
+board_read_slot(board_map *map, board_slot *slot, board_slot *out)
+{
+    PyThreadState *tstate = NULL;
+    uint32_t seq;
+    int attempt, rv = SLOT_READ;
+
+    for (attempt = 0;; attempt++) {
+        seq = __atomic_load_n(&slot->seq, __ATOMIC_ACQUIRE);
+        if (!(seq & 1)) {
+            out->pid = __atomic_load_n(&slot->pid, __ATOMIC_RELAXED);
+            out->len = __atomic_load_n(&slot->len, __ATOMIC_RELAXED);
+            out->timestamp = slot->timestamp;
+            if (out->len > map->header->title_size) {
+                out->len = map->header->title_size;
+            }
+            memcpy(out->title, slot->title, out->len);
+            __atomic_thread_fence(__ATOMIC_ACQUIRE);
+            if (seq == __atomic_load_n(&slot->seq, __ATOMIC_RELAXED)) {
+                break;
+            }
+        }
+
+        /* A write is in progress */
+        if (attempt >= READ_ATTEMPTS) {
+            out->pid = __atomic_load_n(&slot->pid, __ATOMIC_RELAXED);
+            rv = SLOT_TORN;
+            break;
+        }
+        if (!tstate) {
+            tstate = PyEval_SaveThread();
+        }
+        if (attempt < READ_YIELDS) {
+            sched_yield();
+        }
+        else {
+            usleep(1000);
+        }
+    }
+    if (tstate) {
+        PyEval_RestoreThread(tstate);
+    }
+    out->seq = seq;
+
+    return out->pid != 0 ? rv : SLOT_FREE;
+}
+
+
+static int
+board_init(spt_StatusBoard *self, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"path", NULL};
+    PyObject *path;
+    int rv;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O&", kwlist,
+            PyUnicode_FSConverter, &path)) {
+        return -1;
+    }
+
+    board_close(&self->map);
+    rv = board_open(&self->map, PyBytes_AS_STRING(path), false, 0, 0);
+    Py_DECREF(path);
+    if (rv < 0) {
+        return -1;
+    }
+    self->changes = __atomic_load_n(
+        &self->map.header->changes, __ATOMIC_ACQUIRE);
+
+    return 0;
+}
+
+
+static void
+board_dealloc(spt_StatusBoard *self)
+{
+    PyTypeObject *tp = Py_TYPE(self);
+
+    board_close(&self->map);
+    tp->tp_free((PyObject *)self);
+    Py_DECREF(tp);
+}
+
+
+static int
+board_check_open(spt_StatusBoard *self)
+{
+    if (!self->map.header) {
+        PyErr_SetString(PyExc_ValueError, "the status board is closed");
+        return -1;
+    }
+    return 0;
+}
+
+
+static char board_snapshot__doc__[] =
+"snapshot() -- Return the titles in the board.\n\n"
+"Return a list of (pid, title, timestamp, seq) tuples for the slots of the\n"
+"running processes. timestamp is the time of the last update, as in\n"
+"time.time(); seq changes at every update of the slot. title and timestamp\n"
+"are None if the slot could not be read, as its process was stuck while\n"
+"writing it. The slots left by processes no more running are skipped."
+;
+
+static PyObject *
+board_snapshot(spt_StatusBoard *self, PyObject *args)
+{
+    board_slot *slot = NULL;
+    PyObject *rv = NULL, *item;
+    uint32_t i;
+    int32_t pid;
+    int state;
+
+    if (0 > board_check_open(self)) {
+        return NULL;
+    }
+    if (!(slot = PyMem_Malloc(self->map.slot_size))) {
+        return PyErr_NoMemory();
+    }
+    if (!(rv = PyList_New(0))) {
+        goto exit;
+    }
+
+    self->changes = __atomic_load_n(
+        &self->map.header->changes, __ATOMIC_ACQUIRE);
+
+    for (i = 0; i < self->map.header->nslots; i++) {
+        /* Don't wait for the slots of the processes exited without freeing
+         * them, e.g. via os._exit(), or killed while writing. */
+        pid = __atomic_load_n(
+            &BOARD_SLOT(&self->map, i)->pid, __ATOMIC_RELAXED);
+        if (pid == 0 || !pid_alive(pid)) {
+            continue;
+        }
+        state = board_read_slot(&self->map, BOARD_SLOT(&self->map, i), slot);
+        if (state == SLOT_FREE) {
+            continue;
+        }
+        if (slot->pid != pid && !pid_alive(slot->pid)) {
+            continue;
+        }
+        if (state == SLOT_TORN) {
+            item = Py_BuildValue("(iOOk)", (int)slot->pid,
+                Py_None, Py_None, (unsigned long)slot->seq);
+        }
+        else {
+            item = Py_BuildValue("(iNdk)",
+                (int)slot->pid,
+                PyUnicode_DecodeUTF8(
+                    slot->title, (Py_ssize_t)slot->len, "replace"),
+                (double)slot->timestamp / 1e9,
+                (unsigned long)slot->seq);
+        }
+        if (!item || 0 > PyList_Append(rv, item)) {
+            Py_XDECREF(item);
+            Py_CLEAR(rv);
+            goto exit;
+        }
+        Py_DECREF(item);
+    }
+
+exit:
+    PyMem_Free(slot);
+    return rv;
+}
+
+
+/* Wait until the changes counter is different from the one seen, for at
+ * most timeout_ms milliseconds. */
+static void
+board_wait_changes(board_header *header, uint32_t seen, long timeout_ms)
+{
+#ifdef __linux__
+    struct timespec ts;
+
+    ts.tv_sec = timeout_ms / 1000;
+    ts.tv_nsec = (timeout_ms % 1000) * 1000000L;
+    __atomic_add_fetch(&header->waiters, 1, __ATOMIC_ACQ_REL);
+    syscall(SYS_futex, &header->changes, FUTEX_WAIT, seen, &ts, NULL, 0);
+    __atomic_sub_fetch(&header->waiters, 1, __ATOMIC_ACQ_REL);
+#else
+    long ms;
+
+    /* Poll the counter */
+    for (ms = 0; ms < timeout_ms; ms++) {
+        if (seen != __atomic_load_n(&header->changes, __ATOMIC_ACQUIRE)) {
+            break;
+        }
+        usleep(1000);
+    }
+#endif
+}
+
+
+static char board_wait__doc__[] =
+"wait(timeout=None) -- Wait for a title change.\n\n"
+"Wait until a title is published after the last snapshot() call, for at\n"
+"most timeout seconds. Return True if a title changed, False on timeout."
+;
+
+static PyObject *
+board_wait(spt_StatusBoard *self, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"timeout", NULL};
+    PyObject *timeout = Py_None;
+    double seconds = -1.0;
+    struct timespec start, now;
+    long elapsed, step;
+    board_header *header;
+    bool changed;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|O", kwlist, &timeout)) {
+        return NULL;
+    }
+    if (timeout != Py_None) {
+        if (-1.0 == (seconds = PyFloat_AsDouble(timeout)) && PyErr_Occurred()) {
+            return NULL;
+        }
+        if (seconds < 0) {
+            PyErr_SetString(PyExc_ValueError, "timeout must be non-negative");
+            return NULL;
+        }
+    }
+    if (0 > board_check_open(self)) {
+        return NULL;
+    }
+
+    header = self->map.header;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    for (;;) {
+        if (self->changes != __atomic_load_n(
+                &header->changes, __ATOMIC_ACQUIRE)) {
+            changed = true;
+            break;
+        }
+
+        clock_gettime(CLOCK_MONOTONIC, &now);
+        elapsed = (long)(now.tv_sec - start.tv_sec) * 1000L
+            + (now.tv_nsec - start.tv_nsec) / 1000000L;
+        if (seconds >= 0 && elapsed >= seconds * 1000) {
+            changed = false;
+            break;
+        }
+
+        /* Wake up periodically to check for signals */
+        step = WAIT_STEP_MS;
+        if (seconds >= 0 && seconds * 1000 - elapsed < step) {
+            step = (long)(seconds * 1000 - elapsed) + 1;
+        }
+        Py_BEGIN_ALLOW_THREADS
+        board_wait_changes(header, self->changes, step);
+        Py_END_ALLOW_THREADS
+
+        if (0 > PyErr_CheckSignals()) {
+            return NULL;
+        }
+    }
+
+    return PyBool_FromLong(changed);
+}
+
+
+static char board_close__doc__[] =
+"close() -- Unmap the status board."
+;
+
+static PyObject *
+board_close_method(spt_StatusBoard *self, PyObject *args)
+{
+    board_close(&self->map);
+    Py_RETURN_NONE;
+}
+
+
+static PyObject *
+board_enter(spt_StatusBoard *self, PyObject *args)
+{
+    if (0 > board_check_open(self)) {
+        return NULL;
+    }
+    Py_INCREF(self);
+    return (PyObject *)self;
+}
+
+
+static PyObject *
+board_exit(spt_StatusBoard *self, PyObject *args)
+{
+    board_close(&self->map);
+    Py_RETURN_NONE;
+}
+
+
+static PyObject *
+board_get_nslots(spt_StatusBoard *self, void *closure)
+{
+    if (0 > board_check_open(self)) {
+        return NULL;
+    }
+    return PyLong_FromUnsignedLong(self->map.header->nslots);
+}
+
+
+static PyMethodDef board_methods[] = {
+    {"snapshot",
+        (PyCFunction)board_snapshot,
+        METH_NOARGS,
+        board_snapshot__doc__},
+
+    {"wait",
+        (PyCFunction)(void(*)(void))board_wait,
+        METH_VARARGS|METH_KEYWORDS,
+        board_wait__doc__},
+
+    {"close",
+        (PyCFunction)board_close_method,
+        METH_NOARGS,
+        board_close__doc__},
+
+    {"__enter__", (PyCFunction)board_enter, METH_NOARGS, NULL},
+    {"__exit__", (PyCFunction)board_exit, METH_VARARGS, NULL},
+
+    {NULL, NULL, 0, NULL}
+};
+
+static PyGetSetDef board_getset[] = {
+    {"nslots", (getter)board_get_nslots, NULL,
+        "The number of slots in the board.", NULL},
+    {NULL, NULL, NULL, NULL, NULL}
+};
+
+static char board__doc__[] =
+"StatusBoard(path) -- Read the titles published in a status board.\n\n"
+"The board must have been created by enable_board()."
+;
+
+static PyType_Slot board_slots[] = {
+    {Py_tp_doc, board__doc__},
+    {Py_tp_init, board_init},
+    {Py_tp_dealloc, board_dealloc},
+    {Py_tp_methods, board_methods},
+    {Py_tp_getset, board_getset},
+    {0, NULL}
+};
+
+static PyType_Spec board_spec = {
+    "setproctitle.StatusBoard",
+    sizeof(spt_StatusBoard),
+    0,
+    Py_TPFLAGS_DEFAULT,
+    board_slots
+};
+
+
+/* Return a new reference to the StatusBoard type for a module instance. */
+PyObject *
+spt_board_type_new(void)
+{
+    return PyType_FromSpec(&board_spec);
+}
+
+#else   /* WIN32 */
+
+void
+spt_board_publish(const char *title, size_t len)
+{
+}
+
+int
+spt_board_enable(const char *path, long nslots, long title_size)
+{
+    PyErr_SetString(PyExc_NotImplementedError,
+        "the status board is not available on this platform");
+    return -1;
+}
+
+void
+spt_board_disable(void)
+{
+}
+
+static int
+board_init(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+    PyErr_SetString(PyExc_NotImplementedError,
+        "the status board is not available on this platform");
+    return -1;
+}
+
+static PyType_Slot board_slots[] = {
+    {Py_tp_init, board_init},
+    {0, NULL}
+};
+
+static PyType_Spec board_spec = {
+    "setproctitle.StatusBoard",
+    sizeof(PyObject),
+    0,
+    Py_TPFLAGS_DEFAULT,
+    board_slots
+};
+
+PyObject *
+spt_board_type_new(void)
+{
+    return PyType_FromSpec(&board_spec);
+}
+
+#endif  /* WIN32 */
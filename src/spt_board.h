@@ -0,0 +1,24 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_board.h
+ *    Process titles published in a shared memory status board.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#ifndef SPT_BOARD_H
+#define SPT_BOARD_H
+
+#include "spt.h"
+
+HIDDEN void spt_board_publish(const char *title, size_t len);
+
+HIDDEN int spt_board_enable(const char *path, long nslots, long title_size);
+
+HIDDEN void spt_board_disable(void);
+
+HIDDEN PyObject *spt_board_type_new(void);
+
+#endif   /* SPT_BOARD_H */
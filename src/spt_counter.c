@@ -0,0 +1,410 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_counter.c
+ *    Numeric field updated in place in the process title.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ * A Counter is a title template containing a "{}" placeholder, replaced by
+ * a number. Once the title is displayed, changing the number only rewrites
+ * its digits in the ps display: the rest of the title is not copied again.
+ *
+ * If the number of digits changes, the entire title is written again: use
+ * a width large enough for the values expected to avoid it.
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#include "spt_counter.h"
+#include "spt_args.h"
+#include "spt_setup.h"
+#include "spt_status.h"
+#include "spt_writer.h"
+
+#include <limits.h>
+#include <string.h>
+
+/* The largest width accepted, to keep the digits in a stack buffer. It must
+ * be larger than the 20 chars of the longest long long. */
+#define MAX_WIDTH 64
+
+typedef struct {
+    PyObject_HEAD
+    char *title;                /* the title rendered, without terminator */
+    size_t len;                 /* length of the title */
+    size_t slot;                /* offset of the digits in the title */
+    size_t ndigits;             /* length of the digits in the title */
+    size_t width;               /* min length of the digits */
+    long long value;
+    unsigned long long generation;  /* of the title shown; 0 if not shown */
+    size_t offset;              /* offset of the digits in the ps display */
+} spt_Counter;
+
+
+/* Render the value into the end of buf, padded to width.
+ *
+ * Return the pointer to the first char; store the length in *len.
+ */
+static char *
+render_value(spt_Counter *self, char *buf, size_t bufsize, size_t *len)
+{
+    char *p = buf + bufsize;
+    unsigned long long n;
+
+    n = self->value < 0
+        ? 0ULL - (unsigned long long)self->value
+        : (unsigned long long)self->value;
+    do {
+        *--p = '0' + (char)(n % 10);
+        n /= 10;
+    } while (n);
+    if (self->value < 0) {
+        *--p = '-';
+    }
+    while ((size_t)(buf + bufsize - p) < self->width) {
+        *--p = ' ';
+    }
+
+    *len = (size_t)(buf + bufsize - p);
+    return p;
+}
+
+
+/* Write the entire title in the ps display and take note of where the
+ * digits ended up. */
+static void
+show_title(spt_Counter *self, const char *digits, size_t ndigits)
+{
+    size_t tlen, dlen;
+
+    /* Make room for the digits, if their length changed */
+    if (ndigits != self->ndigits) {
+        memmove(self->title + self->slot + ndigits,
+            self->title + self->slot + self->ndigits,
+            self->len - self->slot - self->ndigits);
+        self->len = self->len - self->ndigits + ndigits;
+        self->ndigits = ndigits;
+    }
+    memcpy(self->title + self->slot, digits, ndigits);
+
+    spt_writer_lock();
+    reserve_ps_display_len(self->len);
+    set_ps_display_len(self->title, self->len, true);
+
+    /* The title is displayed after the prefix, if any */
+    get_ps_title(&tlen);
+    get_ps_display(&dlen);
+    self->offset = tlen - dlen + self->slot;
+
+    /* Only update the digits in place if they are entirely visible */
+    self->generation = self->offset + ndigits <= tlen
+        ? get_ps_display_generation() : 0;
+    spt_writer_unlock();
+}
+
+
+/* Show the current value in the title, if the title is displayed. */
+static void
+update_value(spt_Counter *self)
+{
+    char buf[MAX_WIDTH];
+    char *digits;
+    size_t ndigits;
+
+    if (!self->generation) {
+        return;
+    }
+
+    digits = render_value(self, buf, sizeof(buf), &ndigits);
+
+    if (ndigits == self->ndigits) {
+        spt_writer_lock();
+        self->generation = overwrite_ps_display(
+            self->generation, self->offset, digits, ndigits);
+        spt_writer_unlock();
+        if (self->generation) {
+            memcpy(self->title + self->slot, digits, ndigits);
+        }
+    }
+    else if (self->generation == get_ps_display_generation()) {
+        show_title(self, digits, ndigits);
+    }
+    else {
+        self->generation = 0;
+    }
+}
+
+
+/* Return the position of the "{}" placeholder in the template, or -1 if
+ * there isn't exactly one. */
+static Py_ssize_t
+find_placeholder(const char *template, Py_ssize_t len)
+{
+    Py_ssize_t i, rv = -1;
+
+    for (i = 0; i + 1 < len; i++) {
+        if (template[i] == '{' && template[i + 1] == '}') {
+            if (rv >= 0) {
+                return -1;
+            }
+            rv = i;
+        }
+    }
+
+    return rv;
+}
+
+
+static int
+counter_init(spt_Counter *self, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"template", "value", "width", NULL};
+    PyObject *obj;
+    spt_title_arg template;
+    Py_ssize_t slot;
+    long long value = 0;
+    Py_ssize_t width = 0;
+    char buf[MAX_WIDTH];
+    char *digits;
+    size_t ndigits;
+    int rv = -1;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|Ln", kwlist,
+            &obj, &value, &width)) {
+        return -1;
+    }
+    if (width < 0 || width > MAX_WIDTH) {
+        PyErr_Format(PyExc_ValueError,
+            "width must be between 0 and %d", MAX_WIDTH);
+        return -1;
+    }
+    if (0 > spt_title_from_object(obj, "template", &template)) {
+        return -1;
+    }
+    if (0 > (slot = find_placeholder(template.data, template.len))) {
+        PyErr_SetString(PyExc_ValueError,
+            "template must contain exactly one '{}' placeholder");
+        goto exit;
+    }
+
+    self->value = value;
+    self->width = (size_t)width;
+    digits = render_value(self, buf, sizeof(buf), &ndigits);
+
+    /* Leave room for the widest value */
+    PyMem_Free(self->title);
+    if (!(self->title = PyMem_Malloc(template.len - 2 + MAX_WIDTH))) {
+        PyErr_NoMemory();
+        goto exit;
+    }
+    self->slot = (size_t)slot;
+    self->ndigits = ndigits;
+    self->len = template.len - 2 + ndigits;
+    memcpy(self->title, template.data, self->slot);
+    memcpy(self->title + self->slot, digits, ndigits);
+    memcpy(self->title + self->slot + ndigits, template.data + slot + 2,
+        template.len - slot - 2);
+    self->generation = 0;
+    rv = 0;
+
+exit:
+    spt_title_release(&template);
+    return rv;
+}
+
+
+static void
+counter_dealloc(spt_Counter *self)
+{
+    PyTypeObject *tp = Py_TYPE(self);
+
+    PyMem_Free(self->title);
+    tp->tp_free((PyObject *)self);
+    Py_DECREF(tp);
+}
+
+
+static char counter_apply__doc__[] =
+"apply() -- Set the process title to the counter title.\n\n"
+"The title is displayed after the prefix set by set_title_prefix(), if any."
+;
+
+static PyObject *
+counter_apply(spt_Counter *self, PyObject *args)
+{
+    char buf[MAX_WIDTH];
+    char *digits;
+    size_t ndigits;
+
+    if (!self->title) {
+        PyErr_SetString(PyExc_ValueError, "counter not initialized");
+        return NULL;
+    }
+
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    Py_BEGIN_CRITICAL_SECTION(self);
+    digits = render_value(self, buf, sizeof(buf), &ndigits);
+    show_title(self, digits, ndigits);
+    Py_END_CRITICAL_SECTION();
+
+    Py_RETURN_NONE;
+}
+
+
+static char counter_increment__doc__[] =
+"increment(n=1) -- Add n to the counter value.\n\n"
+"If the counter title is displayed, only its digits are updated."
+;
+
+static PyObject *
+counter_increment(spt_Counter *self,
+    PyObject *const *args, Py_ssize_t nargs)
+{
+    long long n = 1;
+    int overflow = 0;
+
+    if (nargs > 1) {
+        PyErr_Format(PyExc_TypeError,
+            "increment() takes at most 1 argument (%zd given)", nargs);
+        return NULL;
+    }
+    if (nargs == 1) {
+        n = PyLong_AsLongLong(args[0]);
+        if (n == -1 && PyErr_Occurred()) {
+            return NULL;
+        }
+    }
+
+    Py_BEGIN_CRITICAL_SECTION(self);
+    if ((n > 0 && self->value > LLONG_MAX - n)
+            || (n < 0 && self->value < LLONG_MIN - n)) {
+        overflow = 1;
+    }
+    else {
+        self->value += n;
+        update_value(self);
+    }
+    Py_END_CRITICAL_SECTION();
+
+    if (overflow) {
+        PyErr_SetString(PyExc_OverflowError, "counter value out of range");
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
+
+static char counter_set_value__doc__[] =
+"set_value(value) -- Set the counter value.\n\n"
+"If the counter title is displayed, only its digits are updated."
+;
+
+static PyObject *
+counter_set_value(spt_Counter *self, PyObject *arg)
+{
+    long long value;
+
+    value = PyLong_AsLongLong(arg);
+    if (value == -1 && PyErr_Occurred()) {
+        return NULL;
+    }
+
+    Py_BEGIN_CRITICAL_SECTION(self);
+    self->value = value;
+    update_value(self);
+    Py_END_CRITICAL_SECTION();
+
+    Py_RETURN_NONE;
+}
+
+
+static PyObject *
+counter_get_value(spt_Counter *self, void *closure)
+{
+    long long value;
+
+    Py_BEGIN_CRITICAL_SECTION(self);
+    value = self->value;
+    Py_END_CRITICAL_SECTION();
+
+    return PyLong_FromLongLong(value);
+}
+
+
+static PyObject *
+counter_get_shown(spt_Counter *self, void *closure)
+{
+    bool shown;
+
+    Py_BEGIN_CRITICAL_SECTION(self);
+    shown = self->generation && self->generation == get_ps_display_generation();
+    Py_END_CRITICAL_SECTION();
+
+    return PyBool_FromLong(shown);
+}
+
+
+static PyMethodDef counter_methods[] = {
+    {"apply",
+        (PyCFunction)counter_apply,
+        METH_NOARGS,
+        counter_apply__doc__},
+
+    {"increment",
+        (PyCFunction)(void(*)(void))counter_increment,
+        METH_FASTCALL,
+        counter_increment__doc__},
+
+    {"set_value",
+        (PyCFunction)counter_set_value,
+        METH_O,
+        counter_set_value__doc__},
+
+    {NULL, NULL, 0, NULL}
+};
+
+static PyGetSetDef counter_getset[] = {
+    {"value", (getter)counter_get_value, NULL,
+        "The current value of the counter.", NULL},
+    {"shown", (getter)counter_get_shown, NULL,
+        "True if the counter title is the current process title.", NULL},
+    {NULL, NULL, NULL, NULL, NULL}
+};
+
+static char counter__doc__[] =
+"Counter(template, value=0, width=0) -- A number shown in the title.\n\n"
+"template is a str or bytes-like object and must contain a '{}'\n"
+"placeholder, replaced by the value, padded\n"
+"with spaces to width chars. Call apply() to display the title: afterwards\n"
+"increment() and set_value() only update the digits in the title, until\n"
+"the process title is changed in other ways."
+;
+
+static PyType_Slot counter_slots[] = {
+    {Py_tp_doc, counter__doc__},
+    {Py_tp_init, counter_init},
+    {Py_tp_dealloc, counter_dealloc},
+    {Py_tp_methods, counter_methods},
+    {Py_tp_getset, counter_getset},
+    {0, NULL}
+};
+
+static PyType_Spec counter_spec = {
+    "setproctitle.Counter",
+    sizeof(spt_Counter),
+    0,
+    Py_TPFLAGS_DEFAULT,
+    counter_slots
+};
+
+
+/* Return a new reference to the Counter type for a module instance. */
+PyObject *
+spt_counter_type_new(void)
+{
+    return PyType_FromSpec(&counter_spec);
+}
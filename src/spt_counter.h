@@ -0,0 +1,18 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_counter.h
+ *    Numeric field updated in place in the process title.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#ifndef SPT_COUNTER_H
+#define SPT_COUNTER_H
+
+#include "spt.h"
+
+HIDDEN PyObject *spt_counter_type_new(void);
+
+#endif   /* SPT_COUNTER_H */
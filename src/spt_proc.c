@@ -0,0 +1,428 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_proc.c
+ *    Access to the /proc filesystem.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ * The functions read many small files: they use the *at() syscalls relative
+ * to a single directory descriptor, and fixed buffers, to keep the cost of
+ * every file to an open(), a read() and a close().
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#include "spt.h"
+#include "spt_proc.h"
+
+#include <errno.h>
+
+#ifdef __linux__
+
+#include <dirent.h>
+#include <fcntl.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+/* Large enough for a thread name, which is at most 15 chars */
+#define COMM_BUFSIZE 64
+
+
+/*
+ * Open the directory containing the threads of the current process.
+ *
+ * Return the directory descriptor, or -1 with errno set.
+ */
+int
+spt_proc_open_threads(void)
+{
+    return open("/proc/self/task", O_RDONLY | O_DIRECTORY | O_CLOEXEC);
+}
+
+
+/*
+ * Close a descriptor returned by the spt_proc_open*() functions.
+ */
+void
+spt_proc_close(int dfd)
+{
+    close(dfd);
+}
+
+
+/*
+ * Call cb for every thread of the current process, passing the thread id
+ * and the thread name, as read in /proc/self/task/TID/comm.
+ *
+ * Threads terminated during the iteration are skipped.
+ *
+ * Return 0 on success, the value returned by the callback if < 0, or -1
+ * with errno set if /proc/self/task can't be read.
+ */
+int
+spt_proc_iter_threads(spt_thread_cb cb, void *arg)
+{
+    DIR *dir;
+    struct dirent *ent;
+    char path[32];
+    char buf[COMM_BUFSIZE];
+    int dfd, fd, rv = 0;
+    ssize_t n;
+    char *end;
+    long tid;
+
+    if (0 > (dfd = spt_proc_open_threads())) {
+        return -1;
+    }
+    if (!(dir = fdopendir(dfd))) {
+        close(dfd);
+        return -1;
+    }
+
+    while ((ent = readdir(dir))) {
+        tid = strtol(ent->d_name, &end, 10);
+        if (*end || tid <= 0) {
+            continue;   /* "." and ".." */
+        }
+
+        snprintf(path, sizeof(path), "%ld/comm", tid);
+        if (0 > (fd = openat(dfd, path, O_RDONLY | O_CLOEXEC))) {
+            continue;   /* thread terminated */
+        }
+        n = read(fd, buf, sizeof(buf));
+        close(fd);
+        if (n < 0) {
+            continue;
+        }
+
+        /* drop the newline added by the kernel */
+        while (n > 0 && (buf[n - 1] == '\n' || buf[n - 1] == '\0')) {
+            n--;
+        }
+
+        if (0 > (rv = cb(tid, buf, (size_t)n, arg))) {
+            break;
+        }
+        rv = 0;
+    }
+
+    closedir(dir);      /* closes dfd too */
+    return rv;
+}
+
+
+/*
+ * Set the name of a thread of the current process, writing the
+ * /proc/self/task/TID/comm file relative to the directory descriptor
+ * returned by spt_proc_open_threads().
+ *
+ * The kernel truncates the name to 15 chars.
+ *
+ * Return 0 on success, or -1 with errno set. errno is ESRCH if the thread
+ * doesn't exist.
+ */
+int
+spt_proc_set_thread_name(int dfd, long tid, const char *name, size_t len)
+{
+    char path[32];
+    int fd, rv = 0;
+
+    snprintf(path, sizeof(path), "%ld/comm", tid);
+    if (0 > (fd = openat(dfd, path, O_WRONLY | O_CLOEXEC))) {
+        if (errno == ENOENT) {
+            errno = ESRCH;
+        }
+        return -1;
+    }
+    if (0 > write(fd, name, len)) {
+        rv = -1;
+    }
+    close(fd);
+
+    return rv;
+}
+
+
+/*
+ * Read the content of the file at path, relative to dfd, into buf.
+ *
+ * Return 0 on success, or -1 with errno set.
+ */
+static int
+read_file(int dfd, const char *path, spt_proc_buffer *buf)
+{
+    char *data;
+    ssize_t n;
+    int fd;
+
+    if (0 > (fd = openat(dfd, path, O_RDONLY | O_CLOEXEC))) {
+        return -1;
+    }
+
+    buf->len = 0;
+    for (;;) {
+        if (buf->len == buf->size) {
+            if (!(data = realloc(buf->data, buf->size ? buf->size * 2 : 4096))) {
+                close(fd);
+                errno = ENOMEM;
+                return -1;
+            }
+            buf->data = data;
+            buf->size = buf->size ? buf->size * 2 : 4096;
+        }
+        n = read(fd, buf->data + buf->len, buf->size - buf->len);
+        if (n < 0) {
+            close(fd);
+            return -1;
+        }
+        if (n == 0) {
+            break;
+        }
+        buf->len += (size_t)n;
+    }
+
+    close(fd);
+    return 0;
+}
+
+
+void
+spt_proc_buffer_free(spt_proc_buffer *buf)
+{
+    free(buf->data);
+    buf->data = NULL;
+    buf->size = buf->len = 0;
+}
+
+
+/*
+ * Open the /proc directory, to read the titles of the processes.
+ *
+ * Return the directory descriptor, or -1 with errno set.
+ */
+int
+spt_proc_open(void)
+{
+    return open("/proc", O_RDONLY | O_DIRECTORY | O_CLOEXEC);
+}
+
+
+/*
+ * Read the title and the name of a process into title and comm.
+ *
+ * The title is cleaned up the same way get_ps_display() does: the trailing
+ * padding is removed. The null characters separating the arguments of
+ * processes which didn't change their title are replaced by spaces.
+ *
+ * procfd is the descriptor returned by spt_proc_open(). The buffers are
+ * grown as needed and can be reused across calls.
+ *
+ * Return 0 on success, or -1 with errno set. errno is ESRCH if the process
+ * doesn't exist.
+ */
+int
+spt_proc_read_title(int procfd, long pid,
+                    spt_proc_buffer *title, spt_proc_buffer *comm)
+{
+    char path[32];
+    size_t i;
+
+    snprintf(path, sizeof(path), "%ld/cmdline", pid);
+    if (0 > read_file(procfd, path, title)) {
+        goto error;
+    }
+    snprintf(path, sizeof(path), "%ld/comm", pid);
+    if (0 > read_file(procfd, path, comm)) {
+        goto error;
+    }
+
+    while (title->len > 0 && title->data[title->len - 1] == '\0') {
+        title->len--;
+    }
+    for (i = 0; i < title->len; i++) {
+        if (title->data[i] == '\0') {
+            title->data[i] = ' ';
+        }
+    }
+    while (comm->len > 0 && comm->data[comm->len - 1] == '\n') {
+        comm->len--;
+    }
+
+    return 0;
+
+error:
+    if (errno == ENOENT) {
+        errno = ESRCH;
+    }
+    return -1;
+}
+
+
+/* Call cb with every pid found in the buffer, separated by spaces. */
+static int
+parse_pids(spt_proc_buffer *buf, spt_pid_cb cb, void *arg)
+{
+    size_t i = 0;
+    long pid;
+    int rv;
+
+    while (i < buf->len) {
+        pid = 0;
+        while (i < buf->len && buf->data[i] >= '0' && buf->data[i] <= '9') {
+            pid = pid * 10 + (buf->data[i++] - '0');
+        }
+        if (pid > 0 && 0 > (rv = cb(pid, arg))) {
+            return rv;
+        }
+        while (i < buf->len
+                && !(buf->data[i] >= '0' && buf->data[i] <= '9')) {
+            i++;
+        }
+    }
+
+    return 0;
+}
+
+
+/* Return the parent pid in the content of a /proc/PID/stat file. */
+static long
+parse_ppid(spt_proc_buffer *buf)
+{
+    char *p;
+
+    /* The command name may contain anything: skip to its closing paren */
+    for (p = buf->data + buf->len; p > buf->data && p[-1] != ')'; p--) {}
+
+    /* ") S PPID ..." */
+    if (buf->data + buf->len - p < 4) {
+        return -1;
+    }
+    return strtol(p + 3, NULL, 10);
+}
+
+
+/*
+ * Call cb for every child of the current process.
+ *
+ * Use the /proc/self/task/TID/children files if available, otherwise scan
+ * all the processes looking for the ones with the current parent pid.
+ *
+ * Return 0 on success, the value returned by the callback if < 0, or -1
+ * with errno set.
+ */
+int
+spt_proc_iter_children(spt_pid_cb cb, void *arg)
+{
+    spt_proc_buffer buf = {NULL, 0, 0};
+    DIR *dir = NULL;
+    struct dirent *ent;
+    char path[64];
+    int dfd, rv = 0;
+    bool scan;
+    long pid, self = (long)getpid();
+    char *end;
+
+    /* The file is missing if Linux is built without CONFIG_PROC_CHILDREN */
+    snprintf(path, sizeof(path), "/proc/self/task/%ld/children", self);
+    scan = 0 != access(path, R_OK);
+
+    if (0 > (dfd = scan ? spt_proc_open() : spt_proc_open_threads())) {
+        return -1;
+    }
+    if (!(dir = fdopendir(dfd))) {
+        close(dfd);
+        return -1;
+    }
+
+    while ((ent = readdir(dir))) {
+        pid = strtol(ent->d_name, &end, 10);
+        if (*end || pid <= 0) {
+            continue;
+        }
+
+        if (!scan) {
+            /* Every thread has its own list of children */
+            snprintf(path, sizeof(path), "%ld/children", pid);
+            if (0 > read_file(dfd, path, &buf)) {
+                continue;   /* thread terminated */
+            }
+            if (0 > (rv = parse_pids(&buf, cb, arg))) {
+                break;
+            }
+        }
+        else {
+            /* Look for the processes whose parent is the current process */
+            snprintf(path, sizeof(path), "%ld/stat", pid);
+            if (0 > read_file(dfd, path, &buf)) {
+                continue;   /* process terminated */
+            }
+            if (parse_ppid(&buf) == self && 0 > (rv = cb(pid, arg))) {
+                break;
+            }
+        }
+    }
+
+    closedir(dir);
+    spt_proc_buffer_free(&buf);
+    return rv;
+}
+
+#else   /* !__linux__ */
+
+int
+spt_proc_open_threads(void)
+{
+    errno = ENOSYS;
+    return -1;
+}
+
+void
+spt_proc_close(int dfd)
+{
+}
+
+int
+spt_proc_iter_threads(spt_thread_cb cb, void *arg)
+{
+    errno = ENOSYS;
+    return -1;
+}
+
+int
+spt_proc_set_thread_name(int dfd, long tid, const char *name, size_t len)
+{
+    errno = ENOSYS;
+    return -1;
+}
+
+void
+spt_proc_buffer_free(spt_proc_buffer *buf)
+{
+}
+
+int
+spt_proc_open(void)
+{
+    errno = ENOSYS;
+    return -1;
+}
+
+int
+spt_proc_read_title(int procfd, long pid,
+                    spt_proc_buffer *title, spt_proc_buffer *comm)
+{
+    errno = ENOSYS;
+    return -1;
+}
+
+int
+spt_proc_iter_children(spt_pid_cb cb, void *arg)
+{
+    errno = ENOSYS;
+    return -1;
+}
+
+#endif   /* __linux__ */
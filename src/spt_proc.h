@@ -0,0 +1,49 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_proc.h
+ *    Access to the /proc filesystem.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#ifndef SPT_PROC_H
+#define SPT_PROC_H
+
+#include "c.h"
+
+/* Called for every thread found: return < 0 to stop the iteration */
+typedef int (*spt_thread_cb)(long tid, const char *name, size_t len,
+                             void *arg);
+
+/* Called for every process found: return < 0 to stop the iteration */
+typedef int (*spt_pid_cb)(long pid, void *arg);
+
+/* A buffer to read files into, growing as needed */
+typedef struct spt_proc_buffer {
+    char *data;
+    size_t size;
+    size_t len;
+} spt_proc_buffer;
+
+HIDDEN int spt_proc_open_threads(void);
+
+HIDDEN void spt_proc_close(int dfd);
+
+HIDDEN int spt_proc_iter_threads(spt_thread_cb cb, void *arg);
+
+HIDDEN int spt_proc_set_thread_name(int dfd, long tid, const char *name,
+                                    size_t len);
+
+HIDDEN void spt_proc_buffer_free(spt_proc_buffer *buf);
+
+HIDDEN int spt_proc_open(void);
+
+HIDDEN int spt_proc_read_title(int procfd, long pid,
+                               spt_proc_buffer *title,
+                               spt_proc_buffer *comm);
+
+HIDDEN int spt_proc_iter_children(spt_pid_cb cb, void *arg);
+
+#endif   /* SPT_PROC_H */
@@ -19,6 +19,17 @@
 #define IS_PYPY
 #endif
 
+/* Critical sections are only needed on free-threaded Python, from 3.13 */
+#if PY_VERSION_HEX < 0x030d0000
+#define Py_BEGIN_CRITICAL_SECTION(op) {
+#define Py_END_CRITICAL_SECTION() }
+#endif
+
+/* Public from 3.9 */
+#if PY_VERSION_HEX < 0x03090000
+#define PyInterpreterState_Get _PyInterpreterState_Get
+#endif
+
 #ifndef __darwin__
 /* defined in Modules/main.c but not publically declared */
 void Py_GetArgcArgv(int *argc, wchar_t ***argv);
@@ -12,9 +12,17 @@
 
 #include "spt.h"
 #include "spt_status.h"
+#include "spt_atomic.h"
+#include "spt_writer.h"
 
 #include <string.h>
 
+#ifndef WIN32
+#include <errno.h>
+#include <fcntl.h>
+#include <unistd.h>
+#endif
+
 /* Darwin doesn't export environ */
 #if defined(__darwin__)
 #include <crt_externs.h>
@@ -203,32 +211,14 @@ exit:
 }
 
 
-/* Come on, why is this missing?! this is just cruel!
- * I guess you club seal pups for hobby. */
-PyObject *
-PyFile_FromString(const char *filename, const char *mode)
-{
-    PyObject *io = NULL;
-    PyObject *rv = NULL;
-
-    if (!(io = PyImport_ImportModule("io"))) {
-        spt_debug("failed to import io");
-        goto exit;
-    }
-
-    rv = PyObject_CallMethod(io, "open", "ss", filename, mode);
-
-exit:
-    Py_XDECREF(io);
-    return rv;
-}
-
 /* Read the number of arguments and the first argument from /proc/pid/cmdline
  *
  * Return 0 if found, else -1. Return arg0 in a malloc'd array.
  *
  * If the function fails in a way that shouldn't be ignored, also set
  * a Python exception.
+ *
+ * The file is read with plain C I/O: no Python module is imported.
  */
 static int
 get_args_from_proc(int *argc_o, char **arg0_o)
@@ -237,91 +227,80 @@ get_args_from_proc(int *argc_o, char **arg0_o)
 #define FNLEN 30
     char fn[FNLEN];
 
-    PyObject *os = NULL;
-    PyObject *pid_py = NULL;
-    long pid;
-    PyObject *f = NULL;
-    PyObject *cl = NULL;
-
-    PyObject *tmp = NULL;
+    int fd = -1;
+    char *buf = NULL;
+    size_t size = 4096;
+    size_t len = 0;
+    ssize_t n;
+    size_t i;
     int rv = -1;
 
     spt_debug("looking for args into proc fs");
 
-    /* get the pid from os.getpid() */
-    if (!(os = PyImport_ImportModule("os"))) {
-        spt_debug("failed to import os");
-        goto exit;
-    }
-    if (!(pid_py = PyObject_CallMethod(os, "getpid", NULL))) {
-        spt_debug("calling os.getpid() failed");
-        /* os.getpid() may be not available, so ignore this error. */
-        PyErr_Clear();
-        goto exit;
-    }
-    if (-1 == (pid = PyLong_AsLong(pid_py))) {
-        spt_debug("os.getpid() returned crap?");
-        /* Don't bother to check PyErr_Occurred as pid can't just be -1. */
-        goto exit;
-    }
-
     /* get the content of /proc/PID/cmdline */
-    snprintf(fn, FNLEN, "/proc/%ld/cmdline", pid);
-    if (!(f = PyFile_FromString(fn, "rb"))) {
+    snprintf(fn, FNLEN, "/proc/%ld/cmdline", (long)getpid());
+    if (0 > (fd = open(fn, O_RDONLY))) {
         spt_debug("opening '%s' failed", fn);
         /* That's ok: procfs is easily not available on menomated unices */
-        PyErr_Clear();
         goto exit;
     }
-    /* the file has been open in binary mode, so we get bytes */
-    cl = PyObject_CallMethod(f, "read", NULL);
-    if (!(tmp = PyObject_CallMethod(f, "close", NULL))) {
-        spt_debug("closing failed");
+
+    if (!(buf = (char *)malloc(size))) {
+        PyErr_NoMemory();
+        goto exit;
     }
-    else {
-        Py_DECREF(tmp);
+    for (;;) {
+        /* leave room for a terminator, in case the file doesn't end with 0 */
+        if (len + 1 >= size) {
+            char *newbuf;
+            if (!(newbuf = (char *)realloc(buf, size * 2))) {
+                PyErr_NoMemory();
+                goto exit;
+            }
+            buf = newbuf;
+            size *= 2;
+        }
+        n = read(fd, buf + len, size - len - 1);
+        if (n < 0) {
+            if (errno == EINTR) { continue; }
+            /* could there be some protected environment where a process
+             * cannot read its own pid? Who knows, better not to risk. */
+            spt_debug("reading failed");
+            goto exit;
+        }
+        if (n == 0) {
+            break;
+        }
+        len += (size_t)n;
     }
+    buf[len] = '\0';
 
-    if (!cl) {
-        spt_debug("reading failed");
-        /* could there be some protected environment where a process cannot
-         * read its own pid? Who knows, better not to risk. */
-        PyErr_Clear();
+    if (!len) {
+        spt_debug("'%s' is empty", fn);
         goto exit;
     }
 
     /* the cmdline is a buffer of null-terminated strings. We can strdup it to
      * get a copy of arg0, and count the zeros to get argc */
-    {
-        char *ccl;
-        Py_ssize_t i;
-
-        if (!(ccl = PyBytes_AsString(cl))) {
-            spt_debug("failed to get cmdline string");
-            goto exit;
-        }
-        if (!(*arg0_o = strdup(ccl))) {
-            spt_debug("arg0 strdup failed");
-            PyErr_NoMemory();
-            goto exit;
-        }
-        spt_debug("got argv[0] = '%s' from /proc", *arg0_o);
+    if (!(*arg0_o = strdup(buf))) {
+        spt_debug("arg0 strdup failed");
+        PyErr_NoMemory();
+        goto exit;
+    }
+    spt_debug("got argv[0] = '%s' from /proc", *arg0_o);
 
-        *argc_o = 0;
-        for (i = PyBytes_Size(cl) - 1; i >= 0; --i) {
-            if (ccl[i] == '\0') { (*argc_o)++; }
-        }
-        spt_debug("got argc = %d from /proc", *argc_o);
+    *argc_o = 0;
+    for (i = 0; i < len; i++) {
+        if (buf[i] == '\0') { (*argc_o)++; }
     }
+    spt_debug("got argc = %d from /proc", *argc_o);
 
     /* success */
     rv = 0;
 
 exit:
-    Py_XDECREF(cl);
-    Py_XDECREF(f);
-    Py_XDECREF(pid_py);
-    Py_XDECREF(os);
+    if (buf) { free(buf); }
+    if (fd >= 0) { close(fd); }
 
     return rv;
 }
@@ -434,6 +413,9 @@ get_argc_argv(int *argc_o, char ***argv_o)
 #endif  /* !WIN32 */
 
 
+static int setup_ps_display(void);
+
+
 /* Initialize the module internal functions.
  *
  * The function reproduces the initialization performed by PostgreSQL
@@ -442,23 +424,40 @@ get_argc_argv(int *argc_o, char ***argv_o)
  * Return 0 in case of success, else -1. In case of failure with an error that
  * shouldn't be ignored, also set a Python exception.
  *
- * The function should be called only once in the process lifetime.
- * so is called at module initialization. After the function is called,
- * set_ps_display() can be used.
+ * The function only performs the setup the first time it is called, also
+ * if called concurrently by many threads: the following calls return the
+ * same result. After the function is called, set_ps_display() can be used.
  */
 int
 spt_setup(void)
 {
     const int not_happened = 3;
     static int rv = 3;
+    int ret;
 
     /* Make sure setup happens just once, either successful or failed */
-    if (rv != not_happened) {
+    if ((ret = (int)spt_atomic_load_acquire(&rv)) != not_happened) {
         spt_debug("setup was called more than once!");
-        return rv;
+        return ret;
+    }
+
+    /* Don't let other threads set up or write titles meanwhile */
+    spt_writer_lock();
+    if ((ret = rv) == not_happened) {
+        ret = setup_ps_display();
+        spt_atomic_store_release(&rv, ret);
     }
+    spt_writer_unlock();
 
-    rv = -1;
+    return ret;
+}
+
+
+/* Perform the setup for spt_setup(). */
+static int
+setup_ps_display(void)
+{
+    int rv = -1;
 
 #ifndef WIN32
     int argc = 0;
@@ -56,6 +56,7 @@
 #endif
 #ifdef HAVE_SYS_PRCTL_H
 #include <sys/prctl.h>          /* for Linux >= 2.6.9 */
+#include <fcntl.h>
 #endif
 #if defined(__darwin__)
 #include <crt_externs.h>
@@ -63,10 +64,18 @@
 #endif
 
 #include "spt_status.h"
+#include "spt_atomic.h"
+#include "spt_board.h"
 
+#include <errno.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <time.h>
+#endif
 
 /* Darwin doesn't export environ */
 #if defined(__darwin__)
@@ -77,6 +86,9 @@ extern char **environ;
 
 bool        update_process_title = true;
 
+/* set if the ps display is updated by a thread other than the main one */
+bool        update_process_title_from_thread = false;
+
 /*
  * Alternative ways of updating ps display:
  *
@@ -145,14 +157,192 @@ static const size_t ps_buffer_size = PS_BUFFER_SIZE;
 static char *ps_buffer;         /* will point to argv area */
 static size_t ps_buffer_size;   /* space determined at run time */
 static size_t last_status_len;  /* use to minimize length of clobber */
+static char *ps_area;           /* the argv area */
+static char *ps_private;        /* ps_buffer if the argv area is not used */
+static size_t ps_private_size;
 #endif   /* PS_USE_CLOBBER_ARGV */
 
 static size_t ps_buffer_fixed_size;     /* size of the constant prefix */
 
+/*
+ * the PS_BACKEND_* views the title is shown in, see set_ps_backend().
+ * Changed by the writers, but read atomically by get_ps_backend_name().
+ */
+static unsigned int ps_backend = PS_BACKEND_BOTH;
+
+/* length of the title currently in ps_buffer, if known */
+#define PS_TITLE_UNKNOWN ((size_t)-1)
+static size_t ps_title_len = PS_TITLE_UNKNOWN;
+
+/*
+ * Counters of the updates. They are only changed by the writers, which are
+ * serialized, so they don't need atomic operations.
+ */
+static ps_display_stats ps_stats;
+
+/* incremented every time the content of ps_buffer changes */
+static unsigned long long ps_generation = 1;
+
+/*
+ * Incremented before and after every change of ps_buffer, so it is odd
+ * while the buffer is written. The writers are serialized by the callers
+ * (see spt_writer_lock()); the readers don't block them, but retry until
+ * they read the buffer while the sequence is even and unchanged.
+ */
+static unsigned int ps_seq;
+
+/*
+ * Title lengths saved by push_ps_display(), restored by pop_ps_display().
+ *
+ * The entries below ps_scope_valid_from were saved before the title was
+ * changed by other means, so they can't be restored anymore. The title is
+ * known to be the one left by the last push or pop if ps_generation is
+ * still ps_scope_generation.
+ *
+ * The title is shared by all the threads, so their scopes can interleave:
+ * every entry records its owner, so that a pop only removes the suffix
+ * pushed by the same owner, even if other suffixes were pushed after it.
+ */
+typedef struct ps_scope
+{
+    size_t      end;            /* PS_TITLE_UNKNOWN if nothing was shown */
+    const void *owner;
+} ps_scope;
+
+static ps_scope *ps_scope_stack;
+static size_t ps_scope_size;
+static size_t ps_scope_depth;
+static size_t ps_scope_valid_from;
+static unsigned long long ps_scope_generation;
+
+#ifdef PS_USE_PRCTL
+/*
+ * The last name set by set_thread_title() in the current thread, used to
+ * skip the syscall if the name doesn't change.
+ *
+ * The name is valid only if thread_name_epoch hasn't changed since it was
+ * set. The epoch changes when a thread name is changed by another thread.
+ */
+#define THREAD_NAME_SIZE 16
+static spt_thread_local char thread_name[THREAD_NAME_SIZE];
+static spt_thread_local unsigned int thread_name_epoch_set; /* 0 if unknown */
+static unsigned int thread_name_epoch = 1;
+
+/*
+ * Incremented when a thread name is changed by set_thread_title() or
+ * setthreadtitle(), which may have replaced the name set from the title.
+ * set_ps_display_len() doesn't skip an unchanged title if it moved from
+ * ps_name_changes_seen, the value when the title last set the name.
+ */
+static unsigned int ps_name_changes = 1;
+static unsigned int ps_name_changes_seen;
+#endif
+
+#ifndef PS_USE_NONE
+static void transmit_ps_display(bool set_name);
+static void pad_ps_display(void);
+#endif
+static size_t get_ps_display_end(void);
+
+/* Return a monotonic time in nanoseconds, to measure the writes */
+static unsigned long long
+ps_clock_ns(void)
+{
+#ifdef _WIN32
+    static LARGE_INTEGER freq;
+    LARGE_INTEGER now;
+
+    if (!freq.QuadPart)
+        QueryPerformanceFrequency(&freq);
+    QueryPerformanceCounter(&now);
+    return (unsigned long long) ((double) now.QuadPart * 1e9
+                                 / (double) freq.QuadPart);
+#else
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (unsigned long long) ts.tv_sec * 1000000000ULL
+        + (unsigned long long) ts.tv_nsec;
+#endif
+}
+
+/* Call these functions around every change to ps_buffer */
+static void
+ps_write_begin(void)
+{
+    spt_atomic_store_relaxed(&ps_seq, spt_atomic_load_relaxed(&ps_seq) + 1);
+    spt_fence_release();
+}
+
+static void
+ps_write_end(void)
+{
+    spt_atomic_store_release(&ps_seq, spt_atomic_load_relaxed(&ps_seq) + 1);
+}
+
 /* save the original argv[] location here */
 static int  save_argc;
 static char **save_argv;
 
+/* information about the copy of argv and environ, see get_ps_args_info() */
+static size_t save_arena_size;
+static size_t save_environ_moved;
+
+#ifdef PS_USE_CLOBBER_ARGV
+/* non-zero if environ can still be moved to extend ps_buffer (SPT_LAZYENV) */
+static unsigned int ps_environ_lazy;
+#endif
+
+
+#if defined(PS_USE_CHANGE_ARGV) || defined(PS_USE_CLOBBER_ARGV)
+/*
+ * Return a pointer to the copy of the string str.
+ *
+ * If str is in the area between start and end, it was copied with the
+ * area into copy. Otherwise copy it at *next, and advance *next.
+ */
+static char *
+relocate_string(char *str, const char *start, const char *end, char *copy,
+                char **next)
+{
+    char       *rv;
+    size_t      len;
+
+    if (str >= start && str < end)
+        return copy + (str - start);
+
+    len = strlen(str) + 1;
+    rv = memcpy(*next, str, len);
+    *next += len;
+    return rv;
+}
+#endif
+
+
+#ifdef PS_USE_CLOBBER_ARGV
+/*
+ * Extend *end_of_area over the environ strings contiguous to it, and add to
+ * *extra_size the size of the other strings. Return the number of strings.
+ */
+static int
+scan_environ(char **end_of_area, size_t *extra_size)
+{
+    size_t      len;
+    int         i;
+
+    for (i = 0; environ[i] != NULL; i++)
+    {
+        len = strlen(environ[i]);
+        if (*end_of_area + 1 == environ[i])
+            *end_of_area = environ[i] + len;
+        else
+            *extra_size += len + 1;
+    }
+
+    return i;
+}
+#endif
+
 
 /*
  * Call this early in startup to save the original argc/argv values.
@@ -163,6 +353,11 @@ static char **save_argv;
  * overwritten during init_ps_display.  Also, the physical location of the
  * environment strings may be moved, so this should be called before any code
  * that might try to hang onto a getenv() result.)
+ *
+ * The copies of argv[] and environ are made in a single allocation, the
+ * arena, which is never released. The strings contiguous to argv[0], usually
+ * all of them, are copied in a single block: only the other strings are
+ * copied one by one.
  */
 char      **
 save_ps_display_args(int argc, char **argv)
@@ -170,15 +365,20 @@ save_ps_display_args(int argc, char **argv)
     save_argc = argc;
     save_argv = argv;
 
-#if defined(PS_USE_CLOBBER_ARGV)
-
-    /*
-     * If we're going to overwrite the argv area, count the available space.
-     * Also move the environment to make additional room.
-     */
+#if defined(PS_USE_CHANGE_ARGV) || defined(PS_USE_CLOBBER_ARGV)
     {
         char       *end_of_area = NULL;
+        size_t      area_size;
+        size_t      extra_size = 0;     /* strings out of the area */
+        size_t      arena_size;
+        bool        move_environ = false;
+        int         nenv = 0;
+        char       *arena;
+        char       *copy;
+        char       *next;
+        char      **new_argv;
         char      **new_environ;
+        size_t      len;
         int         i;
 
         /*
@@ -186,17 +386,23 @@ save_ps_display_args(int argc, char **argv)
          */
         for (i = 0; i < argc; i++)
         {
+            len = strlen(argv[i]);
             if (i == 0 || end_of_area + 1 == argv[i])
-                end_of_area = argv[i] + strlen(argv[i]);
+                end_of_area = argv[i] + len;
+            else
+                extra_size += len + 1;
         }
 
         if (end_of_area == NULL)    /* probably can't happen? */
         {
+#ifdef PS_USE_CLOBBER_ARGV
             ps_buffer = NULL;
             ps_buffer_size = 0;
+#endif
             return argv;
         }
 
+#ifdef PS_USE_CLOBBER_ARGV
         {
             /*
              * Clobbering environ works fine from within the process, but some
@@ -205,60 +411,89 @@ save_ps_display_args(int argc, char **argv)
              * clobbering to argv (see ticket #16).
              */
             char *noenv;
+            char *lazyenv;
 
             noenv = getenv("SPT_NOENV");
-            if (!noenv || !*noenv) {
+            lazyenv = getenv("SPT_LAZYENV");
+            if ((!noenv || !*noenv) && environ) {
 
                 /*
-                 * check for contiguous environ strings following argv
+                 * With SPT_LAZYENV, only move environ when a title doesn't
+                 * fit in argv (see reserve_ps_display()).
                  */
-                for (i = 0; environ[i] != NULL; i++)
+                if (lazyenv && *lazyenv)
+                    ps_environ_lazy = 1;
+                else
                 {
-                    if (end_of_area + 1 == environ[i])
-                        end_of_area = environ[i] + strlen(environ[i]);
+                    /*
+                     * check for contiguous environ strings following argv
+                     */
+                    nenv = scan_environ(&end_of_area, &extra_size);
+                    move_environ = true;
                 }
-
-                /*
-                 * move the environment out of the way
-                 */
-                spt_debug("environ has been copied");
-                new_environ = (char **) malloc((i + 1) * sizeof(char *));
-                for (i = 0; environ[i] != NULL; i++)
-                    new_environ[i] = strdup(environ[i]);
-                new_environ[i] = NULL;
-                environ = new_environ;
             }
         }
-
-        ps_buffer = argv[0];
-        last_status_len = ps_buffer_size = end_of_area - argv[0];
-
-    }
 #endif   /* PS_USE_CLOBBER_ARGV */
 
-#if defined(PS_USE_CHANGE_ARGV) || defined(PS_USE_CLOBBER_ARGV)
+        area_size = (size_t) (end_of_area - argv[0]) + 1;
+        arena_size = (size_t) (argc + 1) * sizeof(char *)
+            + (move_environ ? (size_t) (nenv + 1) * sizeof(char *) : 0)
+            + area_size + extra_size;
+        if (!(arena = (char *) malloc(arena_size)))
+        {
+            spt_debug("can't allocate %zu bytes to copy the args",
+                      arena_size);
+#ifdef PS_USE_CLOBBER_ARGV
+            ps_buffer = NULL;
+            ps_buffer_size = 0;
+#endif
+            return argv;
+        }
 
-    /*
-     * If we're going to change the original argv[] then make a copy for
-     * argument parsing purposes.
-     *
-     * (NB: do NOT think to remove the copying of argv[], even though
-     * postmaster.c finishes looking at argv[] long before we ever consider
-     * changing the ps display.  On some platforms, getopt() keeps pointers
-     * into the argv array, and will get horribly confused when it is
-     * re-called to analyze a subprocess' argument string if the argv storage
-     * has been clobbered meanwhile.  Other platforms have other dependencies
-     * on argv[].
-     */
-    {
-        char      **new_argv;
-        int         i;
+        /* The pointers first, then the strings */
+        new_argv = (char **) arena;
+        new_environ = new_argv + argc + 1;
+        copy = (char *) (move_environ ? new_environ + nenv + 1 : new_environ);
+        memcpy(copy, argv[0], area_size);
+        next = copy + area_size;
 
-        new_argv = (char **) malloc((argc + 1) * sizeof(char *));
+        /*
+         * If we're going to change the original argv[] then make a copy for
+         * argument parsing purposes.
+         *
+         * (NB: do NOT think to remove the copying of argv[], even though
+         * postmaster.c finishes looking at argv[] long before we ever
+         * consider changing the ps display.  On some platforms, getopt()
+         * keeps pointers into the argv array, and will get horribly confused
+         * when it is re-called to analyze a subprocess' argument string if
+         * the argv storage has been clobbered meanwhile.  Other platforms
+         * have other dependencies on argv[].
+         */
         for (i = 0; i < argc; i++)
-            new_argv[i] = strdup(argv[i]);
+            new_argv[i] = relocate_string(argv[i], argv[0], end_of_area,
+                                          copy, &next);
         new_argv[argc] = NULL;
 
+        /*
+         * move the environment out of the way
+         */
+        if (move_environ)
+        {
+            for (i = 0; i < nenv; i++)
+                new_environ[i] = relocate_string(environ[i], argv[0],
+                                                 end_of_area, copy, &next);
+            new_environ[nenv] = NULL;
+            environ = new_environ;
+            save_environ_moved = (size_t) nenv;
+            spt_debug("environ has been copied");
+        }
+        save_arena_size = arena_size;
+
+#ifdef PS_USE_CLOBBER_ARGV
+        ps_area = ps_buffer = argv[0];
+        last_status_len = ps_buffer_size = end_of_area - argv[0];
+#endif
+
 #if defined(__darwin__)
 
         /*
@@ -275,6 +510,246 @@ save_ps_display_args(int argc, char **argv)
     return argv;
 }
 
+
+/*
+ * Return information about the arguments found and their copy.
+ */
+void
+get_ps_args_info(ps_args_info *info)
+{
+    info->argc = save_argv ? save_argc : 0;
+    info->arena_size = save_arena_size;
+    info->environ_moved = save_environ_moved;
+}
+
+
+/*
+ * Make room in ps_buffer for size bytes, including the terminator.
+ *
+ * If the environment was left in place by SPT_LAZYENV, move it out of the
+ * way and extend ps_buffer over its area. This is only attempted once.
+ * Call it with the writers lock held, and with the GIL held in the thread
+ * setting the title: the move races with getenv() and setenv() in other
+ * threads, and leaves dangling the pointers they returned.
+ */
+void
+reserve_ps_display(size_t size)
+{
+#ifdef PS_USE_CLOBBER_ARGV
+    char       *start;
+    char       *end_of_area;
+    size_t      area_size;
+    size_t      extra_size = 0;
+    size_t      arena_size;
+    char       *arena;
+    char       *copy;
+    char       *next;
+    char      **new_environ;
+    int         nenv;
+    int         i;
+
+    /* The title is not kept in the argv area: leave environ alone */
+    if (!ps_environ_lazy || !ps_buffer || ps_buffer != ps_area
+        || size <= ps_buffer_size)
+        return;
+    spt_atomic_store_relaxed(&ps_environ_lazy, 0);
+    if (!environ)
+        return;
+
+    /*
+     * check for contiguous environ strings following the title area
+     */
+    end_of_area = ps_buffer + ps_buffer_size;
+    nenv = scan_environ(&end_of_area, &extra_size);
+    if (end_of_area == ps_buffer + ps_buffer_size)
+    {
+        spt_debug("no environ found after argv");
+        return;
+    }
+
+    start = ps_buffer + ps_buffer_size + 1;
+    area_size = (size_t) (end_of_area - start) + 1;
+    arena_size = (size_t) (nenv + 1) * sizeof(char *)
+        + area_size + extra_size;
+    if (!(arena = (char *) malloc(arena_size)))
+    {
+        spt_debug("can't allocate %zu bytes to copy environ", arena_size);
+        return;
+    }
+
+    /*
+     * move the environment out of the way
+     */
+    new_environ = (char **) arena;
+    copy = (char *) (new_environ + nenv + 1);
+    memcpy(copy, start, area_size);
+    next = copy + area_size;
+    for (i = 0; i < nenv; i++)
+        new_environ[i] = relocate_string(environ[i], start, end_of_area,
+                                         copy, &next);
+    new_environ[nenv] = NULL;
+    environ = new_environ;
+    save_arena_size += arena_size;
+    save_environ_moved = (size_t) nenv;
+
+    ps_write_begin();
+    ps_buffer_size = end_of_area - ps_buffer;
+    ps_write_end();
+    spt_debug("environ has been copied, title space: %zu", ps_buffer_size);
+#endif   /* PS_USE_CLOBBER_ARGV */
+}
+
+
+/*
+ * Make room in ps_buffer for an activity of actlen bytes after the prefix.
+ *
+ * Call it with the writers lock held: see reserve_ps_display().
+ */
+void
+reserve_ps_display_len(size_t actlen)
+{
+#ifdef PS_USE_CLOBBER_ARGV
+    /* If ps_buffer is a pointer, it might still be null */
+    if (!ps_buffer || !ps_buffer_size)
+        return;
+
+    reserve_ps_display(ps_buffer_fixed_size + actlen + 1);
+#endif   /* PS_USE_CLOBBER_ARGV */
+}
+
+
+/*
+ * Return the size ps_buffer would have once extended by reserve_ps_display().
+ *
+ * Nothing is moved: the environment is only scanned, so the function is
+ * safe to call where reserve_ps_display() isn't.
+ */
+size_t
+get_ps_buffer_max_size(void)
+{
+#ifdef PS_USE_CLOBBER_ARGV
+    char       *end_of_area;
+    size_t      extra_size = 0;
+
+    if (spt_atomic_load_relaxed(&ps_environ_lazy) && ps_buffer
+        && ps_buffer == ps_area && environ)
+    {
+        end_of_area = ps_buffer + ps_buffer_size;
+        scan_environ(&end_of_area, &extra_size);
+        return end_of_area - ps_buffer;
+    }
+#endif   /* PS_USE_CLOBBER_ARGV */
+
+    return get_ps_buffer_size();
+}
+
+
+/*
+ * Return true if ps_buffer might be extended by reserve_ps_display().
+ *
+ * The function doesn't need the writers lock: the result may be stale.
+ */
+bool
+ps_display_may_grow(void)
+{
+#ifdef PS_USE_CLOBBER_ARGV
+    return spt_atomic_load_relaxed(&ps_environ_lazy) != 0;
+#else
+    return false;
+#endif
+}
+
+/* The names of the backends, indexed by their PS_BACKEND_* flags */
+static const char *const ps_backend_names[] = {
+    "memory", "cmdline", "comm", "both"
+};
+
+/*
+ * Return the PS_BACKEND_* flags of the backend called name, -1 if unknown.
+ */
+int
+get_ps_backend_by_name(const char *name)
+{
+    int         i;
+
+    for (i = 0; i <= PS_BACKEND_BOTH; i++)
+    {
+        if (strcmp(name, ps_backend_names[i]) == 0)
+            return i;
+    }
+    return -1;
+}
+
+
+/*
+ * Return the name of the backend in use.
+ */
+const char *
+get_ps_backend_name(void)
+{
+    return ps_backend_names[spt_atomic_load_relaxed(&ps_backend)];
+}
+
+
+/*
+ * Choose where the title is shown: PS_BACKEND_CMDLINE for the command line
+ * (clobbering argv or calling the platform function), PS_BACKEND_COMM for
+ * the process name set by prctl(), both or none. With none the title is
+ * only kept in memory, where getproctitle() can read it.
+ *
+ * A view dropped keeps the last title shown; a view added shows the
+ * current title. Return false if there is no memory to keep the title out
+ * of the argv area. Call it with the writers lock held.
+ */
+bool
+set_ps_backend(unsigned int backend)
+{
+#ifndef PS_USE_NONE
+    unsigned int added = backend & ~ps_backend;
+
+#ifdef PS_USE_CLOBBER_ARGV
+    if (ps_area && (added & PS_BACKEND_CMDLINE))
+    {
+        /* Copy the title back into the argv area, padding included */
+        memcpy(ps_area, ps_buffer, ps_buffer_size);
+        ps_write_begin();
+        ps_buffer = ps_area;
+        ps_write_end();
+    }
+    else if (ps_area && ps_buffer == ps_area
+             && !(backend & PS_BACKEND_CMDLINE))
+    {
+        /*
+         * Keep the title in a copy of the argv area. A copy too small,
+         * because the area grew, is not released: the readers may still
+         * be reading it.
+         */
+        if (ps_private_size < ps_buffer_size)
+        {
+            char       *copy = (char *) malloc(ps_buffer_size);
+
+            if (!copy)
+                return false;
+            ps_private = copy;
+            ps_private_size = ps_buffer_size;
+        }
+        memcpy(ps_private, ps_area, ps_buffer_size);
+        ps_write_begin();
+        ps_buffer = ps_private;
+        ps_write_end();
+    }
+#endif   /* PS_USE_CLOBBER_ARGV */
+
+    spt_atomic_store_relaxed(&ps_backend, backend);
+
+    if (added && ps_title_len != PS_TITLE_UNKNOWN)
+        transmit_ps_display((added & PS_BACKEND_COMM) != 0);
+#endif   /* not PS_USE_NONE */
+
+    return true;
+}
+
+
 /*
  * Call this once during subprocess startup to set the identification
  * values.  At this point, the original argv[] array may be overwritten.
@@ -293,6 +768,23 @@ init_ps_display(const char *initial_str)
         return;
 #endif
 
+    /*
+     * Choose the views of the title before showing anything, so that
+     * SPT_BACKEND=memory leaves the command line untouched.
+     */
+    {
+        char       *name = getenv("SPT_BACKEND");
+        int         backend;
+
+        if (name && *name)
+        {
+            if ((backend = get_ps_backend_by_name(name)) < 0)
+                spt_debug("unknown SPT_BACKEND: %s", name);
+            else if (!set_ps_backend((unsigned int) backend))
+                spt_debug("failed to set SPT_BACKEND: %s", name);
+        }
+    }
+
     /*
      * Overwrite argv[] to point at appropriate space, if needed
      */
@@ -308,7 +800,7 @@ init_ps_display(const char *initial_str)
 
         /* make extra argv slots point at end_of_area (a NUL) */
         for (i = 1; i < save_argc; i++)
-            save_argv[i] = ps_buffer + ps_buffer_size;
+            save_argv[i] = ps_area + ps_buffer_size;
     }
 #endif   /* PS_USE_CLOBBER_ARGV */
 
@@ -316,10 +808,17 @@ init_ps_display(const char *initial_str)
      * Make fixed prefix of ps display.
      */
 
+    ps_write_begin();
     ps_buffer[0] = '\0';
 
     ps_buffer_fixed_size = strlen(ps_buffer);
+    ps_write_end();
 
+    /*
+     * The initial title (the arguments joined) doesn't fit the argv area by
+     * one char: environ isn't moved to show it, only a title set by the
+     * program can move it.
+     */
     set_ps_display(initial_str, true);
 #endif   /* not PS_USE_NONE */
 }
@@ -327,39 +826,167 @@ init_ps_display(const char *initial_str)
 
 
 /*
- * Call this to update the ps status display to a fixed prefix plus an
- * indication of what you're currently doing passed in the argument.
+ * Call this to change the fixed prefix of the ps display, whose length is
+ * passed in prefixlen.  The activity part is reset to empty: use
+ * set_ps_display() to update it afterwards.
+ *
+ * The prefix is truncated if it doesn't fit in the available space, leaving
+ * room for at least the string terminator.
  */
 void
-set_ps_display(const char *activity, bool force)
+set_ps_display_prefix(const char *prefix, size_t prefixlen)
 {
-
-    if (!force && !update_process_title)
-        return;
-
 #ifndef PS_USE_NONE
 
 #ifdef PS_USE_CLOBBER_ARGV
     /* If ps_buffer is a pointer, it might still be null */
-    if (!ps_buffer)
+    if (!ps_buffer || !ps_buffer_size)
         return;
 #endif
 
-    /* Update ps_buffer to contain both fixed part and activity */
-    spt_strlcpy(ps_buffer + ps_buffer_fixed_size, activity,
-            ps_buffer_size - ps_buffer_fixed_size);
+    if (prefixlen > ps_buffer_size - 1)
+        reserve_ps_display(prefixlen + 1);
+    if (prefixlen > ps_buffer_size - 1)
+    {
+        prefixlen = ps_buffer_size - 1;
+        ps_stats.truncations++;
+    }
+    ps_write_begin();
+    memcpy(ps_buffer, prefix, prefixlen);
+    ps_buffer[prefixlen] = '\0';
+    ps_buffer_fixed_size = prefixlen;
+    ps_stats.bytes_written += prefixlen;
+
+    /* Don't let set_ps_display() think the activity is already there */
+    ps_title_len = PS_TITLE_UNKNOWN;
+    ps_generation++;
+    ps_write_end();
+
+    set_ps_display("", true);
+#endif   /* not PS_USE_NONE */
+}
 
-    /* Transmit new setting to kernel, if necessary */
 
-#ifdef PS_USE_DARWIN
-    darwin_set_process_title(ps_buffer);
-#endif
+/*
+ * Drop the fixed prefix of the ps display, without touching the buffer.
+ *
+ * The next set_ps_display() will overwrite the entire title.
+ */
+void
+clear_ps_display_prefix(void)
+{
+    if (ps_buffer_fixed_size)
+    {
+        ps_write_begin();
+        ps_buffer_fixed_size = 0;
+        ps_write_end();
+    }
+}
 
-#ifdef PS_USE_SETPROCTITLE
-    setproctitle("%s", ps_buffer);
+
+/*
+ * Call this to update the ps status display to a fixed prefix plus an
+ * indication of what you're currently doing passed in the argument.
+ */
+void
+set_ps_display(const char *activity, bool force)
+{
+    set_ps_display_len(activity, strlen(activity), force);
+}
+
+
+/*
+ * Like set_ps_display(), but the activity length is known, so the activity
+ * doesn't need to be null-terminated.
+ */
+void
+set_ps_display_len(const char *activity, size_t actlen, bool force)
+{
+#ifndef PS_USE_NONE
+    unsigned long long t0;
+#endif
+
+    if (!force && !update_process_title)
+        return;
+
+#ifndef PS_USE_NONE
+
+#ifdef PS_USE_CLOBBER_ARGV
+    /* If ps_buffer is a pointer, it might still be null */
+    if (!ps_buffer || !ps_buffer_size)
+        return;
+#endif
+
+    ps_stats.calls++;
+
+    /*
+     * Truncate the activity to the space available after the prefix. Don't
+     * extend the space here: this may run in the writer thread, or without
+     * the GIL, racing with getenv(); the callers reserve it beforehand.
+     */
+    if (actlen > ps_buffer_size - ps_buffer_fixed_size - 1)
+    {
+        actlen = ps_buffer_size - ps_buffer_fixed_size - 1;
+        ps_stats.truncations++;
+    }
+
+    /*
+     * Nothing to do if the title wouldn't change, unless the process name
+     * was changed by setting a thread title.
+     */
+    if (ps_title_len == ps_buffer_fixed_size + actlen
+        && memcmp(ps_buffer + ps_buffer_fixed_size, activity, actlen) == 0
+#ifdef PS_USE_PRCTL
+        && (!(ps_backend & PS_BACKEND_COMM)
+            || ps_name_changes_seen
+                == spt_atomic_load_relaxed(&ps_name_changes))
+#endif
+        )
+    {
+        ps_stats.skipped++;
+        return;
+    }
+
+    /* Update ps_buffer to contain both fixed part and activity */
+    t0 = ps_clock_ns();
+    ps_write_begin();
+    memcpy(ps_buffer + ps_buffer_fixed_size, activity, actlen);
+    ps_title_len = ps_buffer_fixed_size + actlen;
+    ps_buffer[ps_title_len] = '\0';
+    ps_generation++;
+    pad_ps_display();
+    ps_write_end();
+    ps_stats.updates++;
+    ps_stats.bytes_written += actlen;
+
+    transmit_ps_display(true);
+    spt_board_publish(ps_buffer, ps_title_len);
+    ps_stats.ns += ps_clock_ns() - t0;
+#endif   /* not PS_USE_NONE */
+}
+
+
+#ifndef PS_USE_NONE
+/*
+ * Transmit the content of ps_buffer to the kernel, if necessary.
+ *
+ * If set_name is false, the process name set by prctl() is not updated.
+ */
+static void
+transmit_ps_display(bool set_name)
+{
+#ifdef PS_USE_DARWIN
+    if (ps_backend & PS_BACKEND_CMDLINE)
+        darwin_set_process_title(ps_buffer);
+#endif
+
+#ifdef PS_USE_SETPROCTITLE
+    if (ps_backend & PS_BACKEND_CMDLINE)
+        setproctitle("%s", ps_buffer);
 #endif
 
 #ifdef PS_USE_PSTAT
+    if (ps_backend & PS_BACKEND_CMDLINE)
     {
         union pstun pst;
 
@@ -369,28 +996,49 @@ set_ps_display(const char *activity, bool force)
 #endif   /* PS_USE_PSTAT */
 
 #ifdef PS_USE_PS_STRINGS
-    PS_STRINGS->ps_nargvstr = 1;
-    PS_STRINGS->ps_argvstr = ps_buffer;
+    if (ps_backend & PS_BACKEND_CMDLINE)
+    {
+        PS_STRINGS->ps_nargvstr = 1;
+        PS_STRINGS->ps_argvstr = ps_buffer;
+    }
 #endif   /* PS_USE_PS_STRINGS */
 
-#ifdef PS_USE_CLOBBER_ARGV
-    {
-        size_t      buflen;
+#ifdef PS_USE_PRCTL
+    if (!(ps_backend & PS_BACKEND_COMM))
+        set_name = false;
 
-        /* pad unused memory */
-        buflen = strlen(ps_buffer);
-        /* clobber remainder of old status string */
-        if (last_status_len > buflen)
-            memset(ps_buffer + buflen, PS_PADDING, last_status_len - buflen);
-        last_status_len = buflen;
+    if (set_name)
+        ps_name_changes_seen = spt_atomic_load_relaxed(&ps_name_changes);
+
+    if (set_name && !update_process_title_from_thread)
+    {
+        prctl(PR_SET_NAME, ps_buffer);
+        ps_stats.prctl_calls++;
+        thread_name_epoch_set = 0;
     }
-#endif   /* PS_USE_CLOBBER_ARGV */
+    else if (set_name)
+    {
+        /* prctl() would rename the calling thread: rename the main one */
+        int         fd;
 
-#ifdef PS_USE_PRCTL
-    prctl(PR_SET_NAME, ps_buffer);
+        if ((fd = open("/proc/self/comm", O_WRONLY)) >= 0)
+        {
+            if (write(fd, ps_buffer, ps_title_len < 15 ? ps_title_len : 15) < 0)
+                spt_debug("failed to write /proc/self/comm");
+            close(fd);
+        }
+        else
+        {
+            prctl(PR_SET_NAME, ps_buffer);
+            ps_stats.prctl_calls++;
+        }
+        /* The name cached by the main thread is no more valid */
+        spt_atomic_add_relaxed(&thread_name_epoch, 1);
+    }
 #endif
 
 #ifdef PS_USE_WIN32
+    if (ps_backend & PS_BACKEND_CMDLINE)
     {
         /*
          * Win32 does not support showing any changed arguments. To make it at
@@ -408,10 +1056,503 @@ set_ps_display(const char *activity, bool force)
         ident_handle = CreateEvent(NULL, TRUE, FALSE, name);
     }
 #endif   /* PS_USE_WIN32 */
+}
+
+
+/*
+ * Clobber the remainder of the previous title in ps_buffer, if needed.
+ *
+ * Call it after changing the title length, before ps_write_end().
+ */
+static void
+pad_ps_display(void)
+{
+#ifdef PS_USE_CLOBBER_ARGV
+    size_t      buflen;
+
+    /* pad unused memory */
+    buflen = ps_title_len;
+    /* clobber remainder of old status string */
+    if (last_status_len > buflen)
+    {
+        memset(ps_buffer + buflen, PS_PADDING, last_status_len - buflen);
+        ps_stats.memset_bytes += last_status_len - buflen;
+    }
+    last_status_len = buflen;
+#endif   /* PS_USE_CLOBBER_ARGV */
+}
+#endif   /* not PS_USE_NONE */
+
+
+/*
+ * Overwrite len bytes of the title at the given offset in place, without
+ * changing the title length.
+ *
+ * generation is the value returned by get_ps_display_generation() after
+ * the title was written: if the title changed afterwards, or if the range
+ * is not entirely in the title, don't write anything and return 0.
+ * Otherwise return the generation of the title updated.
+ */
+unsigned long long
+overwrite_ps_display(unsigned long long generation, size_t offset,
+                     const char *data, size_t len)
+{
+#ifndef PS_USE_NONE
+    unsigned long long t0;
+
+    if (generation != ps_generation || ps_title_len == PS_TITLE_UNKNOWN
+        || offset + len > ps_title_len)
+        return 0;
+
+    ps_stats.calls++;
+    if (memcmp(ps_buffer + offset, data, len) == 0)
+    {
+        ps_stats.skipped++;
+        return ps_generation;
+    }
+
+    t0 = ps_clock_ns();
+    ps_write_begin();
+    memcpy(ps_buffer + offset, data, len);
+    ps_generation++;
+    ps_write_end();
+    ps_stats.updates++;
+    ps_stats.bytes_written += len;
+
+    /* The process name only has the first 15 chars of the title */
+    transmit_ps_display(offset < 15);
+    spt_board_publish(ps_buffer, ps_title_len);
+    ps_stats.ns += ps_clock_ns() - t0;
+
+    return ps_generation;
+#else
+    return 0;
 #endif   /* not PS_USE_NONE */
 }
 
 
+/*
+ * Replace the title from the given offset to its end with len bytes of
+ * data, changing the title length.
+ *
+ * generation is the value returned by get_ps_display_generation() after
+ * the title was written: if the title changed afterwards, or if offset is
+ * past the end of the title, don't write anything and return 0. Otherwise
+ * return the generation of the title updated. data is truncated if it
+ * doesn't fit in the available space.
+ */
+unsigned long long
+rewrite_ps_display(unsigned long long generation, size_t offset,
+                   const char *data, size_t len)
+{
+#ifndef PS_USE_NONE
+    unsigned long long t0;
+
+    if (generation != ps_generation || ps_title_len == PS_TITLE_UNKNOWN
+        || offset > ps_title_len)
+        return 0;
+
+    ps_stats.calls++;
+    if (len > ps_buffer_size - offset - 1)
+        reserve_ps_display(offset + len + 1);
+    if (len > ps_buffer_size - offset - 1)
+    {
+        len = ps_buffer_size - offset - 1;
+        ps_stats.truncations++;
+    }
+
+    if (ps_title_len == offset + len
+        && memcmp(ps_buffer + offset, data, len) == 0)
+    {
+        ps_stats.skipped++;
+        return ps_generation;
+    }
+
+    t0 = ps_clock_ns();
+    ps_write_begin();
+    memcpy(ps_buffer + offset, data, len);
+    ps_title_len = offset + len;
+    ps_buffer[ps_title_len] = '\0';
+    ps_generation++;
+    pad_ps_display();
+    ps_write_end();
+    ps_stats.updates++;
+    ps_stats.bytes_written += len;
+
+    /* The process name only has the first 15 chars of the title */
+    transmit_ps_display(offset < 15);
+    spt_board_publish(ps_buffer, ps_title_len);
+    ps_stats.ns += ps_clock_ns() - t0;
+
+    return ps_generation;
+#else
+    return 0;
+#endif   /* not PS_USE_NONE */
+}
+
+
+/*
+ * Forget the titles saved if the title was changed since the last push or
+ * pop.
+ */
+static void
+check_ps_scope(void)
+{
+    if (ps_generation != ps_scope_generation)
+        ps_scope_valid_from = ps_scope_depth;
+}
+
+
+/*
+ * Append len bytes of suffix to the title, saving the current title length
+ * so that pop_ps_display() can restore it.
+ *
+ * owner identifies the caller, for instance its thread: only the same
+ * owner can pop the title. The suffix is truncated if it doesn't fit in
+ * the available space. If the title can't be shown, the push is recorded
+ * anyway, to keep the pops balanced. Return -1 and set errno if the title
+ * couldn't be saved.
+ */
+int
+push_ps_display(const char *suffix, size_t len, const void *owner)
+{
+    ps_scope   *scope;
+#ifndef PS_USE_NONE
+    size_t      end;
+    unsigned long long t0;
+#endif
+
+    if (ps_scope_depth == ps_scope_size)
+    {
+        size_t      size = ps_scope_size ? ps_scope_size * 2 : 16;
+        ps_scope   *stack;
+
+        if (!(stack = (ps_scope *) realloc(ps_scope_stack,
+                                           size * sizeof(ps_scope))))
+        {
+            errno = ENOMEM;
+            return -1;
+        }
+        ps_scope_stack = stack;
+        ps_scope_size = size;
+    }
+
+    check_ps_scope();
+    scope = &ps_scope_stack[ps_scope_depth++];
+    scope->end = PS_TITLE_UNKNOWN;
+    scope->owner = owner;
+
+#ifndef PS_USE_NONE
+
+#ifdef PS_USE_CLOBBER_ARGV
+    /* If ps_buffer is a pointer, it might still be null */
+    if (!ps_buffer || !ps_buffer_size)
+        return 0;
+#endif
+
+    end = get_ps_display_end();
+    scope->end = end;
+    ps_stats.calls++;
+
+    if (len > ps_buffer_size - end - 1)
+        reserve_ps_display(end + len + 1);
+    if (len > ps_buffer_size - end - 1)
+    {
+        len = ps_buffer_size - end - 1;
+        ps_stats.truncations++;
+    }
+
+    t0 = ps_clock_ns();
+    ps_write_begin();
+    ps_title_len = end;
+    if (len)
+    {
+        memcpy(ps_buffer + end, suffix, len);
+        ps_title_len = end + len;
+        ps_buffer[ps_title_len] = '\0';
+        ps_generation++;
+        pad_ps_display();
+    }
+    ps_write_end();
+
+    if (len)
+    {
+        ps_stats.updates++;
+        ps_stats.bytes_written += len;
+
+        /* The process name only has the first 15 chars of the title */
+        transmit_ps_display(end < 15);
+        spt_board_publish(ps_buffer, ps_title_len);
+        ps_stats.ns += ps_clock_ns() - t0;
+    }
+    else
+        ps_stats.skipped++;
+    ps_scope_generation = ps_generation;
+#endif   /* not PS_USE_NONE */
+
+    return 0;
+}
+
+
+/*
+ * Remove the suffix saved by the last push_ps_display() of owner.
+ *
+ * If it is the last suffix pushed, restore the title length saved. If the
+ * suffixes of other owners were pushed after it, cut it out of the title,
+ * leaving the following ones in place. If the title was changed by other
+ * means after the push, leave it alone. Return false if owner has no title
+ * saved.
+ */
+bool
+pop_ps_display(const void *owner)
+{
+    size_t      i;
+#ifndef PS_USE_NONE
+    size_t      end,
+                cut = 0,
+                j;
+    unsigned long long t0;
+#endif
+
+    /* Find the last scope of the owner */
+    for (i = ps_scope_depth; i > 0; i--)
+    {
+        if (ps_scope_stack[i - 1].owner == owner)
+            break;
+    }
+    if (!i--)
+        return false;
+
+    check_ps_scope();
+
+#ifndef PS_USE_NONE
+    end = ps_scope_stack[i].end;
+    if (i >= ps_scope_valid_from && end != PS_TITLE_UNKNOWN)
+    {
+        /* The length of the suffix to remove, and of the title after it */
+        if (i + 1 < ps_scope_depth)
+            cut = ps_scope_stack[i + 1].end - end;
+        else
+            cut = ps_title_len - end;
+
+        ps_stats.calls++;
+        if (cut)
+        {
+            t0 = ps_clock_ns();
+            ps_write_begin();
+            memmove(ps_buffer + end, ps_buffer + end + cut,
+                    ps_title_len - end - cut);
+            ps_title_len -= cut;
+            ps_buffer[ps_title_len] = '\0';
+            ps_generation++;
+            pad_ps_display();
+            ps_write_end();
+            ps_stats.updates++;
+            ps_stats.bytes_written += ps_title_len - end;
+
+            transmit_ps_display(end < 15);
+            spt_board_publish(ps_buffer, ps_title_len);
+            ps_stats.ns += ps_clock_ns() - t0;
+        }
+        else
+            ps_stats.skipped++;
+        ps_scope_generation = ps_generation;
+
+        /* The suffixes following it moved back */
+        for (j = i + 1; j < ps_scope_depth; j++)
+            ps_scope_stack[j].end -= cut;
+    }
+#endif   /* not PS_USE_NONE */
+
+    if (i < ps_scope_valid_from)
+        ps_scope_valid_from--;
+    memmove(ps_scope_stack + i, ps_scope_stack + i + 1,
+            (ps_scope_depth - i - 1) * sizeof(ps_scope));
+    ps_scope_depth--;
+
+    return true;
+}
+
+
+/*
+ * Return the number of titles saved by push_ps_display().
+ */
+size_t
+get_ps_display_depth(void)
+{
+    return ps_scope_depth;
+}
+
+
+/*
+ * Return the space available for the title, including the prefix and the
+ * string terminator.
+ */
+size_t
+get_ps_buffer_size(void)
+{
+#ifdef PS_USE_CLOBBER_ARGV
+    /* If ps_buffer is a pointer, it might still be null */
+    if (!ps_buffer)
+        return 0;
+#endif
+
+    return ps_buffer_size;
+}
+
+
+/*
+ * Return the counters of the ps display updates.
+ */
+void
+get_ps_display_stats(ps_display_stats *stats)
+{
+    *stats = ps_stats;
+}
+
+
+/*
+ * Reset the counters of the ps display updates to zero.
+ *
+ * The counters are changed by the writers: call it with the writers lock
+ * held.
+ */
+void
+reset_ps_display_stats(void)
+{
+    memset(&ps_stats, 0, sizeof(ps_stats));
+}
+
+
+/*
+ * Make the ps_buffer sequence even again in a child process.
+ *
+ * If the process forked while another thread was writing the buffer, the
+ * sequence in the child is left odd, and the readers would wait forever
+ * for a write which is not going to end. Call it after fork(), before
+ * changing the display.
+ */
+void
+reset_ps_display_seq(void)
+{
+    unsigned int seq = spt_atomic_load_relaxed(&ps_seq);
+
+    if (seq & 1)
+        spt_atomic_store_release(&ps_seq, seq + 1);
+}
+
+
+/*
+ * Return a number changing every time the ps display changes.
+ *
+ * Can be used to tell if a title read by get_ps_title() is still current.
+ */
+unsigned long long
+get_ps_display_generation(void)
+{
+    unsigned long long generation;
+    unsigned int seq;
+
+    do
+    {
+        while ((seq = spt_atomic_load_acquire(&ps_seq)) & 1)
+            ;
+        generation = ps_generation;
+        spt_fence_acquire();
+    } while (seq != spt_atomic_load_relaxed(&ps_seq));
+
+    return generation;
+}
+
+
+/*
+ * Copy the entire title into buf, which should be get_ps_buffer_size()
+ * long, and return its length.
+ *
+ * Unlike get_ps_title(), the function can be called while other threads
+ * change the title: the title copied is never partially written. If not
+ * null, store the length of the prefix into *prefixlen and the generation
+ * of the title copied into *generation.
+ */
+size_t
+read_ps_title(char *buf, size_t size, size_t *prefixlen,
+              unsigned long long *generation)
+{
+    const char *title;
+    size_t      len,
+                fixed;
+    unsigned long long gen;
+    unsigned int seq;
+
+    do
+    {
+        while ((seq = spt_atomic_load_acquire(&ps_seq)) & 1)
+            ;
+        title = get_ps_title(&len);
+        if (len > size)
+            len = size;
+        memcpy(buf, title, len);
+        fixed = ps_buffer_fixed_size;
+        gen = ps_generation;
+        spt_fence_acquire();
+    } while (seq != spt_atomic_load_relaxed(&ps_seq));
+
+    if (prefixlen)
+        *prefixlen = fixed < len ? fixed : len;
+    if (generation)
+        *generation = gen;
+
+    return len;
+}
+
+
+/*
+ * Return an estimate of the bytes to write to set an activity of length
+ * actlen, including the clobbering of the previous title.
+ *
+ * The function doesn't need the writers lock: the result may be stale.
+ */
+size_t
+get_ps_write_size(size_t actlen)
+{
+#ifdef PS_USE_CLOBBER_ARGV
+    size_t      last = spt_atomic_load_relaxed(&last_status_len);
+
+    return last > actlen ? last : actlen;
+#else
+    return actlen;
+#endif
+}
+
+
+/*
+ * Return the offset of the end of the title in ps_buffer.
+ */
+static size_t
+get_ps_display_end(void)
+{
+#ifdef PS_USE_CLOBBER_ARGV
+    size_t      offset;
+
+    /* We know the title length, unless nothing was written yet */
+    if (ps_title_len != PS_TITLE_UNKNOWN)
+        return ps_title_len;
+
+    /* Remove any trailing spaces to offset the effect of PS_PADDING */
+    offset = ps_buffer_size;
+    while (offset > ps_buffer_fixed_size && ps_buffer[offset - 1] == PS_PADDING)
+        offset--;
+
+    return offset;
+#else
+    if (ps_title_len != PS_TITLE_UNKNOWN)
+        return ps_title_len;
+
+    return ps_buffer_fixed_size + strlen(ps_buffer + ps_buffer_fixed_size);
+#endif
+}
+
+
 /*
  * Returns what's currently in the ps display, in case someone needs
  * it.  Note that only the activity part is returned.  On some platforms
@@ -422,26 +1563,39 @@ const char *
 get_ps_display(size_t *displen)
 {
 #ifdef PS_USE_CLOBBER_ARGV
-    size_t      offset;
-
     /* If ps_buffer is a pointer, it might still be null */
     if (!ps_buffer)
     {
         *displen = 0;
         return "";
     }
+#endif
 
-    /* Remove any trailing spaces to offset the effect of PS_PADDING */
-    offset = ps_buffer_size;
-    while (offset > ps_buffer_fixed_size && ps_buffer[offset - 1] == PS_PADDING)
-        offset--;
+    *displen = get_ps_display_end() - ps_buffer_fixed_size;
 
-    *displen = offset - ps_buffer_fixed_size;
-#else
-    *displen = strlen(ps_buffer + ps_buffer_fixed_size);
+    return ps_buffer + ps_buffer_fixed_size;
+}
+
+
+/*
+ * Like get_ps_display(), but return the entire title, including the fixed
+ * prefix.
+ */
+const char *
+get_ps_title(size_t *titlelen)
+{
+#ifdef PS_USE_CLOBBER_ARGV
+    /* If ps_buffer is a pointer, it might still be null */
+    if (!ps_buffer)
+    {
+        *titlelen = 0;
+        return "";
+    }
 #endif
 
-    return ps_buffer + ps_buffer_fixed_size;
+    *titlelen = get_ps_display_end();
+
+    return ps_buffer;
 }
 
 
@@ -449,7 +1603,32 @@ void
 set_thread_title(const char *title)
 {
 #ifdef PS_USE_PRCTL
+    unsigned int epoch;
+
+    /* Don't bother the kernel if the name wouldn't change */
+    epoch = spt_atomic_load_relaxed(&thread_name_epoch);
+    if (thread_name_epoch_set == epoch
+        && 0 == strncmp(thread_name, title, THREAD_NAME_SIZE - 1))
+        return;
+
     prctl(PR_SET_NAME, title);
+    spt_strlcpy(thread_name, title, THREAD_NAME_SIZE);
+    thread_name_epoch_set = epoch;
+    spt_atomic_add_relaxed(&ps_name_changes, 1);
+#endif
+}
+
+
+/*
+ * To be called after changing the name of a thread other than the current
+ * one: drop the names cached by set_thread_title().
+ */
+void
+thread_titles_changed(void)
+{
+#ifdef PS_USE_PRCTL
+    spt_atomic_add_relaxed(&thread_name_epoch, 1);
+    spt_atomic_add_relaxed(&ps_name_changes, 1);
 #endif
 }
 
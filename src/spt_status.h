@@ -12,18 +12,102 @@
 
 #include "c.h"
 
+typedef struct ps_display_stats
+{
+    unsigned long long calls;       /* changes of the ps display requested */
+    unsigned long long updates;     /* titles written in the ps display */
+    unsigned long long skipped;     /* titles not written as unchanged */
+    unsigned long long truncations; /* titles not fitting in the display */
+    unsigned long long bytes_written;   /* copied into the display */
+    unsigned long long memset_bytes;    /* cleared after shorter titles */
+    unsigned long long prctl_calls; /* process name changes */
+    unsigned long long ns;          /* time spent writing the titles */
+} ps_display_stats;
+
+typedef struct ps_args_info
+{
+    int argc;                       /* number of arguments found */
+    size_t arena_size;              /* memory used to copy argv and environ */
+    size_t environ_moved;           /* variables moved to make room */
+} ps_args_info;
+
+/* The views of the title updated, see set_ps_backend() */
+#define PS_BACKEND_CMDLINE 1
+#define PS_BACKEND_COMM 2
+#define PS_BACKEND_BOTH (PS_BACKEND_CMDLINE | PS_BACKEND_COMM)
+
 HIDDEN extern bool update_process_title;
 
+HIDDEN extern bool update_process_title_from_thread;
+
 HIDDEN extern char **save_ps_display_args(int argc, char **argv);
 
+HIDDEN extern void get_ps_args_info(ps_args_info *info);
+
+HIDDEN extern void reserve_ps_display(size_t size);
+
+HIDDEN extern void reserve_ps_display_len(size_t actlen);
+
+HIDDEN extern size_t get_ps_buffer_max_size(void);
+
+HIDDEN extern bool ps_display_may_grow(void);
+
+HIDDEN extern int get_ps_backend_by_name(const char *name);
+
+HIDDEN extern const char *get_ps_backend_name(void);
+
+HIDDEN extern bool set_ps_backend(unsigned int backend);
+
 HIDDEN extern void init_ps_display(const char *initial_str);
 
+HIDDEN extern void set_ps_display_prefix(const char *prefix,
+                                         size_t prefixlen);
+
+HIDDEN extern void clear_ps_display_prefix(void);
+
 HIDDEN extern void set_ps_display(const char *activity, bool force);
 
+HIDDEN extern void set_ps_display_len(const char *activity, size_t actlen,
+                                      bool force);
+
+HIDDEN extern unsigned long long overwrite_ps_display(
+    unsigned long long generation, size_t offset, const char *data,
+    size_t len);
+
+HIDDEN extern unsigned long long rewrite_ps_display(
+    unsigned long long generation, size_t offset, const char *data,
+    size_t len);
+
+HIDDEN extern int push_ps_display(const char *suffix, size_t len,
+                                  const void *owner);
+
+HIDDEN extern bool pop_ps_display(const void *owner);
+
+HIDDEN extern size_t get_ps_display_depth(void);
+
 HIDDEN extern const char *get_ps_display(size_t *displen);
 
+HIDDEN extern const char *get_ps_title(size_t *titlelen);
+
+HIDDEN extern size_t get_ps_buffer_size(void);
+
+HIDDEN extern unsigned long long get_ps_display_generation(void);
+
+HIDDEN extern size_t read_ps_title(char *buf, size_t size, size_t *prefixlen,
+                                   unsigned long long *generation);
+
+HIDDEN extern size_t get_ps_write_size(size_t actlen);
+
+HIDDEN extern void get_ps_display_stats(ps_display_stats *stats);
+
+HIDDEN extern void reset_ps_display_stats(void);
+
+HIDDEN extern void reset_ps_display_seq(void);
+
 HIDDEN extern void set_thread_title(const char *title);
 
+HIDDEN extern void thread_titles_changed(void);
+
 HIDDEN extern void get_thread_title(char *title);
 
 #endif   /* SPT_STATUS_H */
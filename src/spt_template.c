@@ -0,0 +1,528 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_template.c
+ *    Process title template with named fields, rendered in place.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ * A Template is parsed once into literal text and "{name}" fields. Setting
+ * some fields renders the title again and compares it with the title shown:
+ * only the bytes from the first difference are written in the ps display,
+ * up to the last difference if the length of the title didn't change.
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#include "spt_template.h"
+#include "spt_args.h"
+#include "spt_setup.h"
+#include "spt_status.h"
+#include "spt_writer.h"
+
+#include <string.h>
+
+/* A piece of the template: literal text or a field */
+typedef struct {
+    Py_ssize_t field;           /* index of the field, -1 if literal */
+    size_t start;               /* offset of the text in the literals */
+    size_t len;                 /* length of the literal text */
+} spt_segment;
+
+/* The current value of a field, as text */
+typedef struct {
+    char *data;
+    size_t len;
+    size_t size;
+} spt_value;
+
+typedef struct {
+    PyObject_HEAD
+    char *literals;             /* the literal text of the template */
+    spt_segment *segments;
+    Py_ssize_t nsegments;
+    PyObject *fields;           /* tuple of the field names */
+    PyObject *index;            /* dict from field name to its index */
+    spt_value *values;          /* the values, one per field */
+    char *title;                /* the title rendered */
+    size_t len;                 /* length of the title */
+    char *next;                 /* buffer to render the new title into */
+    size_t size;                /* size of the title and next buffers */
+    unsigned long long generation;  /* of the title shown; 0 if not shown */
+    size_t offset;              /* offset of the title in the ps display */
+} spt_Template;
+
+
+/* Add a field named name to the template, if new. Return its index. */
+static Py_ssize_t
+add_field(spt_Template *self, PyObject *names, const char *name, size_t len)
+{
+    PyObject *key, *idx = NULL;
+    Py_ssize_t rv = -1;
+
+    if (!(key = PyUnicode_DecodeUTF8(name, (Py_ssize_t)len, NULL))) {
+        return -1;
+    }
+    /* Format specs and conversions are not supported */
+    if (!len || memchr(name, ':', len) || memchr(name, '!', len)
+            || memchr(name, '{', len)) {
+        PyErr_Format(PyExc_ValueError,
+            "invalid field in template: '{%U}'", key);
+        goto exit;
+    }
+
+    if ((idx = PyDict_GetItemWithError(self->index, key))) {
+        rv = PyLong_AsSsize_t(idx);
+        goto exit;
+    }
+    if (PyErr_Occurred()) {
+        goto exit;
+    }
+    rv = PyList_GET_SIZE(names);
+    if (!(idx = PyLong_FromSsize_t(rv))
+            || 0 > PyDict_SetItem(self->index, key, idx)
+            || 0 > PyList_Append(names, key)) {
+        Py_XDECREF(idx);
+        rv = -1;
+        goto exit;
+    }
+    Py_DECREF(idx);
+
+exit:
+    Py_DECREF(key);
+    return rv;
+}
+
+
+/* Split the template into literals and fields. */
+static int
+parse_template(spt_Template *self, const char *template, size_t len)
+{
+    PyObject *names = NULL;
+    spt_segment *seg = NULL;
+    size_t i = 0, nlit = 0;
+    const char *end;
+    Py_ssize_t field;
+    int rv = -1;
+
+    if (!(self->literals = PyMem_Malloc(len ? len : 1))
+            || !(self->segments = PyMem_New(spt_segment, len + 1))) {
+        PyErr_NoMemory();
+        goto exit;
+    }
+    if (!(names = PyList_New(0)) || !(self->index = PyDict_New())) {
+        goto exit;
+    }
+
+    while (i < len) {
+        char c = template[i];
+
+        if ((c == '{' || c == '}') && i + 1 < len && template[i + 1] == c) {
+            /* Escaped brace */
+            i++;
+        }
+        else if (c == '{') {
+            if (!(end = memchr(template + i + 1, '}', len - i - 1))) {
+                PyErr_SetString(PyExc_ValueError,
+                    "single '{' encountered in template");
+                goto exit;
+            }
+            if (0 > (field = add_field(self, names,
+                    template + i + 1, (size_t)(end - template) - i - 1))) {
+                goto exit;
+            }
+            seg = &self->segments[self->nsegments++];
+            seg->field = field;
+            seg->start = seg->len = 0;
+            seg = NULL;
+            i = (size_t)(end - template) + 1;
+            continue;
+        }
+        else if (c == '}') {
+            PyErr_SetString(PyExc_ValueError,
+                "single '}' encountered in template");
+            goto exit;
+        }
+
+        /* Literal char: extend the current literal segment */
+        if (!seg) {
+            seg = &self->segments[self->nsegments++];
+            seg->field = -1;
+            seg->start = nlit;
+            seg->len = 0;
+        }
+        self->literals[nlit++] = c;
+        seg->len++;
+        i++;
+    }
+
+    if (!(self->fields = PyList_AsTuple(names))) {
+        goto exit;
+    }
+    if (!(self->values = PyMem_New(spt_value, PyTuple_GET_SIZE(self->fields)
+            ? PyTuple_GET_SIZE(self->fields) : 1))) {
+        PyErr_NoMemory();
+        goto exit;
+    }
+    memset(self->values, 0,
+        sizeof(spt_value) * (size_t)PyTuple_GET_SIZE(self->fields));
+    rv = 0;
+
+exit:
+    Py_XDECREF(names);
+    return rv;
+}
+
+
+/* Store len bytes of data as the value of a field. */
+static int
+store_value(spt_value *value, const char *data, size_t len)
+{
+    if (len > value->size) {
+        char *p;
+
+        if (!(p = PyMem_Realloc(value->data, len))) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        value->data = p;
+        value->size = len;
+    }
+    memcpy(value->data, data, len);
+    value->len = len;
+    return 0;
+}
+
+
+/* Convert obj to text and store it as the value of the field. */
+static int
+set_value(spt_Template *self, Py_ssize_t field, PyObject *obj)
+{
+    spt_value *value = &self->values[field];
+    spt_title_arg text;
+    PyObject *str = NULL;
+    const char *name;
+    int rv = -1;
+
+    /* Render the integers here, to spare creating a string */
+    if (PyLong_CheckExact(obj)) {
+        char buf[24];
+        char *p = buf + sizeof(buf);
+        unsigned long long n;
+        long long v;
+        int overflow;
+
+        v = PyLong_AsLongLongAndOverflow(obj, &overflow);
+        if (v == -1 && PyErr_Occurred()) {
+            return -1;
+        }
+        if (!overflow) {
+            n = v < 0 ? 0ULL - (unsigned long long)v : (unsigned long long)v;
+            do {
+                *--p = '0' + (char)(n % 10);
+                n /= 10;
+            } while (n);
+            if (v < 0) {
+                *--p = '-';
+            }
+            return store_value(value, p, (size_t)(buf + sizeof(buf) - p));
+        }
+    }
+
+    if (!PyUnicode_Check(obj) && !PyObject_CheckBuffer(obj)) {
+        if (!(obj = str = PyObject_Str(obj))) {
+            return -1;
+        }
+    }
+    if (!(name = PyUnicode_AsUTF8(PyTuple_GET_ITEM(self->fields, field)))) {
+        goto exit;
+    }
+    if (0 > spt_title_from_object(obj, name, &text)) {
+        goto exit;
+    }
+    rv = store_value(value, text.data, (size_t)text.len);
+    spt_title_release(&text);
+
+exit:
+    Py_XDECREF(str);
+    return rv;
+}
+
+
+/* Render the title from the template into self->next. Return its length,
+ * or -1 on error. */
+static Py_ssize_t
+render(spt_Template *self)
+{
+    size_t len = 0;
+    Py_ssize_t i;
+    char *p;
+
+    for (i = 0; i < self->nsegments; i++) {
+        spt_segment *seg = &self->segments[i];
+        len += seg->field < 0 ? seg->len : self->values[seg->field].len;
+    }
+
+    if (len > self->size || !self->next) {
+        size_t size = len ? len : 1;
+
+        if (!(p = PyMem_Realloc(self->title, size))) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        self->title = p;
+        if (!(p = PyMem_Realloc(self->next, size))) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        self->next = p;
+        self->size = size;
+    }
+
+    p = self->next;
+    for (i = 0; i < self->nsegments; i++) {
+        spt_segment *seg = &self->segments[i];
+        if (seg->field < 0) {
+            memcpy(p, self->literals + seg->start, seg->len);
+            p += seg->len;
+        }
+        else {
+            spt_value *value = &self->values[seg->field];
+            memcpy(p, value->data, value->len);
+            p += value->len;
+        }
+    }
+
+    return (Py_ssize_t)len;
+}
+
+
+/* Show the title in self->next, of length len, writing in the ps display
+ * only the part changed since the last title shown, if still displayed. */
+static void
+show_title(spt_Template *self, size_t len)
+{
+    unsigned long long generation = 0;
+    size_t start = 0, end, tlen, dlen;
+    char *tmp;
+
+    spt_writer_lock();
+
+    if (self->generation
+            && self->generation == get_ps_display_generation()) {
+        while (start < len && start < self->len
+                && self->next[start] == self->title[start]) {
+            start++;
+        }
+        if (len == self->len) {
+            /* Nothing to write if unchanged, but count the update skipped */
+            end = len;
+            while (end > start
+                    && self->next[end - 1] == self->title[end - 1]) {
+                end--;
+            }
+            generation = overwrite_ps_display(self->generation,
+                self->offset + start, self->next + start, end - start);
+        }
+        else {
+            generation = rewrite_ps_display(self->generation,
+                self->offset + start, self->next + start, len - start);
+        }
+    }
+
+    if (!generation) {
+        /* The title is displayed after the prefix, if any */
+        reserve_ps_display_len(len);
+        set_ps_display_len(self->next, len, true);
+        get_ps_title(&tlen);
+        get_ps_display(&dlen);
+        self->offset = tlen - dlen;
+        generation = get_ps_display_generation();
+    }
+
+    self->generation = generation;
+    spt_writer_unlock();
+
+    tmp = self->title;
+    self->title = self->next;
+    self->next = tmp;
+    self->len = len;
+}
+
+
+static PyObject *
+template_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"template", NULL};
+    PyObject *obj;
+    spt_title_arg template;
+    spt_Template *self = NULL;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O", kwlist, &obj)) {
+        return NULL;
+    }
+    if (0 > spt_title_from_object(obj, "template", &template)) {
+        return NULL;
+    }
+
+    if (!(self = (spt_Template *)type->tp_alloc(type, 0))) {
+        goto exit;
+    }
+    if (0 > parse_template(self, template.data, (size_t)template.len)) {
+        Py_CLEAR(self);
+    }
+
+exit:
+    spt_title_release(&template);
+    return (PyObject *)self;
+}
+
+
+static void
+template_dealloc(spt_Template *self)
+{
+    PyTypeObject *tp = Py_TYPE(self);
+    Py_ssize_t i;
+
+    if (self->values) {
+        for (i = 0; i < PyTuple_GET_SIZE(self->fields); i++) {
+            PyMem_Free(self->values[i].data);
+        }
+        PyMem_Free(self->values);
+    }
+    Py_XDECREF(self->fields);
+    Py_XDECREF(self->index);
+    PyMem_Free(self->segments);
+    PyMem_Free(self->literals);
+    PyMem_Free(self->title);
+    PyMem_Free(self->next);
+    tp->tp_free((PyObject *)self);
+    Py_DECREF(tp);
+}
+
+
+static char template_set__doc__[] =
+"set(**fields) -- Change some fields and show the title.\n\n"
+"Only the part of the title changed is written in the process title, if\n"
+"the title is already displayed."
+;
+
+static PyObject *
+template_set(spt_Template *self,
+    PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)
+{
+    Py_ssize_t i, nkw, field, len;
+    PyObject *idx;
+    PyObject *rv = NULL;
+
+    if (nargs) {
+        PyErr_SetString(PyExc_TypeError,
+            "set() takes only keyword arguments");
+        return NULL;
+    }
+
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    nkw = kwnames ? PyTuple_GET_SIZE(kwnames) : 0;
+
+    Py_BEGIN_CRITICAL_SECTION(self);
+    for (i = 0; i < nkw; i++) {
+        PyObject *name = PyTuple_GET_ITEM(kwnames, i);
+
+        if (!(idx = PyDict_GetItemWithError(self->index, name))) {
+            if (!PyErr_Occurred()) {
+                PyErr_Format(PyExc_TypeError,
+                    "set() got an unexpected field '%U'", name);
+            }
+            goto exit;
+        }
+        field = PyLong_AsSsize_t(idx);
+        if (0 > set_value(self, field, args[i])) {
+            goto exit;
+        }
+    }
+
+    if (0 > (len = render(self))) {
+        goto exit;
+    }
+    show_title(self, (size_t)len);
+    rv = Py_None;
+    Py_INCREF(rv);
+
+exit:
+    Py_END_CRITICAL_SECTION();
+    return rv;
+}
+
+
+static PyObject *
+template_str(spt_Template *self)
+{
+    Py_ssize_t len;
+    PyObject *rv = NULL;
+
+    Py_BEGIN_CRITICAL_SECTION(self);
+    if (0 <= (len = render(self))) {
+        rv = PyUnicode_DecodeUTF8(self->next, len, "replace");
+    }
+    Py_END_CRITICAL_SECTION();
+
+    return rv;
+}
+
+
+static PyObject *
+template_get_fields(spt_Template *self, void *closure)
+{
+    Py_INCREF(self->fields);
+    return self->fields;
+}
+
+
+static PyMethodDef template_methods[] = {
+    {"set",
+        (PyCFunction)(void(*)(void))template_set,
+        METH_FASTCALL | METH_KEYWORDS,
+        template_set__doc__},
+
+    {NULL, NULL, 0, NULL}
+};
+
+static PyGetSetDef template_getset[] = {
+    {"fields", (getter)template_get_fields, NULL,
+        "The names of the template fields.", NULL},
+    {NULL, NULL, NULL, NULL, NULL}
+};
+
+static char template__doc__[] =
+"Template(template) -- A title with named fields, parsed once.\n\n"
+"template is a str or bytes-like object with '{name}' fields, which are\n"
+"empty until set() is called. Use '{{' and '}}' for literal braces."
+;
+
+static PyType_Slot template_slots[] = {
+    {Py_tp_doc, template__doc__},
+    {Py_tp_new, template_new},
+    {Py_tp_dealloc, template_dealloc},
+    {Py_tp_str, template_str},
+    {Py_tp_methods, template_methods},
+    {Py_tp_getset, template_getset},
+    {0, NULL}
+};
+
+static PyType_Spec template_spec = {
+    "setproctitle.Template",
+    sizeof(spt_Template),
+    0,
+    Py_TPFLAGS_DEFAULT,
+    template_slots
+};
+
+
+/* Return a new reference to the Template type for a module instance. */
+PyObject *
+spt_template_type_new(void)
+{
+    return PyType_FromSpec(&template_spec);
+}
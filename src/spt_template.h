@@ -0,0 +1,18 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_template.h
+ *    Process title template with named fields, rendered in place.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#ifndef SPT_TEMPLATE_H
+#define SPT_TEMPLATE_H
+
+#include "spt.h"
+
+HIDDEN PyObject *spt_template_type_new(void);
+
+#endif   /* SPT_TEMPLATE_H */
@@ -0,0 +1,189 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_title.c
+ *    Process title prepared once and applied many times.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ * A Title is encoded and truncated to the space available in the ps
+ * display when it is created. Applying it only copies its bytes into the
+ * ps display, without parsing arguments or encoding strings again, which
+ * helps programs switching among a few titles often.
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#include "spt_title.h"
+#include "spt_args.h"
+#include "spt_setup.h"
+#include "spt_status.h"
+#include "spt_writer.h"
+
+#include <string.h>
+
+typedef struct {
+    PyObject_HEAD
+    char *title;                /* the title encoded, without terminator */
+    size_t len;                 /* length of the title */
+    size_t capacity;            /* max length of a title in the ps display */
+    bool truncated;             /* the title didn't fit the capacity */
+} spt_Title;
+
+
+static PyObject *
+title_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"text", NULL};
+    PyObject *obj;
+    spt_title_arg text;
+    spt_Title *self = NULL;
+    size_t size;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O", kwlist, &obj)) {
+        return NULL;
+    }
+    if (0 > spt_title_from_object(obj, "text", &text)) {
+        return NULL;
+    }
+
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    /* The title area is only extended when the title is applied */
+    spt_writer_lock();
+    size = get_ps_buffer_max_size();
+    spt_writer_unlock();
+
+    if (!(self = (spt_Title *)type->tp_alloc(type, 0))) {
+        goto exit;
+    }
+    self->capacity = size ? size - 1 : 0;
+    self->len = (size_t)text.len;
+    if (self->len > self->capacity) {
+        self->len = self->capacity;
+        self->truncated = true;
+    }
+    if (!(self->title = PyMem_Malloc(self->len ? self->len : 1))) {
+        PyErr_NoMemory();
+        Py_CLEAR(self);
+        goto exit;
+    }
+    memcpy(self->title, text.data, self->len);
+
+exit:
+    spt_title_release(&text);
+    return (PyObject *)self;
+}
+
+
+static void
+title_dealloc(spt_Title *self)
+{
+    PyTypeObject *tp = Py_TYPE(self);
+
+    PyMem_Free(self->title);
+    tp->tp_free((PyObject *)self);
+    Py_DECREF(tp);
+}
+
+
+static char title_apply__doc__[] =
+"apply() -- Set the process title to this title.\n\n"
+"As with setproctitle(), the prefix set by set_title_prefix() is dropped."
+;
+
+static PyObject *
+title_apply(spt_Title *self, PyObject *args)
+{
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    /* Leave the title to the writer thread, if running */
+    spt_writer_reserve(self->len, false);
+    if (!spt_writer_submit(self->title, self->len)) {
+        if (get_ps_write_size(self->len) > NOGIL_WRITE_SIZE) {
+            Py_BEGIN_ALLOW_THREADS
+            spt_writer_set_title(self->title, self->len);
+            Py_END_ALLOW_THREADS
+        }
+        else {
+            spt_writer_set_title(self->title, self->len);
+        }
+    }
+
+    Py_RETURN_NONE;
+}
+
+
+static PyObject *
+title_str(spt_Title *self)
+{
+    return PyUnicode_DecodeUTF8(self->title, (Py_ssize_t)self->len, "replace");
+}
+
+
+static PyObject *
+title_get_truncated(spt_Title *self, void *closure)
+{
+    return PyBool_FromLong(self->truncated);
+}
+
+
+static PyObject *
+title_get_capacity(spt_Title *self, void *closure)
+{
+    return PyLong_FromSize_t(self->capacity);
+}
+
+
+static PyMethodDef title_methods[] = {
+    {"apply",
+        (PyCFunction)title_apply,
+        METH_NOARGS,
+        title_apply__doc__},
+
+    {NULL, NULL, 0, NULL}
+};
+
+static PyGetSetDef title_getset[] = {
+    {"truncated", (getter)title_get_truncated, NULL,
+        "True if the text was truncated to fit the title area.", NULL},
+    {"capacity", (getter)title_get_capacity, NULL,
+        "The maximum length of a title, in bytes.", NULL},
+    {NULL, NULL, NULL, NULL, NULL}
+};
+
+static char title__doc__[] =
+"Title(text) -- A process title prepared to be set many times.\n\n"
+"text is a str or bytes-like object, encoded and truncated to the space\n"
+"available for the title once. Call apply() to set the process title;\n"
+"str() returns the title, as it will be displayed."
+;
+
+static PyType_Slot title_slots[] = {
+    {Py_tp_doc, title__doc__},
+    {Py_tp_new, title_new},
+    {Py_tp_dealloc, title_dealloc},
+    {Py_tp_str, title_str},
+    {Py_tp_methods, title_methods},
+    {Py_tp_getset, title_getset},
+    {0, NULL}
+};
+
+static PyType_Spec title_spec = {
+    "setproctitle.Title",
+    sizeof(spt_Title),
+    0,
+    Py_TPFLAGS_DEFAULT,
+    title_slots
+};
+
+
+/* Return a new reference to the Title type for a module instance. */
+PyObject *
+spt_title_type_new(void)
+{
+    return PyType_FromSpec(&title_spec);
+}
@@ -0,0 +1,18 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_title.h
+ *    Process title prepared once and applied many times.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#ifndef SPT_TITLE_H
+#define SPT_TITLE_H
+
+#include "spt.h"
+
+HIDDEN PyObject *spt_title_type_new(void);
+
+#endif   /* SPT_TITLE_H */
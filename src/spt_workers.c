@@ -0,0 +1,398 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_workers.c
+ *    Titles given automatically to the processes forked.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ * When worker titles are enabled, every child forked by the process sets
+ * its title from a template, which can include the title of the parent and
+ * a worker number. The numbers are taken from a counter in shared memory,
+ * so every child gets a different one, even if forked by other children.
+ *
+ * The template is parsed, and the module initialized, in the parent: the
+ * children only render the template and write the title.
+ *
+ * The template is shared by all the interpreters of the process, so it is
+ * allocated with the raw allocator and replaced with the writer lock held.
+ * The fork hook is registered in every interpreter enabling the titles,
+ * because os.fork() only calls the hooks of the interpreter forking, but
+ * only once per interpreter, even if the module is imported again.
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#include "spt.h"
+#include "spt_workers.h"
+#include "spt_setup.h"
+#include "spt_status.h"
+#include "spt_writer.h"
+
+#ifndef WIN32
+
+#include <stdio.h>
+#include <string.h>
+#include <sys/mman.h>
+
+#ifndef MAP_ANONYMOUS
+#define MAP_ANONYMOUS MAP_ANON
+#endif
+
+/* A piece of the template */
+typedef enum {
+    PART_TEXT,                  /* a chunk of the template text */
+    PART_PARENT_TITLE,          /* the {parent_title} field */
+    PART_N                      /* the {n} field */
+} part_type;
+
+typedef struct template_part {
+    part_type type;
+    size_t offset;              /* of the text in workers_text */
+    size_t len;
+} template_part;
+
+static bool workers_enabled = false;
+static char *workers_text;      /* the template text, unescaped */
+static template_part *workers_parts;
+static size_t workers_nparts;
+static int *workers_next;       /* the next worker number, shared memory */
+
+/* Key of the interpreter state dict holding the fork hook registered.
+ * PyPy has a single interpreter: a flag is enough. */
+#ifndef IS_PYPY
+#define REGISTERED_KEY "setproctitle.workers_after_fork"
+#else
+static bool workers_registered = false;
+#endif
+
+
+/* Parse the template into parts and the unescaped text they refer to.
+ *
+ * Return 0 in case of success, else -1 and set a Python exception.
+ */
+static int
+parse_template(const char *template, size_t len,
+               template_part **parts_out, size_t *nparts_out, char **text_out)
+{
+    template_part *parts, *part = NULL;
+    char *text;
+    size_t i, tlen = 0, nparts = 0;
+
+    /* No more parts than chars, no more text than the template */
+    if (!(parts = PyMem_RawMalloc((len + 1) * sizeof(template_part)))) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    if (!(text = PyMem_RawMalloc(len + 1))) {
+        PyMem_RawFree(parts);
+        PyErr_NoMemory();
+        return -1;
+    }
+
+    for (i = 0; i < len; i++) {
+        if (template[i] == '{' && i + 1 < len && template[i + 1] != '{') {
+            const char *end = memchr(template + i, '}', len - i);
+            size_t flen = end ? (size_t)(end - template) - i - 1 : 0;
+
+            part = &parts[nparts++];
+            part->offset = part->len = 0;
+            if (flen == 12
+                    && 0 == strncmp(template + i + 1, "parent_title", 12)) {
+                part->type = PART_PARENT_TITLE;
+            }
+            else if (flen == 1 && template[i + 1] == 'n') {
+                part->type = PART_N;
+            }
+            else {
+                PyErr_Format(PyExc_ValueError,
+                    "bad field at position %zu in template: only"
+                    " {parent_title} and {n} are supported", i);
+                goto error;
+            }
+            part = NULL;
+            i += flen + 1;
+            continue;
+        }
+
+        if (template[i] == '{' || template[i] == '}') {
+            /* Only doubled braces are allowed outside of a field */
+            if (i + 1 >= len || template[i + 1] != template[i]) {
+                PyErr_Format(PyExc_ValueError,
+                    "single '%c' at position %zu in template",
+                    template[i], i);
+                goto error;
+            }
+            i++;
+        }
+
+        if (!part) {
+            part = &parts[nparts++];
+            part->type = PART_TEXT;
+            part->offset = tlen;
+            part->len = 0;
+        }
+        text[tlen++] = template[i];
+        part->len++;
+    }
+
+    *parts_out = parts;
+    *nparts_out = nparts;
+    *text_out = text;
+    return 0;
+
+error:
+    PyMem_RawFree(parts);
+    PyMem_RawFree(text);
+    return -1;
+}
+
+
+/* Append len bytes of data to buf, if there is space. */
+static void
+append(char *buf, size_t size, size_t *pos, const char *data, size_t len)
+{
+    if (len > size - *pos) {
+        len = size - *pos;
+    }
+    memcpy(buf + *pos, data, len);
+    *pos += len;
+}
+
+
+/* Set the title of the process from the template, after fork(). */
+static PyObject *
+workers_after_fork(PyObject *self, PyObject *args)
+{
+    char *buf;
+    char nbuf[16];
+    const char *parent;
+    size_t i, size, pos = 0, plen;
+    int n;
+
+    if (!workers_enabled) {
+        Py_RETURN_NONE;
+    }
+
+    n = __atomic_fetch_add(workers_next, 1, __ATOMIC_RELAXED);
+
+    /* Don't render more than the title can keep */
+    if (!(size = get_ps_buffer_size())) {
+        Py_RETURN_NONE;
+    }
+    size--;
+    if (!(buf = PyMem_Malloc(size))) {
+        return PyErr_NoMemory();
+    }
+
+    spt_writer_lock();
+    parent = get_ps_title(&plen);
+    for (i = 0; i < workers_nparts; i++) {
+        template_part *part = &workers_parts[i];
+
+        switch (part->type) {
+        case PART_TEXT:
+            append(buf, size, &pos, workers_text + part->offset, part->len);
+            break;
+        case PART_PARENT_TITLE:
+            append(buf, size, &pos, parent, plen);
+            break;
+        case PART_N:
+            append(buf, size, &pos, nbuf,
+                (size_t)snprintf(nbuf, sizeof(nbuf), "%d", n));
+            break;
+        }
+    }
+    clear_ps_display_prefix();
+    reserve_ps_display_len(pos);
+    set_ps_display_len(buf, pos, true);
+    spt_writer_unlock();
+
+    PyMem_Free(buf);
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef workers_after_fork_def = {
+    "_workers_after_fork",
+    (PyCFunction)workers_after_fork,
+    METH_NOARGS,
+    NULL
+};
+
+
+/* Call workers_after_fork() in the children forked by os.fork() from the
+ * current interpreter.
+ *
+ * Only the first call in every interpreter registers the hook: the
+ * following ones, from the same or from other module objects, do nothing.
+ *
+ * Return 0 in case of success, else -1 and set a Python exception.
+ */
+int
+spt_workers_register(void)
+{
+    PyObject *os = NULL, *reg = NULL, *func = NULL, *kwargs = NULL;
+    PyObject *empty = NULL, *rv = NULL;
+#ifndef IS_PYPY
+    PyObject *dict = NULL, *key = NULL, *found;
+
+    if (!(func = PyCFunction_New(&workers_after_fork_def, NULL))) {
+        return -1;
+    }
+    if (!(dict = PyInterpreterState_GetDict(PyInterpreterState_Get()))) {
+        PyErr_SetString(PyExc_RuntimeError,
+            "failed to access the interpreter state");
+        goto exit;
+    }
+    if (!(key = PyUnicode_InternFromString(REGISTERED_KEY))) {
+        goto exit;
+    }
+    /* Atomic, in case two threads are enabling the titles */
+    if (!(found = PyDict_SetDefault(dict, key, func))) {
+        goto exit;
+    }
+    if (found != func) {
+        Py_DECREF(key);
+        Py_DECREF(func);
+        return 0;
+    }
+#else
+    if (__atomic_exchange_n(&workers_registered, true, __ATOMIC_RELAXED)) {
+        return 0;
+    }
+    if (!(func = PyCFunction_New(&workers_after_fork_def, NULL))) {
+        goto exit;
+    }
+#endif
+
+    if (!(os = PyImport_ImportModule("os"))) { goto exit; }
+    if (!(reg = PyObject_GetAttrString(os, "register_at_fork"))) {
+        goto exit;
+    }
+    if (!(kwargs = Py_BuildValue("{sO}", "after_in_child", func))) {
+        goto exit;
+    }
+    if (!(empty = PyTuple_New(0))) { goto exit; }
+    rv = PyObject_Call(reg, empty, kwargs);
+
+exit:
+    if (!rv) {
+        /* Let the next call try again */
+#ifndef IS_PYPY
+        if (key && PyDict_GetItem(dict, key) == func) {
+            PyObject *type, *value, *tb;
+
+            PyErr_Fetch(&type, &value, &tb);
+            if (0 > PyDict_DelItem(dict, key)) {
+                PyErr_Clear();
+            }
+            PyErr_Restore(type, value, tb);
+        }
+#else
+        __atomic_store_n(&workers_registered, false, __ATOMIC_RELAXED);
+#endif
+    }
+#ifndef IS_PYPY
+    Py_XDECREF(key);
+#endif
+    Py_XDECREF(rv);
+    Py_XDECREF(empty);
+    Py_XDECREF(kwargs);
+    Py_XDECREF(func);
+    Py_XDECREF(reg);
+    Py_XDECREF(os);
+    return rv ? 0 : -1;
+}
+
+
+/* Release the template and the counter. Call with the writer lock held. */
+static void
+workers_clear(void)
+{
+    workers_enabled = false;
+    PyMem_RawFree(workers_parts);
+    PyMem_RawFree(workers_text);
+    workers_parts = NULL;
+    workers_text = NULL;
+    workers_nparts = 0;
+    if (workers_next) {
+        munmap(workers_next, sizeof(int));
+        workers_next = NULL;
+    }
+}
+
+
+/* Give a title rendered from template to the processes forked from now on.
+ *
+ * Return 0 in case of success, else -1 and set a Python exception.
+ */
+int
+spt_workers_enable(const char *template, size_t len, int start)
+{
+    template_part *parts;
+    size_t nparts;
+    char *text;
+    int *next;
+
+    /* Discover the title area now, instead of in every child */
+    if (spt_setup() < 0) {
+        spt_debug("failed to initialize setproctitle");
+    }
+
+    if (0 > parse_template(template, len, &parts, &nparts, &text)) {
+        return -1;
+    }
+
+    /* A new counter: the one inherited, if any, is the parent's */
+    next = mmap(NULL, sizeof(int), PROT_READ | PROT_WRITE,
+        MAP_SHARED | MAP_ANONYMOUS, -1, 0);
+    if (next == MAP_FAILED) {
+        PyErr_SetFromErrno(PyExc_OSError);
+        PyMem_RawFree(parts);
+        PyMem_RawFree(text);
+        return -1;
+    }
+    *next = start;
+
+    spt_writer_lock();
+    workers_clear();
+    workers_parts = parts;
+    workers_nparts = nparts;
+    workers_text = text;
+    workers_next = next;
+    workers_enabled = true;
+    spt_writer_unlock();
+    return 0;
+}
+
+
+/* Stop setting the title of the processes forked. */
+void
+spt_workers_disable(void)
+{
+    spt_writer_lock();
+    workers_clear();
+    spt_writer_unlock();
+}
+
+#else   /* WIN32 */
+
+int
+spt_workers_register(void)
+{
+    return 0;
+}
+
+int
+spt_workers_enable(const char *template, size_t len, int start)
+{
+    PyErr_SetString(PyExc_NotImplementedError,
+        "worker titles are not available on this platform");
+    return -1;
+}
+
+void
+spt_workers_disable(void)
+{
+}
+
+#endif  /* WIN32 */
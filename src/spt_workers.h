@@ -0,0 +1,22 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_workers.h
+ *    Titles given automatically to the processes forked.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#ifndef SPT_WORKERS_H
+#define SPT_WORKERS_H
+
+#include "spt.h"
+
+HIDDEN int spt_workers_register(void);
+
+HIDDEN int spt_workers_enable(const char *template, size_t len, int start);
+
+HIDDEN void spt_workers_disable(void);
+
+#endif   /* SPT_WORKERS_H */
@@ -0,0 +1,590 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_writer.c
+ *    Background thread coalescing the process title updates.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ * When the writer is running, setproctitle() only stores the title in a
+ * slot. A native thread writes the latest title stored into the ps display,
+ * no more often than the rate requested. Intermediate titles are never
+ * written.
+ *
+ * The thread doesn't use any Python API, so it doesn't need the GIL.
+ *
+ * The same lock serializes all the changes to the ps display, whether the
+ * writer is running or not, because they can happen concurrently in
+ * free-threaded Python or with the GIL released. setproctitle() doesn't
+ * wait for the lock though: if another thread holds it, the title is left
+ * in a pending slot, and the lock owner writes it before releasing the
+ * lock. If more titles are left meanwhile, only the latest is written.
+ *
+ * The state is shared by all the interpreters of the process, which can
+ * run in parallel if they have their own GIL: starting and stopping the
+ * writer is serialized by a separate lock, held while waiting for the
+ * writer thread to exit.
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#include "spt.h"
+#include "spt_status.h"
+#include "spt_writer.h"
+
+#ifndef WIN32
+
+#include <errno.h>
+#include <pthread.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/time.h>
+
+/* The lock protects all the following variables, and the ps display. */
+static pthread_mutex_t control_mutex = PTHREAD_MUTEX_INITIALIZER;
+static pthread_mutex_t writer_mutex = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t writer_cond = PTHREAD_COND_INITIALIZER;
+static pthread_t writer_thread;
+
+static bool writer_running = false;     /* the thread was started */
+static bool writer_stopping = false;    /* the thread was asked to exit */
+static bool writer_idle = false;        /* the thread waits for a title */
+static long long writer_interval_ns;    /* min time between two writes */
+
+static char *slot = NULL;               /* the latest title submitted */
+static size_t slot_size = 0;
+static bool slot_dirty = false;         /* the slot was not written yet */
+
+/* The pending lock protects the following variables. The titles left by
+ * setproctitle() calls finding the writer lock taken are stored in the
+ * pending buffer; the lock owner swaps it with the spare one to write it. */
+static pthread_mutex_t pending_mutex = PTHREAD_MUTEX_INITIALIZER;
+static char *pending = NULL;
+static char *pending_spare = NULL;
+static size_t pending_size = 0;
+static size_t pending_len = 0;
+static bool pending_dirty = false;      /* the title was not written yet */
+
+static pthread_once_t atfork_once = PTHREAD_ONCE_INIT;
+
+
+/* Write the title in the slot, if any, into the ps display.
+ *
+ * Must be called with the lock held.
+ */
+static void
+writer_apply(void)
+{
+    if (!slot_dirty) {
+        return;
+    }
+    clear_ps_display_prefix();
+    update_process_title_from_thread = true;
+    set_ps_display(slot, true);
+    update_process_title_from_thread = false;
+    slot_dirty = false;
+}
+
+
+static void *
+writer_main(void *arg)
+{
+    struct timeval now;
+    struct timespec deadline;
+    long long ns;
+
+    pthread_mutex_lock(&writer_mutex);
+    while (!writer_stopping) {
+        if (!slot_dirty) {
+            writer_idle = true;
+            pthread_cond_wait(&writer_cond, &writer_mutex);
+            writer_idle = false;
+            continue;
+        }
+
+        writer_apply();
+
+        /* Don't write anything else before the interval has passed:
+         * only a stop request can wake us up earlier. */
+        gettimeofday(&now, NULL);
+        ns = now.tv_usec * 1000LL + writer_interval_ns;
+        deadline.tv_sec = now.tv_sec + (time_t)(ns / 1000000000LL);
+        deadline.tv_nsec = (long)(ns % 1000000000LL);
+        while (!writer_stopping) {
+            if (ETIMEDOUT == pthread_cond_timedwait(
+                    &writer_cond, &writer_mutex, &deadline)) {
+                break;
+            }
+        }
+    }
+    pthread_mutex_unlock(&writer_mutex);
+
+    return NULL;
+}
+
+
+/* Make sure that the state of the writer is sane after fork().
+ *
+ * Only the forking thread survives in the child, so the writer thread is
+ * gone: write the pending title, if any, and go back to direct writes.
+ * The titles left by other threads are dropped: the threads are gone too.
+ * The ps_buffer sequence is made even, in case the fork interrupted a write.
+ */
+static void
+writer_atfork_prepare(void)
+{
+    pthread_mutex_lock(&control_mutex);
+    pthread_mutex_lock(&writer_mutex);
+    pthread_mutex_lock(&pending_mutex);
+}
+
+static void
+writer_atfork_parent(void)
+{
+    pthread_mutex_unlock(&pending_mutex);
+    pthread_mutex_unlock(&writer_mutex);
+    pthread_mutex_unlock(&control_mutex);
+}
+
+static void
+writer_atfork_child(void)
+{
+    reset_ps_display_seq();
+    __atomic_store_n(&pending_dirty, false, __ATOMIC_RELAXED);
+    pthread_mutex_unlock(&pending_mutex);
+    if (writer_running) {
+        writer_apply();
+        __atomic_store_n(&writer_running, false, __ATOMIC_RELAXED);
+        writer_stopping = false;
+        writer_idle = false;
+    }
+    pthread_mutex_unlock(&writer_mutex);
+    pthread_mutex_unlock(&control_mutex);
+}
+
+static void
+register_atfork(void)
+{
+    int err;
+
+    if (0 != (err = pthread_atfork(writer_atfork_prepare,
+            writer_atfork_parent, writer_atfork_child))) {
+        spt_debug("failed to register the writer fork handlers: %d", err);
+    }
+}
+
+
+/* Release the writer lock, after writing the title left by other threads,
+ * if any. */
+static void
+writer_release(void)
+{
+    char *title;
+    size_t len;
+
+    for (;;) {
+        if (__atomic_load_n(&pending_dirty, __ATOMIC_ACQUIRE)) {
+            pthread_mutex_lock(&pending_mutex);
+            /* New titles will be left in the other buffer meanwhile */
+            title = pending;
+            len = pending_len;
+            pending = pending_spare;
+            pending_spare = title;
+            __atomic_store_n(&pending_dirty, false, __ATOMIC_RELAXED);
+            pthread_mutex_unlock(&pending_mutex);
+
+            clear_ps_display_prefix();
+            set_ps_display_len(title, len, true);
+            continue;
+        }
+        pthread_mutex_unlock(&writer_mutex);
+
+        /* A title might have been left after the check above, by a thread
+         * which failed to take the lock because we still had it. Pairs
+         * with the fence in spt_writer_set_title(). */
+        __atomic_thread_fence(__ATOMIC_SEQ_CST);
+        if (!__atomic_load_n(&pending_dirty, __ATOMIC_RELAXED)
+                || 0 != pthread_mutex_trylock(&writer_mutex)) {
+            break;
+        }
+    }
+}
+
+
+/* Leave a title in the pending buffer, to be written by the lock owner.
+ *
+ * Return false if the buffer couldn't be allocated, or if it is too small
+ * for the title, which might fit in the title area once extended.
+ */
+static bool
+leave_title(const char *title, size_t len)
+{
+    size_t size;
+    bool rv = true;
+
+    pthread_mutex_lock(&pending_mutex);
+    if (!pending) {
+        size = get_ps_buffer_size() + 1;
+        pending = malloc(size);
+        pending_spare = malloc(size);
+        if (!pending || !pending_spare) {
+            free(pending);
+            free(pending_spare);
+            pending = pending_spare = NULL;
+            rv = false;
+            goto exit;
+        }
+        pending_size = size;
+    }
+
+    if (len >= pending_size) {
+        if (ps_display_may_grow()
+                || pending_size < get_ps_buffer_size() + 1) {
+            rv = false;
+            goto exit;
+        }
+        len = pending_size - 1;
+    }
+    memcpy(pending, title, len);
+    pending_len = len;
+    __atomic_store_n(&pending_dirty, true, __ATOMIC_RELAXED);
+
+exit:
+    pthread_mutex_unlock(&pending_mutex);
+    return rv;
+}
+
+
+/* Start the writer thread, writing no more than max_rate titles per second.
+ *
+ * Return 0 in case of success, else -1 and set a Python exception.
+ */
+int
+spt_writer_start(double max_rate)
+{
+    static bool atexit_registered = false;
+    size_t size;
+    int err, rv = -1;
+
+    if (!(max_rate > 0.0)) {
+        PyErr_SetString(PyExc_ValueError, "max_rate must be positive");
+        return -1;
+    }
+
+    pthread_once(&atfork_once, register_atfork);
+
+    pthread_mutex_lock(&control_mutex);
+    pthread_mutex_lock(&writer_mutex);
+
+    /* Restarting only changes the rate */
+    writer_interval_ns = (long long)(1e9 / max_rate);
+    if (writer_running) {
+        spt_debug("coalescing writer already running");
+        rv = 0;
+        goto exit;
+    }
+
+    size = get_ps_buffer_size() + 1;
+    if (size > slot_size) {
+        char *new_slot;
+        if (!(new_slot = realloc(slot, size))) {
+            PyErr_NoMemory();
+            goto exit;
+        }
+        slot = new_slot;
+        slot_size = size;
+    }
+    slot_dirty = false;
+
+    /* The thread will wait for the lock to be released */
+    writer_stopping = false;
+    if (0 != (err = pthread_create(&writer_thread, NULL, writer_main, NULL))) {
+        errno = err;
+        PyErr_SetFromErrno(PyExc_OSError);
+        goto exit;
+    }
+    __atomic_store_n(&writer_running, true, __ATOMIC_RELAXED);
+    spt_debug("coalescing writer started");
+
+    /* Write the pending title on exit */
+    if (!atexit_registered) {
+        if (0 != Py_AtExit(spt_writer_stop)) {
+            spt_debug("failed to register the writer stop at exit");
+        }
+        atexit_registered = true;
+    }
+    rv = 0;
+
+exit:
+    writer_release();
+    pthread_mutex_unlock(&control_mutex);
+    return rv;
+}
+
+
+/* Stop the writer thread and write the pending title, if any.
+ *
+ * Further titles will be written immediately.
+ */
+void
+spt_writer_stop(void)
+{
+    pthread_mutex_lock(&control_mutex);
+    if (!writer_running) {
+        pthread_mutex_unlock(&control_mutex);
+        return;
+    }
+
+    pthread_mutex_lock(&writer_mutex);
+    writer_stopping = true;
+    pthread_cond_signal(&writer_cond);
+    pthread_mutex_unlock(&writer_mutex);
+
+    pthread_join(writer_thread, NULL);
+
+    pthread_mutex_lock(&writer_mutex);
+    writer_apply();
+    __atomic_store_n(&writer_running, false, __ATOMIC_RELAXED);
+    writer_release();
+    spt_debug("coalescing writer stopped");
+    pthread_mutex_unlock(&control_mutex);
+}
+
+
+/* Store a title to be written by the writer thread.
+ *
+ * Return false if the writer is not running: in this case the caller should
+ * write the title itself.
+ */
+bool
+spt_writer_submit(const char *title, size_t len)
+{
+    if (!__atomic_load_n(&writer_running, __ATOMIC_RELAXED)) {
+        return false;
+    }
+
+    pthread_mutex_lock(&writer_mutex);
+
+    /* Another interpreter might have stopped it meanwhile */
+    if (!writer_running) {
+        writer_release();
+        return false;
+    }
+
+    if (len >= slot_size) {
+        /* The title area might have been extended by spt_writer_reserve() */
+        char *new_slot;
+        size_t size;
+
+        size = get_ps_buffer_size() + 1;
+        if (size > slot_size && (new_slot = realloc(slot, size))) {
+            slot = new_slot;
+            slot_size = size;
+        }
+        if (len >= slot_size) {
+            len = slot_size - 1;
+        }
+    }
+    memcpy(slot, title, len);
+    slot[len] = '\0';
+    slot_dirty = true;
+    if (writer_idle) {
+        pthread_cond_signal(&writer_cond);
+    }
+    writer_release();
+
+    return true;
+}
+
+
+/* Write immediately the pending title, if any.
+ *
+ * The titles left by other threads are written too, so that a thread can
+ * read back the title it set, unless other threads set a title later.
+ */
+void
+spt_writer_flush(void)
+{
+    if (!__atomic_load_n(&writer_running, __ATOMIC_RELAXED)
+            && !__atomic_load_n(&pending_dirty, __ATOMIC_ACQUIRE)) {
+        return;
+    }
+
+    pthread_mutex_lock(&writer_mutex);
+    writer_apply();
+    writer_release();
+}
+
+
+/* Return a copy of the title which the writes pending will leave, if any.
+ *
+ * Return NULL if no title is pending, or if the copy couldn't be allocated.
+ * Otherwise return a malloc'd string, of length *len, to be freed by the
+ * caller. Nothing is written: the readers don't defeat the rate limit.
+ */
+char *
+spt_writer_pending_title(size_t *len)
+{
+    char *rv = NULL;
+
+    if (!__atomic_load_n(&writer_running, __ATOMIC_RELAXED)
+            && !__atomic_load_n(&pending_dirty, __ATOMIC_ACQUIRE)) {
+        return NULL;
+    }
+
+    /* The lock owner writes the pending buffer after the slot */
+    pthread_mutex_lock(&writer_mutex);
+    pthread_mutex_lock(&pending_mutex);
+    if (pending_dirty) {
+        if ((rv = malloc(pending_len + 1))) {
+            memcpy(rv, pending, pending_len);
+            *len = pending_len;
+        }
+    }
+    else if (slot_dirty) {
+        *len = strlen(slot);
+        if ((rv = malloc(*len + 1))) {
+            memcpy(rv, slot, *len);
+        }
+    }
+    pthread_mutex_unlock(&pending_mutex);
+    pthread_mutex_unlock(&writer_mutex);
+
+    if (rv) {
+        rv[*len] = '\0';
+    }
+    return rv;
+}
+
+
+/* Set the entire title, unless another thread is writing the title.
+ *
+ * In this case, leave the title to the other thread, which will write it,
+ * unless another title is left after this one.
+ */
+void
+spt_writer_set_title(const char *title, size_t len)
+{
+    pthread_once(&atfork_once, register_atfork);
+
+    if (0 != pthread_mutex_trylock(&writer_mutex)) {
+        if (leave_title(title, len)) {
+            /* The owner might have released the lock without seeing it */
+            __atomic_thread_fence(__ATOMIC_SEQ_CST);
+            if (0 == pthread_mutex_trylock(&writer_mutex)) {
+                writer_release();
+            }
+            return;
+        }
+        pthread_mutex_lock(&writer_mutex);
+    }
+
+    clear_ps_display_prefix();
+    set_ps_display_len(title, len, true);
+    writer_release();
+}
+
+
+/* Call these functions around a direct change of the ps display.
+ *
+ * They prevent other threads, including the writer, from writing
+ * concurrently. The title pending in the writer, if any, is written first:
+ * the lock owner might not change the title at all, or only a part of it.
+ */
+void
+spt_writer_lock(void)
+{
+    pthread_once(&atfork_once, register_atfork);
+
+    pthread_mutex_lock(&writer_mutex);
+    writer_apply();
+}
+
+void
+spt_writer_unlock(void)
+{
+    writer_release();
+}
+
+#else   /* WIN32 */
+
+#include <windows.h>
+
+int
+spt_writer_start(double max_rate)
+{
+    PyErr_SetString(PyExc_NotImplementedError,
+        "title coalescing is not available on this platform");
+    return -1;
+}
+
+void
+spt_writer_stop(void)
+{
+}
+
+bool
+spt_writer_submit(const char *title, size_t len)
+{
+    return false;
+}
+
+void
+spt_writer_flush(void)
+{
+}
+
+char *
+spt_writer_pending_title(size_t *len)
+{
+    return NULL;
+}
+
+/* Only the lock is needed to serialize the changes to the ps display. */
+static SRWLOCK writer_lock = SRWLOCK_INIT;
+
+void
+spt_writer_set_title(const char *title, size_t len)
+{
+    AcquireSRWLockExclusive(&writer_lock);
+    clear_ps_display_prefix();
+    set_ps_display_len(title, len, true);
+    ReleaseSRWLockExclusive(&writer_lock);
+}
+
+void
+spt_writer_lock(void)
+{
+    AcquireSRWLockExclusive(&writer_lock);
+}
+
+void
+spt_writer_unlock(void)
+{
+    ReleaseSRWLockExclusive(&writer_lock);
+}
+
+#endif  /* WIN32 */
+
+
+/* Make room in the title area for a title of len bytes, after the prefix if
+ * with_prefix is true.
+ *
+ * Call it holding the GIL, in the thread setting the title, before handing
+ * the title to the writer thread or releasing the GIL: it may move environ.
+ */
+void
+spt_writer_reserve(size_t len, bool with_prefix)
+{
+    if (!ps_display_may_grow()) {
+        return;
+    }
+
+    spt_writer_lock();
+    if (with_prefix) {
+        reserve_ps_display_len(len);
+    }
+    else {
+        reserve_ps_display(len + 1);
+    }
+    spt_writer_unlock();
+}
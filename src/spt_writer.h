@@ -0,0 +1,37 @@
+/*-------------------------------------------------------------------------
+ *
+ * spt_writer.h
+ *    Background thread coalescing the process title updates.
+ *
+ * Copyright (c) 2026 Daniele Varrazzo <daniele.varrazzo@gmail.com>
+ *
+ *-------------------------------------------------------------------------
+ */
+
+#ifndef SPT_WRITER_H
+#define SPT_WRITER_H
+
+#include "c.h"
+
+/* Release the GIL to write titles larger than this */
+#define NOGIL_WRITE_SIZE 65536
+
+HIDDEN int spt_writer_start(double max_rate);
+
+HIDDEN void spt_writer_stop(void);
+
+HIDDEN bool spt_writer_submit(const char *title, size_t len);
+
+HIDDEN void spt_writer_flush(void);
+
+HIDDEN char *spt_writer_pending_title(size_t *len);
+
+HIDDEN void spt_writer_set_title(const char *title, size_t len);
+
+HIDDEN void spt_writer_lock(void);
+
+HIDDEN void spt_writer_unlock(void);
+
+HIDDEN void spt_writer_reserve(size_t len, bool with_prefix);
+
+#endif   /* SPT_WRITER_H */
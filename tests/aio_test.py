@@ -0,0 +1,76 @@
+from .conftest import run_script
+
+
+def test_loop_title():
+    """The title shows the loop tasks, updated once per iteration."""
+    rv = run_script(
+        r"""
+import asyncio
+import setproctitle
+from setproctitle import aio
+
+async def job(n):
+    for i in range(n):
+        await asyncio.sleep(0)
+
+async def main():
+    setproctitle.set_title_prefix("server: ")
+    s0 = setproctitle.stats()
+    title = aio.install(template="{tasks} tasks, oldest: {oldest}")
+    tasks = [asyncio.create_task(job(n), name=f"job{n}") for n in (3, 1, 2)]
+    await asyncio.sleep(0)
+    print(setproctitle.getproctitle())
+
+    await asyncio.gather(*tasks)
+    await asyncio.sleep(0)
+    print(setproctitle.getproctitle())
+    # At most one update per iteration: the 3 tasks completing in the same
+    # iteration result in a single update.
+    print(setproctitle.stats()["updates"] - s0["updates"] <= 4)
+
+    title.uninstall()
+    await asyncio.create_task(job(1))
+    await asyncio.sleep(0)
+    print(setproctitle.getproctitle())
+
+asyncio.run(main())
+"""
+    )
+    assert rv.splitlines() == [
+        "server: 3 tasks, oldest: job3",
+        "server: 0 tasks, oldest: ",
+        "True",
+        "server: 0 tasks, oldest: ",
+    ]
+
+
+def test_loop_title_factory():
+    """The task factory already set is still used."""
+    rv = run_script(
+        r"""
+import asyncio
+import setproctitle
+from setproctitle import aio
+
+created = []
+
+def factory(loop, coro, **kwargs):
+    created.append(coro.__name__)
+    return asyncio.Task(coro, loop=loop, **kwargs)
+
+async def job():
+    await asyncio.sleep(0)
+
+async def main():
+    loop = asyncio.get_running_loop()
+    loop.set_task_factory(factory)
+    title = aio.install()
+    await asyncio.create_task(job())
+    title.uninstall()
+    print(created)
+    print(loop.get_task_factory() is factory)
+
+asyncio.run(main())
+"""
+    )
+    assert rv.splitlines() == ["['job']", "True"]
@@ -0,0 +1,184 @@
+from .conftest import run_script, skip_if_win32
+
+pytestmark = [skip_if_win32]
+
+
+def test_board(tmp_path):
+    """The titles of the processes are published in the board."""
+    rv = run_script(
+        f"""
+import os
+import setproctitle
+
+path = {str(tmp_path / "board")!r}
+setproctitle.enable_board(path, nslots=4)
+setproctitle.setproctitle("parent")
+
+board = setproctitle.StatusBoard(path)
+print(board.nslots)
+print(board.snapshot()[0][:2] == (os.getpid(), "parent"))
+
+r1, w1 = os.pipe()
+r2, w2 = os.pipe()
+pid = os.fork()
+if not pid:
+    setproctitle.setproctitle("child")
+    os.write(w1, b"x")
+    os.read(r2, 1)
+    os._exit(0)
+
+os.read(r1, 1)
+print(sorted(title for _, title, _, _ in board.snapshot()))
+os.write(w2, b"x")
+os.waitpid(pid, 0)
+
+setproctitle.disable_board()
+print(board.snapshot())
+board.close()
+"""
+    )
+    assert rv.splitlines() == [
+        "4",
+        "True",
+        "['child', 'parent']",
+        "[]",
+    ]
+
+
+def test_board_wait(tmp_path):
+    """Readers can wait for changes in the board."""
+    rv = run_script(
+        f"""
+import threading
+import time
+import setproctitle
+
+path = {str(tmp_path / "board")!r}
+setproctitle.enable_board(path)
+
+with setproctitle.StatusBoard(path) as board:
+    board.snapshot()
+    print(board.wait(timeout=0.01))
+
+    t = threading.Timer(0.1, setproctitle.setproctitle, ("changed",))
+    t.start()
+    print(board.wait(timeout=10))
+    t.join()
+
+    snap = board.snapshot()
+    print(snap[0][1])
+    print(abs(snap[0][2] - time.time()) < 10)
+"""
+    )
+    assert rv.splitlines() == ["False", "True", "changed", "True"]
+
+
+def test_board_counter(tmp_path):
+    """Counter updates are published in the board."""
+    rv = run_script(
+        f"""
+import setproctitle
+
+path = {str(tmp_path / "board")!r}
+setproctitle.enable_board(path)
+board = setproctitle.StatusBoard(path)
+
+c = setproctitle.Counter("done: {{}}")
+c.apply()
+c.increment(3)
+print(board.snapshot()[0][1])
+"""
+    )
+    assert rv.splitlines() == ["done: 3"]
+
+
+def test_not_a_board(tmp_path):
+    rv = run_script(
+        f"""
+import setproctitle
+
+path = {str(tmp_path / "board")!r}
+for content in ["", "x" * 1000]:
+    with open(path, "w") as f:
+        f.write(content)
+    try:
+        setproctitle.StatusBoard(path)
+    except ValueError:
+        print("ValueError")
+"""
+    )
+    assert rv.splitlines() == ["ValueError", "ValueError"]
+
+
+def test_board_killed_writer(tmp_path):
+    """A slot left half-written doesn't block the readers."""
+    rv = run_script(
+        f"""
+import os
+import mmap
+import struct
+import time
+import setproctitle
+
+path = {str(tmp_path / "board")!r}
+setproctitle.enable_board(path, nslots=1)
+setproctitle.setproctitle("title")
+
+# Simulate a process stuck while writing its slot, after the header
+r, w = os.pipe()
+pid = os.fork()
+if not pid:
+    os.read(r, 1)
+    os._exit(0)
+setproctitle.disable_board()
+with open(path, "r+b") as f, mmap.mmap(f.fileno(), 0) as m:
+    seq = struct.unpack_from("I", m, 64)[0]
+    struct.pack_into("Ii", m, 64, seq + 1, pid)
+
+board = setproctitle.StatusBoard(path)
+t0 = time.monotonic()
+print(board.snapshot() == [(pid, None, None, seq + 1)])
+print(time.monotonic() - t0 < 5)
+
+# Once the process is dead its slot is skipped, then reused
+os.write(w, b"x")
+os.waitpid(pid, 0)
+print(board.snapshot())
+setproctitle.enable_board(path)
+setproctitle.setproctitle("reused")
+print(board.snapshot()[0][:2] == (os.getpid(), "reused"))
+"""
+    )
+    assert rv.splitlines() == ["True", "True", "[]", "True"]
+
+
+def test_board_exited_child(tmp_path):
+    """The slots of the processes exited via os._exit() are skipped."""
+    rv = run_script(
+        f"""
+import os
+import setproctitle
+
+path = {str(tmp_path / "board")!r}
+setproctitle.enable_board(path, nslots=2)
+setproctitle.setproctitle("parent")
+
+pid = os.fork()
+if not pid:
+    setproctitle.setproctitle("child")
+    os._exit(0)
+os.waitpid(pid, 0)
+
+board = setproctitle.StatusBoard(path)
+print([title for _, title, _, _ in board.snapshot()])
+
+# The slot is free for the next child
+pid = os.fork()
+if not pid:
+    setproctitle.setproctitle("child 2")
+    print(sorted(title for _, title, _, _ in board.snapshot()), flush=True)
+    os._exit(0)
+os.waitpid(pid, 0)
+"""
+    )
+    assert rv.splitlines() == ["['parent']", "['child 2', 'parent']"]
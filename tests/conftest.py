@@ -1,6 +1,7 @@
 import os
 import sys
 import subprocess as sp
+from importlib.util import find_spec
 
 import pytest
 
@@ -41,6 +42,11 @@ skip_if_no_proc_tasks = pytest.mark.skipif(
     reason="'/proc/self/task' not available",
 )
 
+skip_if_no_subinterpreters = pytest.mark.skipif(
+    not (find_spec("_interpreters") or find_spec("_xxsubinterpreters")),
+    reason="subinterpreters not available",
+)
+
 
 @pytest.fixture(scope="session")
 def pyrun(pyconfig):
@@ -0,0 +1,360 @@
+import os
+import sys
+
+import pytest
+
+from .conftest import run_script, skip_if_no_proc_env
+
+pytestmark = [
+    pytest.mark.skipif(
+        not sys.platform.startswith("linux"),
+        reason="the ffi backend is only available on Linux",
+    ),
+    skip_if_no_proc_env,
+]
+
+# Make room for the titles in the command line
+ARGS = "- " + " ".join(["padding"] * 10)
+
+
+def ffi_env(value="1"):
+    env = os.environ.copy()
+    env["SPT_FFI"] = value
+    return env
+
+
+def test_ffi_used():
+    rv = run_script(
+        """
+import setproctitle
+print(setproctitle._use_ffi)
+""",
+        args=ARGS,
+        env=ffi_env(),
+    )
+    assert rv == "True\n"
+
+
+def test_ffi_disabled():
+    rv = run_script(
+        """
+import setproctitle
+print(setproctitle._use_ffi)
+""",
+        args=ARGS,
+        env=ffi_env("0"),
+    )
+    assert rv == "False\n"
+
+
+def test_no_proc():
+    """If /proc can't be read, the other backends are used."""
+    rv = run_script(
+        """
+import builtins
+
+def fake_open(file, *args, **kwargs):
+    if file == "/proc/self/stat":
+        raise PermissionError(13, "Permission denied", file)
+    return real_open(file, *args, **kwargs)
+
+real_open = builtins.open
+builtins.open = fake_open
+import setproctitle
+builtins.open = real_open
+print(setproctitle._use_ffi)
+setproctitle.setproctitle("still works")
+""",
+        args=ARGS,
+        env=ffi_env(),
+    )
+    assert rv == "False\n"
+
+
+NOT_IN_FFI = [
+    "enable_coalescing",
+    "disable_coalescing",
+    "flush",
+    "stats",
+    "reset_stats",
+    "Counter",
+    "enable_board",
+    "disable_board",
+    "StatusBoard",
+    "read_titles",
+    "enable_worker_titles",
+    "disable_worker_titles",
+]
+
+
+def test_c_fallback():
+    """The names missing in the ffi backend come from the C extension."""
+    rv = run_script(
+        f"""
+import setproctitle
+from setproctitle import _setproctitle
+
+print(setproctitle._use_ffi)
+for name in {NOT_IN_FFI!r}:
+    if getattr(setproctitle, name) is not getattr(_setproctitle, name):
+        print(name)
+setproctitle.enable_coalescing()
+setproctitle.setproctitle('title')
+setproctitle.flush()
+print(setproctitle.getproctitle())
+setproctitle.disable_coalescing()
+""",
+        args=ARGS,
+        env=ffi_env(),
+    )
+    assert rv.splitlines() == ["True", "title"]
+
+
+def test_no_c_fallback():
+    """Without the C extension, the names missing in ffi aren't stubs."""
+    rv = run_script(
+        f"""
+import sys
+sys.modules['setproctitle._setproctitle'] = None
+import setproctitle
+
+print(setproctitle._use_ffi)
+for name in {NOT_IN_FFI!r}:
+    try:
+        getattr(setproctitle, name)()
+    except NotImplementedError:
+        pass
+    else:
+        print(name)
+""",
+        args=ARGS,
+        env=ffi_env(),
+    )
+    assert rv.splitlines() == ["True"]
+
+
+def test_setproctitle():
+    rv = run_script(
+        r"""
+import setproctitle
+
+def cmdline():
+    with open('/proc/self/cmdline') as f:
+        return f.read().rstrip('\0')
+
+def comm():
+    with open('/proc/self/comm') as f:
+        return f.read().rstrip()
+
+print(setproctitle.getproctitle() == cmdline().replace('\0', ' '))
+setproctitle.setproctitle('Hello, ffi world!')
+print(setproctitle.getproctitle())
+print(cmdline())
+print(comm())
+""",
+        args=ARGS,
+        env=ffi_env(),
+    )
+    lines = rv.splitlines()
+    assert lines[0] == "True"
+    assert lines[1] == "Hello, ffi world!"
+    assert lines[2] == "Hello, ffi world!"
+    assert lines[3] == "Hello, ffi worl"
+
+
+def test_truncated():
+    """Check that the title is truncated and environ is not clobbered."""
+    env = ffi_env()
+    env["SPT_TESTENV"] = "testenv"
+    rv = run_script(
+        r"""
+import setproctitle
+
+def cmdline():
+    with open('/proc/self/cmdline') as f:
+        return f.read().rstrip('\0')
+
+info = setproctitle.setup_info()
+print(info['argc'], info['environ_moved'])
+setproctitle.setproctitle('X' * info['buffer_size'] * 2)
+print(len(setproctitle.getproctitle()) == info['buffer_size'] - 1)
+print(cmdline() == setproctitle.getproctitle())
+setproctitle.setproctitle('short')
+print(cmdline())
+with open('/proc/self/environ') as f:
+    print('SPT_TESTENV=testenv' in f.read())
+""",
+        args=ARGS,
+        env=env,
+    )
+    assert rv.splitlines() == ["12 0", "True", "True", "short", "True"]
+
+
+def test_prefix_and_push():
+    rv = run_script(
+        r"""
+import setproctitle
+
+def cmdline():
+    with open('/proc/self/cmdline') as f:
+        return f.read().rstrip('\0')
+
+setproctitle.set_title_prefix('app: ')
+setproctitle.set_activity('idle')
+print(cmdline())
+print(setproctitle.get_activity())
+with setproctitle.title_scope(' [job]'):
+    print(cmdline())
+print(cmdline())
+
+setproctitle.push_title(' [lost]')
+setproctitle.setproctitle('changed')
+setproctitle.pop_title()
+print(cmdline())
+try:
+    setproctitle.pop_title()
+except RuntimeError as e:
+    print(e)
+""",
+        args=ARGS,
+        env=ffi_env(),
+    )
+    assert rv.splitlines() == [
+        "app: idle",
+        "idle",
+        "app: idle [job]",
+        "app: idle",
+        "changed",
+        "no title pushed",
+    ]
+
+
+def test_title_object():
+    rv = run_script(
+        r"""
+import setproctitle
+
+def cmdline():
+    with open('/proc/self/cmdline') as f:
+        return f.read().rstrip('\0')
+
+idle = setproctitle.Title('idle')
+print(str(idle), idle.truncated, idle.capacity)
+setproctitle.set_title_prefix('app: ')
+idle.apply()
+print(cmdline(), setproctitle.get_activity())
+long = setproctitle.Title('x' * (idle.capacity + 10))
+long.apply()
+print(long.truncated, cmdline() == str(long))
+""",
+        args=ARGS,
+        env=ffi_env(),
+    )
+    lines = rv.splitlines()
+    capacity = len(ARGS) + len(sys.executable) + 1
+    assert lines == [
+        f"idle False {capacity}",
+        "idle idle",
+        "True True",
+    ]
+
+
+def test_template():
+    rv = run_script(
+        r"""
+import setproctitle
+
+def cmdline():
+    with open('/proc/self/cmdline') as f:
+        return f.read().rstrip('\0')
+
+tmpl = setproctitle.compile_template('{state} rps={rps} {{x}}')
+print(tmpl.fields)
+setproctitle.set_title_prefix('app: ')
+tmpl.set(state='idle', rps=12)
+print(cmdline())
+tmpl.set(rps=99)
+print(cmdline(), str(tmpl))
+for template in ['{a', 'a}', '{a:>3}']:
+    try:
+        setproctitle.compile_template(template)
+    except ValueError as e:
+        print(e)
+try:
+    tmpl.set(nope=1)
+except TypeError as e:
+    print(e)
+""",
+        args=ARGS,
+        env=ffi_env(),
+    )
+    assert rv.splitlines() == [
+        "('state', 'rps')",
+        "app: idle rps=12 {x}",
+        "app: idle rps=99 {x} idle rps=99 {x}",
+        "single '{' encountered in template",
+        "single '}' encountered in template",
+        "invalid field in template: '{a:>3}'",
+        "set() got an unexpected field 'nope'",
+    ]
+
+
+def test_backend():
+    env = ffi_env()
+    env["SPT_BACKEND"] = "memory"
+    rv = run_script(
+        r"""
+import setproctitle
+
+def read(name):
+    with open(f'/proc/self/{name}') as f:
+        return f.read().rstrip('\0\n')
+
+cmdline, comm = read('cmdline'), read('comm')
+setproctitle.setproctitle('memory title')
+print(setproctitle.get_backend(), setproctitle.getproctitle())
+print(read('cmdline') == cmdline, read('comm') == comm)
+setproctitle.set_backend('cmdline')
+print(read('cmdline'), read('comm') == comm)
+setproctitle.set_backend('comm')
+setproctitle.setproctitle('comm title')
+print(read('cmdline'), read('comm'))
+""",
+        args=ARGS,
+        env=env,
+    )
+    assert rv.splitlines() == [
+        "memory memory title",
+        "True True",
+        "memory title True",
+        "memory title comm title",
+    ]
+
+
+def test_thread_titles():
+    rv = run_script(
+        """
+import threading
+import setproctitle
+
+def work():
+    setproctitle.setthreadtitle('worker')
+    print(setproctitle.getthreadtitle())
+    ready.set()
+    done.wait()
+
+ready = threading.Event()
+done = threading.Event()
+t = threading.Thread(target=work)
+t.start()
+ready.wait()
+print(setproctitle.list_thread_titles()[t.native_id])
+print(setproctitle.setthreadtitles({t.native_id: 'renamed'}))
+print(setproctitle.list_thread_titles()[t.native_id])
+done.set()
+t.join()
+""",
+        args=ARGS,
+        env=ffi_env(),
+    )
+    assert rv.splitlines() == ["worker", "worker", "1", "renamed"]
@@ -26,6 +26,30 @@ print_stuff()
     assert before == after
 
 
+def test_logger():
+    """Test that the module exposes its logger"""
+    rv = run_script(
+        """
+import setproctitle
+print(setproctitle.logger.name)
+"""
+    )
+    assert rv == "setproctitle\n"
+
+
+def test_no_logging_import():
+    """Test that importing the module doesn't import logging"""
+    rv = run_script(
+        """
+import sys
+import setproctitle
+setproctitle.getproctitle()
+print("logging" in sys.modules)
+"""
+    )
+    assert rv == "False\n"
+
+
 def test_version():
     """Test that the module has a version"""
     rv = run_script(
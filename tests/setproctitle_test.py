@@ -17,7 +17,9 @@ import subprocess as sp
 import pytest
 
 from .conftest import run_script, skip_if_no_proc_cmdline, skip_if_no_proc_env
+from .conftest import skip_if_no_proc_tasks
 from .conftest import skip_if_macos, skip_if_pypy, skip_if_win32
+from .conftest import skip_if_no_subinterpreters
 
 pytestmark = [skip_if_win32]
 
@@ -130,6 +132,34 @@ print(setproctitle.getproctitle())
     assert rv == "Hello, world!\n"
 
 
+def test_getproctitle_cached():
+    """getproctitle() returns the same object until the title changes."""
+    rv = run_script(
+        r"""
+import setproctitle
+setproctitle.setproctitle('Hello, world!')
+t1 = setproctitle.getproctitle()
+print(t1 is setproctitle.getproctitle())
+setproctitle.setproctitle('Hello, world!')
+print(t1 is setproctitle.getproctitle())
+setproctitle.setproctitle('Hello')
+t2 = setproctitle.getproctitle()
+print(t2, t2 is t1)
+setproctitle.set_title_prefix('Hello')
+print(setproctitle.getproctitle() is t2)
+setproctitle.set_activity(', prefix!')
+print(setproctitle.getproctitle())
+"""
+    )
+    assert rv.splitlines() == [
+        "True",
+        "True",
+        "Hello False",
+        "False",
+        "Hello, prefix!",
+    ]
+
+
 def test_kwarg():
     """setproctitle() supports keyword args."""
     rv = run_script(
@@ -142,6 +172,868 @@ print(setproctitle.getproctitle())
     assert rv == "Hello, world!\n"
 
 
+def test_title_prefix():
+    """set_activity() only changes the title after the prefix."""
+    rv = run_script(
+        r"""
+import setproctitle
+setproctitle.set_title_prefix('app worker-1 | ')
+print(repr(setproctitle.getproctitle()))
+setproctitle.set_activity('reading')
+print(setproctitle.getproctitle())
+setproctitle.set_activity('idle')
+print(setproctitle.getproctitle())
+print(setproctitle.get_activity())
+setproctitle.setproctitle('Hello, world!')
+print(setproctitle.getproctitle())
+print(setproctitle.get_activity())
+"""
+    )
+    assert rv.splitlines() == [
+        "'app worker-1 | '",
+        "app worker-1 | reading",
+        "app worker-1 | idle",
+        "idle",
+        "Hello, world!",
+        "Hello, world!",
+    ]
+
+
+@pytest.mark.skip_on_qemu
+def test_title_prefix_ps():
+    """The prefix and the activity are visible together in ps."""
+    rv = run_script(
+        r"""
+import setproctitle
+setproctitle.set_title_prefix('Hello, ')
+setproctitle.set_activity('a long activity')
+setproctitle.set_activity('prefix!')
+
+import os
+print(os.getpid())
+print(os.popen("ps -x -o pid,command 2> /dev/null").read())
+"""
+    )
+    lines = [line for line in rv.splitlines() if line]
+    pid = lines.pop(0)
+    pids = dict([r.strip().split(None, 1) for r in lines])
+    title = _clean_up_title(pids[pid])
+    assert title == "Hello, prefix!"
+
+
+def test_unchanged_title():
+    """Setting the same title again doesn't write it."""
+    rv = run_script(
+        r"""
+import setproctitle
+setproctitle.setproctitle('idle')
+s0 = setproctitle.stats()
+for i in range(10):
+    setproctitle.setproctitle('idle')
+s1 = setproctitle.stats()
+setproctitle.setproctitle('busy')
+setproctitle.setproctitle('idle')
+s2 = setproctitle.stats()
+print(s1['skipped'] - s0['skipped'], s1['updates'] - s0['updates'])
+print(s2['skipped'] - s1['skipped'], s2['updates'] - s1['updates'])
+print(setproctitle.getproctitle())
+"""
+    )
+    assert rv.splitlines() == ["10 0", "0 2", "idle"]
+
+
+@skip_if_no_proc_tasks
+def test_unchanged_title_thread_name():
+    """Setting the same title restores the name changed by setthreadtitle."""
+    rv = run_script(
+        r"""
+import setproctitle
+setproctitle.setproctitle('idle')
+setproctitle.setthreadtitle('renamed')
+print(setproctitle.getthreadtitle())
+setproctitle.setproctitle('idle')
+print(setproctitle.getthreadtitle())
+setproctitle.setproctitle('idle')
+print(setproctitle.stats()['skipped'])
+"""
+    )
+    assert rv.splitlines() == ["renamed", "idle", "1"]
+
+
+def test_stats():
+    """The counters describe the work performed writing the titles."""
+    rv = run_script(
+        r"""
+import setproctitle
+setproctitle.setproctitle('long title')
+setproctitle.reset_stats()
+setproctitle.setproctitle('short')
+setproctitle.setproctitle('short')
+setproctitle.setproctitle('x' * 1000000)
+s = setproctitle.stats()
+print(s['calls'], s['updates'], s['skipped'], s['truncations'])
+print(s['bytes_written'] > 5, s['memset_bytes'] >= 5, s['ns'] > 0)
+setproctitle.reset_stats()
+print(set(setproctitle.stats().values()))
+"""
+    )
+    assert rv.splitlines() == ["3 2 1 1", "True True True", "{0}"]
+
+
+@skip_if_no_proc_cmdline
+def test_coalescing():
+    """Coalesced titles are written in background, only the latest."""
+    rv = run_script(
+        r"""
+import time
+import setproctitle
+
+def cmdline():
+    with open('/proc/self/cmdline') as f:
+        return f.read().rstrip('\0')
+
+setproctitle.enable_coalescing(max_rate=5)
+s0 = setproctitle.stats()
+for i in range(1000):
+    setproctitle.setproctitle(f'title {i}')
+time.sleep(0.5)
+s1 = setproctitle.stats()
+print(cmdline())
+print(s1['updates'] - s0['updates'] <= 5)
+
+setproctitle.setproctitle('pending')
+setproctitle.flush()
+print(cmdline())
+
+setproctitle.setproctitle('stored')
+print(setproctitle.getproctitle())
+
+setproctitle.disable_coalescing()
+setproctitle.setproctitle('direct')
+print(cmdline())
+"""
+    )
+    assert rv.splitlines() == [
+        "title 999",
+        "True",
+        "pending",
+        "stored",
+        "direct",
+    ]
+
+
+def test_coalescing_read():
+    """Reading the title doesn't write the pending one."""
+    rv = run_script(
+        r"""
+import time
+import setproctitle
+
+def cmdline():
+    with open('/proc/self/cmdline') as f:
+        return f.read().rstrip('\0')
+
+# Let the writer write the title and wait for the next interval
+setproctitle.enable_coalescing(max_rate=0.1)
+setproctitle.setproctitle('first')
+time.sleep(0.2)
+s0 = setproctitle.stats()
+for i in range(100):
+    setproctitle.setproctitle(f'title {i}')
+    assert setproctitle.getproctitle() == f'title {i}'
+    assert setproctitle.get_activity() == f'title {i}'
+s1 = setproctitle.stats()
+print(s1['updates'] - s0['updates'])
+print(cmdline())
+setproctitle.flush()
+print(cmdline())
+"""
+    )
+    assert rv.splitlines() == ["0", "first", "title 99"]
+
+
+def test_coalescing_other_calls(tmp_path):
+    """Calls not setting the title don't drop the pending title."""
+    rv = run_script(
+        rf"""
+import setproctitle
+
+setproctitle.enable_coalescing(max_rate=0.1)
+setproctitle.setproctitle('first')
+setproctitle.flush()
+for call in [
+    lambda: setproctitle.reset_stats(),
+    lambda: setproctitle.Title('other'),
+    lambda: setproctitle.get_backend(),
+    lambda: setproctitle.enable_board({str(tmp_path / "board")!r}),
+    lambda: setproctitle.disable_board(),
+]:
+    setproctitle.setproctitle('second')
+    call()
+    setproctitle.flush()
+    print(setproctitle.getproctitle())
+    setproctitle.setproctitle('first')
+    setproctitle.flush()
+"""
+    )
+    assert rv.splitlines() == ["second"] * 5
+
+
+def test_coalescing_fork():
+    """The title pending in the parent is written in the child."""
+    rv = run_script(
+        r"""
+import os
+import setproctitle
+
+setproctitle.enable_coalescing(max_rate=0.1)
+setproctitle.setproctitle('first')
+setproctitle.setproctitle('second')
+pid = os.fork()
+if not pid:
+    print(setproctitle.getproctitle(), flush=True)
+    setproctitle.setproctitle('child')
+    print(setproctitle.getproctitle(), flush=True)
+    os._exit(0)
+os.waitpid(pid, 0)
+print(setproctitle.getproctitle())
+"""
+    )
+    assert rv.splitlines() == ["second", "child", "second"]
+
+
+@skip_if_no_proc_cmdline
+def test_threads():
+    """Titles set by many threads are never read partially written."""
+    rv = run_script(
+        r"""
+import threading
+import setproctitle
+
+titles = {f'title {i} ' + chr(ord('a') + i) * (10 + i * 20) for i in range(8)}
+# Another thread may drop the prefix before set_activity()
+valid = titles | {t + 'x' for t in titles} | {'x'}
+bad = []
+
+def work(title):
+    for i in range(2000):
+        setproctitle.setproctitle(title)
+        t = setproctitle.getproctitle()
+        if t not in valid:
+            bad.append(t)
+        setproctitle.set_title_prefix(title)
+        setproctitle.set_activity('x')
+        t = setproctitle.getproctitle()
+        if t not in valid:
+            bad.append(t)
+
+threads = [threading.Thread(target=work, args=(t,)) for t in titles]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+
+setproctitle.flush()
+with open('/proc/self/cmdline') as f:
+    cmdline = f.read().rstrip('\0')
+
+print(bad)
+print(cmdline == setproctitle.getproctitle())
+"""
+    )
+    assert rv.splitlines() == ["[]", "True"]
+
+
+@skip_if_no_proc_cmdline
+def test_threads_large():
+    """Large titles are written without the GIL, concurrently."""
+    env = dict(os.environ)
+    for i in range(4):
+        env[f"SPT_TEST_LARGE_{i}"] = "x" * 60000
+    rv = run_script(
+        r"""
+import threading
+import setproctitle
+
+titles = {chr(ord('a') + i) * (70000 + i) for i in range(4)}
+bad = []
+
+def work(title):
+    for i in range(200):
+        setproctitle.setproctitle(title)
+        t = setproctitle.getproctitle()
+        if t not in titles:
+            bad.append(len(t))
+
+threads = [threading.Thread(target=work, args=(t,)) for t in titles]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+
+with open('/proc/self/cmdline') as f:
+    cmdline = f.read().rstrip('\0')
+
+# The kernel may only show the first page of a long title
+title = setproctitle.getproctitle()
+print(bad)
+print(title in titles and title.startswith(cmdline))
+""",
+        env=env,
+    )
+    assert rv.splitlines() == ["[]", "True"]
+
+
+@skip_if_no_proc_cmdline
+@skip_if_no_subinterpreters
+def test_subinterpreters():
+    """Interpreters running in parallel share the title safely."""
+    rv = run_script(
+        r"""
+import threading
+try:
+    import _interpreters as interpreters
+except ImportError:
+    import _xxsubinterpreters as interpreters
+
+import setproctitle
+
+code = '''
+import setproctitle
+for i in range(500):
+    if i % 100 == 0:
+        setproctitle.enable_coalescing(1000)
+    elif i % 100 == 50:
+        setproctitle.disable_coalescing()
+    if i % 200 == 10:
+        setproctitle.enable_worker_titles()
+    elif i % 200 == 110:
+        setproctitle.disable_worker_titles()
+    setproctitle.setproctitle('interp %d: step %d' % (N, i))
+    t = setproctitle.getproctitle()
+    assert t.startswith('interp '), t
+    with setproctitle.title_scope(' busy'):
+        setproctitle.getproctitle()
+setproctitle.disable_coalescing()
+'''
+errors = []
+
+def work(n):
+    interp = interpreters.create()
+    try:
+        err = interpreters.run_string(interp, code.replace('N', str(n)))
+    except Exception as ex:
+        err = ex
+    if err:
+        errors.append(err)
+    interpreters.destroy(interp)
+
+threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+
+with open('/proc/self/cmdline') as f:
+    cmdline = f.read().rstrip('\0')
+
+print(errors)
+print(cmdline == setproctitle.getproctitle())
+print(' busy' not in cmdline)
+"""
+    )
+    assert rv.splitlines() == ["[]", "True", "True"]
+
+
+def test_bytes_title():
+    """setproctitle() accepts bytes-like objects."""
+    rv = run_script(
+        r"""
+import setproctitle
+setproctitle.setproctitle(b'Hello, bytes!')
+print(setproctitle.getproctitle())
+setproctitle.setproctitle(bytearray(b'Hello, bytearray!'))
+print(setproctitle.getproctitle())
+setproctitle.setproctitle(memoryview(b'[Hello, memoryview!]')[1:-1])
+print(setproctitle.getproctitle())
+setproctitle.setproctitle(title='Hello, \u20ac!'.encode())
+print(setproctitle.getproctitle())
+"""
+    )
+    assert rv.splitlines() == [
+        "Hello, bytes!",
+        "Hello, bytearray!",
+        "Hello, memoryview!",
+        "Hello, \u20ac!",
+    ]
+
+
+def test_bad_title():
+    """Invalid titles are rejected."""
+    rv = run_script(
+        r"""
+import setproctitle
+for args, kwargs in [
+    ((), {}),
+    (('a', 'b'), {}),
+    ((), {'tittle': 'a'}),
+    (('a',), {'title': 'b'}),
+    ((42,), {}),
+    (('a\0b',), {}),
+    ((b'a\0b',), {}),
+]:
+    try:
+        setproctitle.setproctitle(*args, **kwargs)
+    except Exception as e:
+        print(type(e).__name__)
+    else:
+        print("no error")
+"""
+    )
+    assert rv.splitlines() == ["TypeError"] * 5 + ["ValueError"] * 2
+
+
+def test_bad_args():
+    """The other functions taking keywords parse their arguments."""
+    rv = run_script(
+        r"""
+import setproctitle
+for func, args, kwargs in [
+    (setproctitle.enable_coalescing, ('x',), {}),
+    (setproctitle.enable_coalescing, (1, 2), {}),
+    (setproctitle.set_backend, (), {}),
+    (setproctitle.set_backend, (b'comm',), {}),
+    (setproctitle.set_backend, ('comm',), {'backend': 'comm'}),
+    (setproctitle.enable_board, (), {'nslots': 1}),
+    (setproctitle.enable_worker_titles, (), {'stat': 1}),
+    (setproctitle.read_titles, ([], []), {}),
+    (setproctitle.set_backend, ('comm\0',), {}),
+]:
+    try:
+        func(*args, **kwargs)
+    except Exception as e:
+        print(type(e).__name__)
+    else:
+        print("no error")
+"""
+    )
+    assert rv.splitlines() == ["TypeError"] * 8 + ["ValueError"]
+
+
+def test_counter():
+    """A counter only updates its digits in the title."""
+    rv = run_script(
+        r"""
+import setproctitle
+c = setproctitle.Counter('processed {}/1000', width=3)
+print(c.shown)
+c.apply()
+print(setproctitle.getproctitle(), c.shown)
+c.increment()
+c.increment(10)
+print(setproctitle.getproctitle(), c.value)
+c.set_value(1000)
+print(setproctitle.getproctitle())
+
+setproctitle.setproctitle('something else')
+c.increment()
+print(setproctitle.getproctitle(), c.shown, c.value)
+
+setproctitle.set_title_prefix('worker | ')
+c.apply()
+c.set_value(-5)
+print(setproctitle.getproctitle())
+"""
+    )
+    assert rv.splitlines() == [
+        "False",
+        "processed   0/1000 True",
+        "processed  11/1000 11",
+        "processed 1000/1000",
+        "something else False 1001",
+        "worker | processed  -5/1000",
+    ]
+
+
+@skip_if_no_proc_cmdline
+def test_counter_cmdline():
+    """The counter digits are visible in the process cmdline."""
+    rv = run_script(
+        r"""
+import setproctitle
+
+def cmdline():
+    with open('/proc/self/cmdline') as f:
+        return f.read().rstrip('\0')
+
+c = setproctitle.Counter('{} done')
+c.apply()
+print(cmdline())
+for i in range(42):
+    c.increment()
+print(cmdline())
+"""
+    )
+    assert rv.splitlines() == ["0 done", "42 done"]
+
+
+def test_bad_counter():
+    """Counter templates need a single placeholder."""
+    rv = run_script(
+        r"""
+import setproctitle
+for args in [('x',), ('{} {}',), (42,), ('{}', 0, -1)]:
+    try:
+        setproctitle.Counter(*args)
+    except Exception as e:
+        print(type(e).__name__)
+    else:
+        print("no error")
+"""
+    )
+    assert rv.splitlines() == [
+        "ValueError",
+        "ValueError",
+        "TypeError",
+        "ValueError",
+    ]
+
+
+def test_title_object():
+    """Title objects are prepared once and applied many times."""
+    rv = run_script(
+        r"""
+import setproctitle
+idle = setproctitle.Title('worker: idle')
+busy = setproctitle.Title(b'worker: busy')
+print(str(idle), idle.truncated, idle.capacity > 0)
+setproctitle.set_title_prefix('app | ')
+busy.apply()
+print(setproctitle.getproctitle())
+idle.apply()
+print(setproctitle.getproctitle())
+busy.apply()
+print(setproctitle.getproctitle())
+
+long = setproctitle.Title('x' * (idle.capacity + 10))
+print(long.truncated, len(str(long)) == long.capacity)
+long.apply()
+print(setproctitle.getproctitle() == str(long))
+
+for args in [(), ('a\0b',), (42,)]:
+    try:
+        setproctitle.Title(*args)
+    except Exception as e:
+        print(type(e).__name__)
+"""
+    )
+    assert rv.splitlines() == [
+        "worker: idle False True",
+        "worker: busy",
+        "worker: idle",
+        "worker: busy",
+        "True True",
+        "True",
+        "TypeError",
+        "ValueError",
+        "TypeError",
+    ]
+
+
+def test_template():
+    """Templates render named fields and rewrite only what changed."""
+    rv = run_script(
+        r"""
+import setproctitle
+tmpl = setproctitle.compile_template('{state} rps={rps} q={queue} {{x}}')
+print(tmpl.fields)
+setproctitle.set_title_prefix('app: ')
+tmpl.set(state='idle', rps=12, queue=0)
+print(setproctitle.getproctitle())
+print(str(tmpl))
+
+setproctitle.reset_stats()
+tmpl.set(rps=99)
+print(setproctitle.getproctitle(), setproctitle.stats()['bytes_written'])
+tmpl.set(rps=100, state=b'busy')
+print(setproctitle.getproctitle())
+tmpl.set(rps=100)
+print(setproctitle.stats()['skipped'])
+
+setproctitle.setproctitle('other')
+tmpl.set(queue=3)
+print(setproctitle.getproctitle())
+
+for template in ['{a', 'a}', '{}', '{a:>3}', '{a!r}']:
+    try:
+        setproctitle.compile_template(template)
+    except ValueError as e:
+        print(e)
+for args, kwargs in [((1,), {}), ((), {'nope': 1}), ((), {'state': 'a\0b'})]:
+    try:
+        tmpl.set(*args, **kwargs)
+    except Exception as e:
+        print(type(e).__name__)
+""",
+        args="- " + " ".join(["padding"] * 10),
+    )
+    assert rv.splitlines() == [
+        "('state', 'rps', 'queue')",
+        "app: idle rps=12 q=0 {x}",
+        "idle rps=12 q=0 {x}",
+        "app: idle rps=99 q=0 {x} 2",
+        "app: busy rps=100 q=0 {x}",
+        "1",
+        "busy rps=100 q=3 {x}",
+        "single '{' encountered in template",
+        "single '}' encountered in template",
+        "invalid field in template: '{}'",
+        "invalid field in template: '{a:>3}'",
+        "invalid field in template: '{a!r}'",
+        "TypeError",
+        "TypeError",
+        "ValueError",
+    ]
+
+
+def test_title_scope():
+    """Title scopes append a suffix and restore the title on exit."""
+    rv = run_script(
+        r"""
+import setproctitle
+setproctitle.set_title_prefix('rpc | ')
+setproctitle.set_activity('idle')
+
+@setproctitle.title_scope(' get_user')
+def get_user():
+    with setproctitle.title_scope(b' query'):
+        print(setproctitle.getproctitle())
+    print(setproctitle.getproctitle())
+
+get_user()
+print(setproctitle.getproctitle(), setproctitle.get_activity())
+
+# A title set inside the scope is not undone
+with setproctitle.title_scope(' a'):
+    with setproctitle.title_scope(' b'):
+        setproctitle.setproctitle('other')
+    print(setproctitle.getproctitle())
+print(setproctitle.getproctitle())
+
+try:
+    setproctitle.pop_title()
+except RuntimeError as e:
+    print(e)
+"""
+    )
+    assert rv.splitlines() == [
+        "rpc | idle get_user query",
+        "rpc | idle get_user",
+        "rpc | idle idle",
+        "other",
+        "other",
+        "no title pushed",
+    ]
+
+
+def test_title_scope_threads():
+    """Scopes of different threads are popped separately."""
+    rv = run_script(
+        r"""
+import threading
+import setproctitle
+
+setproctitle.setproctitle('base')
+pushed = threading.Event()
+pop = threading.Event()
+
+def work():
+    setproctitle.push_title(' [thread]')
+    pushed.set()
+    pop.wait()
+    setproctitle.pop_title()
+    try:
+        setproctitle.pop_title()
+    except RuntimeError as e:
+        print(e)
+
+t = threading.Thread(target=work)
+t.start()
+pushed.wait()
+setproctitle.push_title(' [main]')
+print(setproctitle.getproctitle())
+pop.set()
+t.join()
+print(setproctitle.getproctitle())
+setproctitle.pop_title()
+print(setproctitle.getproctitle())
+"""
+    )
+    assert rv.splitlines() == [
+        "base [thread] [main]",
+        "no title pushed",
+        "base [main]",
+        "base",
+    ]
+
+
+@skip_if_no_proc_cmdline
+def test_title_scope_cmdline():
+    """The title is restored in the process cmdline."""
+    rv = run_script(
+        r"""
+import setproctitle
+
+def cmdline():
+    with open('/proc/self/cmdline') as f:
+        return f.read().rstrip('\0')
+
+setproctitle.setproctitle('a long title for the process')
+setproctitle.push_title(' in scope')
+print(cmdline())
+setproctitle.setproctitle('short')
+setproctitle.push_title(' in scope')
+setproctitle.pop_title()
+setproctitle.pop_title()
+print(cmdline())
+"""
+    )
+    assert rv.splitlines() == [
+        "a long title for the process in scope",
+        "short",
+    ]
+
+
+@skip_if_win32
+def test_worker_titles():
+    """The processes forked get a title from the template."""
+    rv = run_script(
+        r"""
+import os
+import multiprocessing as mp
+import setproctitle
+
+def title(x):
+    return setproctitle.getproctitle()
+
+if __name__ == "__main__":
+    setproctitle.setproctitle('master')
+    setproctitle.enable_worker_titles()
+    with mp.get_context('fork').Pool(3) as pool:
+        titles = set(pool.map(title, range(30), chunksize=1))
+    # Not all the workers necessarily get a task
+    print(titles <= {f'master worker {n}' for n in range(1, 4)})
+
+    setproctitle.enable_worker_titles('{{{n}}} of {parent_title}', start=10)
+    for i in range(2):
+        pid = os.fork()
+        if not pid:
+            print(setproctitle.getproctitle(), flush=True)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+    setproctitle.disable_worker_titles()
+    pid = os.fork()
+    if not pid:
+        print(setproctitle.getproctitle(), flush=True)
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    for template in ['{', '{x}', 'a}']:
+        try:
+            setproctitle.enable_worker_titles(template)
+        except ValueError:
+            print('ValueError')
+"""
+    )
+    assert rv.splitlines() == [
+        "True",
+        "{10} of master",
+        "{11} of master",
+        "master",
+        "ValueError",
+        "ValueError",
+        "ValueError",
+    ]
+
+
+@skip_if_win32
+def test_worker_titles_reimport():
+    """The fork hook runs once, even if the module is imported again."""
+    rv = run_script(
+        r"""
+import os
+import sys
+import importlib
+import setproctitle
+
+setproctitle.setproctitle('master')
+setproctitle.enable_worker_titles()
+
+# A new module object registering the fork hook again
+old = sys.modules.pop('setproctitle._setproctitle')
+mod = importlib.import_module('setproctitle._setproctitle')
+assert mod is not old
+mod.enable_worker_titles()
+
+pid = os.fork()
+if not pid:
+    print(setproctitle.getproctitle(), flush=True)
+    os._exit(0)
+os.waitpid(pid, 0)
+"""
+    )
+    assert rv.splitlines() == ["master worker 1"]
+
+
+@skip_if_no_proc_cmdline
+def test_read_titles():
+    """Read the titles of the child processes."""
+    rv = run_script(
+        r"""
+import os
+import sys
+import subprocess as sp
+import setproctitle
+
+code = (
+    "import sys, setproctitle; "
+    "setproctitle.setproctitle(sys.argv[1]); "
+    "print(flush=True); sys.stdin.read()"
+)
+procs = [
+    sp.Popen(
+        [sys.executable, "-c", code, f"worker {i}"],
+        stdin=sp.PIPE, stdout=sp.PIPE,
+    )
+    for i in range(3)
+]
+for p in procs:
+    p.stdout.readline()
+
+for pid, title, comm in sorted(setproctitle.read_titles()):
+    print(title, comm)
+
+pid = procs[0].pid
+print(setproctitle.read_titles([pid, os.getpid()])[0] == (
+    pid, "worker 0", "worker 0"))
+
+for p in procs:
+    p.stdin.close()
+    p.wait()
+
+print(setproctitle.read_titles([pid]))
+"""
+    )
+    assert rv.splitlines() == [
+        "worker 0 worker 0",
+        "worker 1 worker 1",
+        "worker 2 worker 2",
+        "True",
+        "[]",
+    ]
+
+
 def test_environ():
     """Check that clobbering environ didn't break env."""
     rv = run_script(
@@ -173,6 +1065,36 @@ print(newenv['PATH'])
     assert path.endswith("fakepath"), path
 
 
+@skip_if_no_proc_cmdline
+def test_setup_info():
+    """The arguments and the environment are copied before clobbering."""
+    env = os.environ.copy()
+    env["SPT_TESTENV"] = "testenv"
+    rv = run_script(
+        r"""
+import os
+# Not in the argv area: copied separately
+os.environ['SPT_SETENV'] = 'setenv'
+
+import setproctitle
+info = setproctitle.setup_info()
+setproctitle.setproctitle('X' * info['buffer_size'])
+
+newenv = dict([r.split("=",1)
+        for r in os.popen("env").read().splitlines()
+        if '=' in r])
+
+print(newenv['SPT_TESTENV'], newenv['SPT_SETENV'])
+print(info['argc'])
+print(info['environ_moved'] == len(os.environ))
+print(info['arena_size'] > info['buffer_size'] > 0)
+""",
+        args="- a b",
+        env=env,
+    )
+    assert rv.splitlines() == ["testenv setenv", "4", "True", "True"]
+
+
 @pytest.mark.skip_on_qemu
 def test_issue_8(tmp_pypath):
     """Test that the module works with 'python -m'."""
@@ -437,6 +1359,154 @@ print('SPT_TESTENV=testenv' in open('/proc/self/environ').read())
     ), "title (len {title_len}) not limited to argv (len {cmdline_len})"
 
 
+@skip_if_no_proc_env
+def test_lazyenv():
+    """Check that SPT_LAZYENV moves environ only for a long title."""
+    env = os.environ.copy()
+    env["SPT_TESTENV"] = "testenv"
+    env["SPT_LAZYENV"] = "1"
+    rv = run_script(
+        """
+import os
+import setproctitle
+
+def environ():
+    return open('/proc/self/environ').read()
+
+env0 = environ()
+size = setproctitle.setup_info()['buffer_size']
+setproctitle.setproctitle('short')
+print(environ() == env0)
+print(setproctitle.setup_info()['environ_moved'])
+
+title = 'X' * size * 3
+setproctitle.setproctitle(title)
+print(setproctitle.getproctitle() == title)
+print(open('/proc/self/cmdline').read().rstrip('\\0') == title)
+print(setproctitle.setup_info()['environ_moved'] > 0)
+print(os.environ['SPT_TESTENV'])
+print('SPT_TESTENV=testenv' in os.popen('env').read())
+""",
+        env=env,
+    )
+    lines = rv.splitlines()
+    assert lines[0] == "True", "env clobbered by a short title"
+    assert lines[1] == "0", "environ moved by a short title"
+    assert lines[2] == "True", "long title not returned"
+    assert lines[3] == "True", "long title not shown"
+    assert lines[4] == "True", "environ not moved by a long title"
+    assert lines[5] == "testenv"
+    assert lines[6] == "True", "environ not available to children"
+
+
+@skip_if_no_proc_env
+def test_lazyenv_calling_thread():
+    """SPT_LAZYENV moves environ when a title is set, not when created."""
+    env = os.environ.copy()
+    env["SPT_LAZYENV"] = "1"
+    rv = run_script(
+        """
+import setproctitle
+
+size = setproctitle.setup_info()['buffer_size']
+title = setproctitle.Title('X' * size * 3)
+print(title.truncated)
+print(setproctitle.setup_info()['environ_moved'])
+
+setproctitle.enable_coalescing(0.1)
+setproctitle.setproctitle('first')
+title.apply()
+print(setproctitle.setup_info()['environ_moved'] > 0)
+setproctitle.disable_coalescing()
+print(open('/proc/self/cmdline').read().rstrip('\\0') == str(title))
+""",
+        env=env,
+    )
+    assert rv.splitlines() == ["False", "0", "True", "True"]
+
+
+@skip_if_no_proc_tasks
+def test_backend():
+    """The backend chooses where the title is shown."""
+    rv = run_script(
+        r"""
+import setproctitle
+
+def show():
+    with open('/proc/self/cmdline') as f:
+        cmdline = f.read().rstrip('\0')
+    with open('/proc/self/comm') as f:
+        comm = f.read().rstrip()
+    print(setproctitle.get_backend(), cmdline, comm,
+        setproctitle.getproctitle())
+
+setproctitle.setproctitle('title one')
+show()
+setproctitle.set_backend('memory')
+setproctitle.reset_stats()
+setproctitle.setproctitle('memory title')
+show()
+print(setproctitle.stats()['prctl_calls'])
+setproctitle.set_backend('cmdline')
+show()
+setproctitle.setproctitle('cmdline title')
+show()
+setproctitle.set_backend('comm')
+setproctitle.setproctitle('comm title')
+show()
+setproctitle.set_backend(backend='both')
+show()
+try:
+    setproctitle.set_backend('nope')
+except ValueError as e:
+    print(e)
+"""
+    )
+    assert rv.splitlines() == [
+        "both title one title one title one",
+        "memory title one title one memory title",
+        "0",
+        "cmdline memory title title one memory title",
+        "cmdline cmdline title title one cmdline title",
+        "comm cmdline title comm title comm title",
+        "both comm title comm title comm title",
+        "backend must be 'both', 'cmdline', 'comm' or 'memory', not 'nope'",
+    ]
+
+
+@skip_if_no_proc_tasks
+def test_backend_env():
+    """SPT_BACKEND=memory doesn't show even the initial title."""
+    env = os.environ.copy()
+    env["SPT_BACKEND"] = "memory"
+    rv = run_script(
+        r"""
+import setproctitle
+
+def read(name):
+    with open(f'/proc/self/{name}', 'rb') as f:
+        return f.read()
+
+cmdline, comm, environ = read('cmdline'), read('comm'), read('environ')
+args = cmdline.rstrip(b'\0').replace(b'\0', b' ').decode()
+print(setproctitle.getproctitle() == args)
+setproctitle.set_title_prefix('app: ')
+setproctitle.setproctitle('X' * setproctitle.setup_info()['buffer_size'])
+print(setproctitle.getproctitle().startswith('XXX'))
+print(
+    read('cmdline') == cmdline,
+    read('comm') == comm,
+    read('environ') == environ,
+)
+print(setproctitle.stats()['prctl_calls'])
+print(setproctitle.get_backend())
+""",
+        args="- a b",
+        env=env,
+    )
+    assert rv.splitlines() == ["True", "True", "True True True", "0", "memory"]
+
+
 @skip_if_no_proc_env
 def test_large_env(monkeypatch):
     """Check that large environment doesn't get clobbered."""
@@ -80,3 +80,190 @@ comms.sort()
 assert comms == sorted([orig, "reader", "writer"])
 """
     )
+
+
+@pytest.mark.skip_on_qemu
+def test_set_thread_title_again():
+    """Setting a thread title again works after the name was changed."""
+    run_script(
+        """
+from glob import glob
+import setproctitle
+
+(fn,) = glob("/proc/self/task/*/comm")
+def comm():
+    with open(fn) as f:
+        return f.read().rstrip()
+
+setproctitle.setthreadtitle("hello")
+setproctitle.setthreadtitle("hello")
+assert comm() == "hello"
+setproctitle.setproctitle("world")
+assert comm() == "world"
+setproctitle.setthreadtitle("hello")
+assert comm() == "hello"
+"""
+    )
+
+
+@pytest.mark.skip_on_qemu
+def test_thread_pool():
+    rv = run_script(
+        """
+import threading
+from glob import glob
+from concurrent.futures import ThreadPoolExecutor
+
+from setproctitle import threadpool
+
+inited = []
+barrier = threading.Barrier(2)
+
+def comms():
+    rv = []
+    for fn in glob("/proc/self/task/*/comm"):
+        with open(fn) as f:
+            rv.append(f.read().rstrip())
+    return sorted(rv)
+
+def init(arg):
+    inited.append(arg)
+
+def job(n):
+    barrier.wait()
+    return n
+
+with ThreadPoolExecutor(
+    2,
+    thread_name_prefix="pool",
+    initializer=threadpool.initializer(init, ("arg",)),
+) as executor:
+    fs = [executor.submit(threadpool.task(job), i) for i in range(2)]
+    print([f.result() for f in fs])
+    print(comms()[:2])
+    fs = [executor.submit(threadpool.task(job, "other"), i) for i in range(2)]
+    print([f.result() for f in fs])
+    print(comms()[:2])
+    print(inited)
+"""
+    )
+    assert rv.splitlines() == [
+        "[0, 1]",
+        "['job', 'job']",
+        "[0, 1]",
+        "['other', 'other']",
+        "['arg', 'arg']",
+    ]
+
+
+@pytest.mark.skip_on_qemu
+def test_list_thread_titles():
+    rv = run_script(
+        """
+import threading
+import setproctitle
+
+ready = threading.Barrier(3)
+done = threading.Event()
+
+def worker(title):
+    setproctitle.setthreadtitle(title)
+    ready.wait()
+    done.wait()
+
+ts = [threading.Thread(target=worker, args=(t,)) for t in ("foo", "bar")]
+for t in ts:
+    t.start()
+ready.wait()
+
+titles = setproctitle.list_thread_titles()
+done.set()
+for t in ts:
+    t.join()
+
+print(len(titles))
+main_id = threading.main_thread().native_id
+print(titles[main_id] == setproctitle.getthreadtitle())
+print(titles[ts[0].native_id])
+print(titles[ts[1].native_id])
+"""
+    )
+    assert rv.splitlines() == ["3", "True", "foo", "bar"]
+
+
+@pytest.mark.skip_on_qemu
+def test_set_other_thread_title():
+    rv = run_script(
+        """
+import threading
+import setproctitle
+
+done = threading.Event()
+ts = [threading.Thread(target=done.wait) for i in range(3)]
+for t in ts:
+    t.start()
+
+try:
+    setproctitle.setthreadtitle("first", native_id=ts[0].native_id)
+    print(setproctitle.list_thread_titles()[ts[0].native_id])
+
+    titles = {t.native_id: "w%d" % i for i, t in enumerate(ts)}
+    print(setproctitle.setthreadtitles(titles))
+    titles = setproctitle.list_thread_titles()
+    print([titles[t.native_id] for t in ts])
+
+    # a thread renamed by another one is renamed again
+    setproctitle.setthreadtitle("main")
+    setproctitle.setthreadtitles({threading.get_native_id(): "other"})
+    setproctitle.setthreadtitle("main")
+    print(setproctitle.getthreadtitle())
+finally:
+    done.set()
+"""
+    )
+    assert rv.splitlines() == ["first", "3", "['w0', 'w1', 'w2']", "main"]
+
+
+@pytest.mark.skip_on_qemu
+def test_set_missing_thread_title():
+    rv = run_script(
+        """
+import os
+import threading
+import setproctitle
+
+# the parent process is not a thread of ours
+tid = os.getppid()
+
+try:
+    setproctitle.setthreadtitle("gone", native_id=tid)
+except ProcessLookupError:
+    print("error")
+
+print(setproctitle.setthreadtitles(
+    {tid: "gone", threading.get_native_id(): "here"}))
+print(setproctitle.getthreadtitle())
+"""
+    )
+    assert rv.splitlines() == ["error", "1", "here"]
+
+
+def test_set_negative_thread_title():
+    rv = run_script(
+        """
+import setproctitle
+
+setproctitle.setthreadtitle("here")
+for tid in (-1, -2):
+    try:
+        setproctitle.setthreadtitle("negative", native_id=tid)
+    except ValueError:
+        print("ValueError")
+try:
+    setproctitle.setthreadtitles({-1: "negative"})
+except ValueError:
+    print("ValueError")
+print(setproctitle.getthreadtitle())
+"""
+    )
+    assert rv.splitlines() == ["ValueError"] * 3 + ["here"]